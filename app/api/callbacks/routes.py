@@ -0,0 +1,26 @@
+import asyncio
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from app.config import API_AUTH_KEY
+from app.tools.callback_store import callback_store
+
+router = APIRouter()
+
+
+@router.get("/callbacks")
+async def list_callbacks(
+    authorization: str = Header(alias="Authorization"),
+    status: str = None,
+    since: str = None,
+    until: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Call-back requests for the practice team, newest first."""
+    if authorization != f"Bearer {API_AUTH_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    callbacks = await asyncio.to_thread(
+        callback_store.query, status, since, until, limit
+    )
+    return {"callbacks": callbacks}
@@ -0,0 +1,317 @@
+"""Admission control for incoming calls.
+
+Every call admitted beyond what the worker or the upstream quota can carry
+makes the calls already in progress worse. Before a call gets an upstream
+connection it therefore needs a slot from the ``AdmissionController``, which
+only hands one out while
+
+- fewer than ``ADMISSION_MAX_SESSIONS`` calls hold a slot,
+- the smoothed event-loop lag is below ``ADMISSION_MAX_LOOP_LAG``,
+- the remaining tokens and requests last reported by ``rate_limits.updated``
+  in any session are above their minimum, or their reset time has passed.
+
+Otherwise the call waits in a FIFO queue of ``ADMISSION_MAX_QUEUE`` calls,
+and a ``HoldLine`` plays the hold message to the caller. Whenever a call
+ends, new rate limits arrive or the lag is sampled, the first waiting call is
+admitted if the pressure is gone. One at a time, so the load it adds shows in
+the next lag sample before another one follows. Lag while a new worker warms
+up its clients is a one-off and ignored. Calls that find the queue full,
+wait longer than ``ADMISSION_QUEUE_TIMEOUT`` or hang up while waiting are
+rejected with ``CallRejected``.
+"""
+
+import asyncio
+import base64
+import functools
+import time
+import wave
+from collections import deque
+from contextlib import asynccontextmanager
+
+from app.api.media_stream.audio_transcoder import audio_format_from_start, create_transcoder
+from app.api.media_stream.frame_codec import ClientMediaEncoder, decode_client_frame
+from app.config import (
+    ADMISSION_MAX_LOOP_LAG,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_SESSIONS,
+    ADMISSION_MIN_REQUESTS,
+    ADMISSION_MIN_TOKENS,
+    ADMISSION_QUEUE_TIMEOUT,
+    AUDIO_BYTES_PER_SECOND,
+    AUDIO_SAMPLE_RATE,
+    HOLD_MESSAGE_PATH,
+)
+from app.event_log import log
+from app.metrics import registry
+
+# Websocket close code for calls that are turned away
+TRY_AGAIN_LATER = 1013
+
+LAG_SAMPLE_INTERVAL = 0.1
+# Weight of the newest lag sample, single hiccups should not turn calls away
+LAG_SMOOTHING = 0.3
+HOLD_FRAME_MS = 100
+# Longest wait for the start frame of a caller admitted before sending it
+START_TIMEOUT = 5.0
+
+REJECTION_REASONS = ("queue_full", "queue_timeout", "hung_up")
+
+_calls = registry.counter(
+    "tooth_call_admission_total", "Incoming calls by admission outcome.", ("outcome",)
+)
+_admitted = _calls.labels("admitted")
+_queued = _calls.labels("queued")
+_rejected = _calls.labels("rejected")
+_rejections = registry.counter(
+    "tooth_call_admission_rejections_total", "Rejected calls by reason.", ("reason",)
+)
+rejections = {reason: _rejections.labels(reason) for reason in REJECTION_REASONS}
+queue_wait_seconds = registry.histogram(
+    "tooth_call_admission_wait_seconds",
+    "Time queued calls waited until they were admitted.",
+    (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+
+
+class CallRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@functools.cache
+def load_hold_message(path: str) -> tuple[str, ...]:
+    """Hold message as base64 chunks of session audio."""
+    with wave.open(path, "rb") as wav:
+        if (wav.getframerate(), wav.getsampwidth(), wav.getnchannels()) != (AUDIO_SAMPLE_RATE, 2, 1):
+            raise ValueError("Hold message must be pcm16 mono 24 kHz")
+        pcm = wav.readframes(wav.getnframes())
+    frame_bytes = AUDIO_BYTES_PER_SECOND * HOLD_FRAME_MS // 1000
+    return tuple(
+        base64.b64encode(pcm[offset : offset + frame_bytes]).decode("utf-8")
+        for offset in range(0, len(pcm), frame_bytes)
+    )
+
+
+class HoldLine:
+    """The caller's side of a queued call.
+
+    Takes the caller's ``start`` frame, which the session gets later, then
+    plays the hold message in a loop at real-time rate. Caller audio is read
+    and dropped, it was not meant for the assistant. ``run`` returns when the
+    caller hangs up.
+    """
+
+    def __init__(self, websocket, hold_message_path: str = HOLD_MESSAGE_PATH):
+        self.websocket = websocket
+        self.hold_message_path = hold_message_path
+        self.start: dict | None = None
+        self._started = asyncio.Event()
+        self._encoder: ClientMediaEncoder | None = None
+
+    async def run(self):
+        async for message in self.websocket.iter_text():
+            event, _, _, data = decode_client_frame(message)
+            if event == "start":
+                self.start = data["start"]
+                self._started.set()
+                break
+        else:
+            return
+
+        player = asyncio.create_task(self._play())
+        try:
+            async for _ in self.websocket.iter_text():
+                pass
+        finally:
+            player.cancel()
+
+    async def _play(self):
+        if not self.hold_message_path:
+            return
+        try:
+            frames = load_hold_message(self.hold_message_path)
+            transcoder = create_transcoder(audio_format_from_start(self.start))
+        except (OSError, ValueError, wave.Error) as e:
+            log("hold_message.error", level="error", error=repr(e))
+            return
+        self._encoder = ClientMediaEncoder(self.start.get("streamSid"))
+        frame_seconds = HOLD_FRAME_MS / 1000
+        next_frame_at = time.monotonic()
+        while True:
+            for frame in frames:
+                if transcoder is not None:
+                    frame = transcoder.to_client(frame)
+                await self.websocket.send_text(self._encoder.encode(frame))
+                next_frame_at += frame_seconds
+                await asyncio.sleep(max(0.0, next_frame_at - time.monotonic()))
+
+    async def stop(self, task: asyncio.Task):
+        """End holding once the call is admitted, without losing the start frame."""
+        if self.start is None and not task.done():
+            started = asyncio.create_task(self._started.wait())
+            await asyncio.wait({task, started}, timeout=START_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            started.cancel()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if self._encoder is not None:
+            # Drop the rest of the hold message the client has buffered
+            try:
+                await self.websocket.send_text(self._encoder.encode_clear())
+            except Exception as e:
+                log("hold_message.error", level="error", error=repr(e))
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_sessions: int = ADMISSION_MAX_SESSIONS,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        max_loop_lag: float = ADMISSION_MAX_LOOP_LAG,
+        min_tokens: int = ADMISSION_MIN_TOKENS,
+        min_requests: int = ADMISSION_MIN_REQUESTS,
+    ):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_loop_lag = max_loop_lag
+        self.minimum_remaining = {"tokens": min_tokens, "requests": min_requests}
+        # Calls holding a slot
+        self.active = 0
+        self.loop_lag = 0.0
+        # Rate limit name to (remaining, monotonic time of its reset)
+        self._rate_limits: dict[str, tuple[int, float]] = {}
+        self._waiters: deque[asyncio.Future] = deque()
+        self._task: asyncio.Task | None = None
+        self._ignore_lag_until: asyncio.Future | None = None
+
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    def start(self, ignore_lag_until: asyncio.Future = None):
+        """Start sampling the loop lag. Lag while ``ignore_lag_until`` is not
+        done, like the warm-up of a new worker, does not hold back calls."""
+        self._ignore_lag_until = ignore_lag_until
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_loop_lag())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def update_rate_limits(self, rate_limits: list[dict]):
+        """Take the limits of a ``rate_limits.updated`` event of any session."""
+        now = time.monotonic()
+        for limit in rate_limits:
+            self._rate_limits[limit["name"]] = (
+                limit["remaining"],
+                now + float(limit.get("reset_seconds", 0.0)),
+            )
+        self._admit_waiting()
+
+    def pressure(self) -> str | None:
+        """Why a new call cannot start right now, None if it can."""
+        if self.max_sessions and self.active >= self.max_sessions:
+            return "sessions"
+        if self.max_loop_lag and self.loop_lag > self.max_loop_lag:
+            return "loop_lag"
+        now = time.monotonic()
+        for name, minimum in self.minimum_remaining.items():
+            remaining, reset_at = self._rate_limits.get(name, (None, 0.0))
+            if minimum and remaining is not None and remaining < minimum and now < reset_at:
+                return f"rate_limit_{name}"
+        return None
+
+    def _admit_waiting(self):
+        while self._waiters and self.pressure() is None:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+                return
+
+    async def _sample_loop_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            lag = max(0.0, time.monotonic() - started - LAG_SAMPLE_INTERVAL)
+            warming_up = self._ignore_lag_until is not None and not self._ignore_lag_until.done()
+            if not warming_up:
+                self.loop_lag += LAG_SMOOTHING * (lag - self.loop_lag)
+            # Also notices rate limits that have reset in the meantime
+            self._admit_waiting()
+
+    def _reject(self, reason: str, pressure: str = None):
+        _rejected.inc()
+        rejections[reason].inc()
+        log("call.rejected", reason=reason, pressure=pressure, active=self.active)
+        raise CallRejected(reason)
+
+    async def _wait(self, pressure: str, hold: HoldLine = None) -> asyncio.Task | None:
+        """Wait in the queue, returns the task holding the line, if any."""
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full", pressure)
+        _queued.inc()
+        log("call.queued", pressure=pressure, position=len(self._waiters) + 1)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        holding = asyncio.create_task(hold.run()) if hold is not None else None
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait(
+                {waiter} if holding is None else {waiter, holding},
+                timeout=self.queue_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except BaseException:
+            if waiter.done():
+                self.active -= 1
+                self._admit_waiting()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                if holding is not None:
+                    holding.cancel()
+
+        if waiter.cancelled():
+            self._reject("hung_up" if holding is not None and holding.done() else "queue_timeout", pressure)
+        queue_wait_seconds.time_since(queued_at)
+        return holding
+
+    @asynccontextmanager
+    async def slot(self, hold: HoldLine = None):
+        """Hold a slot for one call, waiting in the queue if necessary.
+
+        Raises ``CallRejected`` if the call does not get one.
+        """
+        holding = None
+        pressure = self.pressure()
+        if pressure is None and not self._waiters:
+            self.active += 1
+        else:
+            holding = await self._wait(pressure or "queue", hold)
+        _admitted.inc()
+        try:
+            if holding is not None:
+                await hold.stop(holding)
+            yield
+        finally:
+            self.active -= 1
+            self._admit_waiting()
+
+
+admission_controller = AdmissionController()
+registry.gauge(
+    "tooth_call_admission_queue_depth",
+    "Calls waiting for admission.",
+    admission_controller.queue_length,
+)
+registry.gauge(
+    "tooth_call_event_loop_lag_seconds",
+    "Smoothed lag of the event loop, as used for admission.",
+    lambda: admission_controller.loop_lag,
+)
@@ -0,0 +1,226 @@
+"""Per-session buffer stage between the media stream sockets.
+
+Inbound, small caller frames are coalesced into one
+``input_audio_buffer.append`` per ``INBOUND_AUDIO_WINDOW_MS`` of audio, which
+cuts upstream message count and syscalls. Outbound, audio deltas are paced to
+the client at real-time rate, at most ``OUTBOUND_AUDIO_LEAD_MS`` ahead of
+playback, so that on barge-in the caller does not keep hearing seconds of
+audio that were already pushed. ``speech_started`` flushes the inbound side
+and drops everything not yet sent to the client.
+"""
+
+import asyncio
+import base64
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from app.config import (
+    AUDIO_BYTES_PER_SECOND,
+    INBOUND_AUDIO_WINDOW_MS,
+    OUTBOUND_AUDIO_LEAD_MS,
+)
+from app.event_log import log
+from app.metrics import inbound_forwarding_seconds, outbound_forwarding_seconds
+
+
+def base64_audio_seconds(
+    payload: str, bytes_per_second: int = AUDIO_BYTES_PER_SECOND
+) -> float:
+    """Duration of a base64 encoded audio payload, without decoding it."""
+    padding = payload[-2:].count("=")
+    return (len(payload) * 3 // 4 - padding) / bytes_per_second
+
+
+def join_base64_audio(chunks: list[str]) -> str:
+    # Base64 strings concatenate cleanly as long as no chunk is padded
+    if all(not chunk.endswith("=") for chunk in chunks[:-1]):
+        return "".join(chunks)
+    return base64.b64encode(
+        b"".join(base64.b64decode(chunk) for chunk in chunks)
+    ).decode("utf-8")
+
+
+class InboundAudioCoalescer:
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        window_ms: int = INBOUND_AUDIO_WINDOW_MS,
+        bytes_per_second: int = AUDIO_BYTES_PER_SECOND,
+    ):
+        self.send = send
+        self.window = window_ms / 1000
+        self.bytes_per_second = bytes_per_second
+        self._pending: list[str] = []
+        self._pending_seconds = 0.0
+        self._pending_since = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        # Flush started by the timer, kept so it is not collected or left behind
+        self._flush_task: asyncio.Task | None = None
+        self.frames_in = 0
+        self.frames_out = 0
+
+    async def add(self, payload: str, received_at: float):
+        """Queue a caller frame, ``received_at`` is its ``time.monotonic()``."""
+        self.frames_in += 1
+        if self.window <= 0:
+            self.frames_out += 1
+            await self.send(payload)
+            inbound_forwarding_seconds.time_since(received_at)
+            return
+
+        if not self._pending:
+            self._pending_since = received_at
+        self._pending.append(payload)
+        self._pending_seconds += base64_audio_seconds(payload, self.bytes_per_second)
+        if self._pending_seconds >= self.window:
+            await self.flush()
+        elif self._timer is None:
+            # Do not hold audio back longer than one window if the caller pauses
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._start_flush
+            )
+
+    def _start_flush(self):
+        self._timer = None
+        self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            log("audio.inbound.error", level="error", error=repr(e))
+        finally:
+            if self._flush_task is asyncio.current_task():
+                self._flush_task = None
+
+    def clear(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = []
+        self._pending_seconds = 0.0
+
+    async def close(self):
+        self.clear()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        payload = (
+            self._pending[0]
+            if len(self._pending) == 1
+            else join_base64_audio(self._pending)
+        )
+        self._pending = []
+        self._pending_seconds = 0.0
+        self.frames_out += 1
+        await self.send(payload)
+        inbound_forwarding_seconds.time_since(self._pending_since)
+
+
+class OutboundAudioPacer:
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        lead_ms: int = OUTBOUND_AUDIO_LEAD_MS,
+    ):
+        self.send = send
+        self.lead = lead_ms / 1000
+        self._frames: deque[tuple[str, float, float]] = deque()
+        self._ready = asyncio.Event()
+        self._playout_end = 0.0
+        self._task: asyncio.Task | None = None
+        self.frames_dropped = 0
+
+    async def push(self, frame: str, seconds: float, received_at: float):
+        """Queue a client frame holding ``seconds`` of audio.
+
+        ``received_at`` is the ``time.monotonic()`` the audio arrived at.
+        """
+        if self.lead <= 0:
+            await self.send(frame)
+            outbound_forwarding_seconds.time_since(received_at)
+            return
+        self._frames.append((frame, seconds, received_at))
+        self._ready.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def clear(self) -> int:
+        """Drop all frames not yet sent, returns how many were dropped."""
+        dropped = len(self._frames)
+        self._frames.clear()
+        self._ready.clear()
+        self._playout_end = 0.0
+        self.frames_dropped += dropped
+        return dropped
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._frames:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                now = time.monotonic()
+                if self._playout_end < now:
+                    self._playout_end = now
+                ahead = self._playout_end - now
+                if ahead > self.lead:
+                    await asyncio.sleep(ahead - self.lead)
+                    continue
+
+                frame, seconds, received_at = self._frames.popleft()
+                self._playout_end += seconds
+                await self.send(frame)
+                outbound_forwarding_seconds.time_since(received_at)
+        except Exception as e:
+            log("audio.outbound.error", level="error", error=repr(e))
+        finally:
+            # Cleared also after an error, the next push starts a new one
+            if self._task is asyncio.current_task():
+                self._task = None
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+class MediaBuffer:
+    """Both buffer directions of one session."""
+
+    def __init__(
+        self,
+        send_upstream_audio: Callable[[str], Awaitable[None]],
+        send_client: Callable[[str], Awaitable[None]],
+        inbound_window_ms: int = INBOUND_AUDIO_WINDOW_MS,
+        outbound_lead_ms: int = OUTBOUND_AUDIO_LEAD_MS,
+        outbound: OutboundAudioPacer = None,
+    ):
+        self.send_client = send_client
+        self.inbound = InboundAudioCoalescer(send_upstream_audio, inbound_window_ms)
+        # A pacer already playing the greeting is continued
+        self.outbound = outbound or OutboundAudioPacer(send_client, outbound_lead_ms)
+
+    async def on_speech_started(self, clear_frame: str = None):
+        """Caller barged in: push their audio now, stop playing ours."""
+        await self.inbound.flush()
+        self.outbound.clear()
+        if clear_frame:
+            await self.send_client(clear_frame)
+
+    async def close(self):
+        # The call is over, whatever is still buffered has nowhere to go
+        await self.inbound.close()
+        await self.outbound.close()
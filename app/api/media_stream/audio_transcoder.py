@@ -0,0 +1,256 @@
+"""Streaming transcoder between the caller's audio format and the session's.
+
+The Realtime session runs on pcm16 at 24 kHz. Telephony trunks send G.711
+μ-law or A-law at 8 kHz instead, announced in the ``mediaFormat`` of the
+``start`` event. For those streams every frame is converted on the way in and
+out: G.711 through lookup tables, the sample rate by a polyphase FIR
+resampler that carries its filter history from one frame to the next, so
+frame boundaries leave no clicks.
+
+All work is vectorized over the frame. Working buffers live with the stream
+and are reused, per frame only the output array is allocated.
+"""
+
+import base64
+from dataclasses import dataclass
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.config import AUDIO_SAMPLE_RATE, RESAMPLER_TAPS_PER_PHASE
+
+# Kaiser window shape of the resampling filter, ~80 dB stopband
+KAISER_BETA = 8.0
+
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def _build_ulaw_tables() -> tuple[np.ndarray, np.ndarray]:
+    # G.711 μ-law as in the reference implementation, on 14 bit samples
+    codes = np.arange(256)
+    inverted = ~codes & 0xFF
+    magnitude = (((inverted & 0x0F) << 3) + 0x84) << ((inverted & 0x70) >> 4)
+    decode = np.where(inverted & 0x80, 0x84 - magnitude, magnitude - 0x84)
+
+    samples = np.arange(-8192, 8192)
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + 0x21
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)
+    code = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    encode = np.where(segment >= 8, 0x7F, code) ^ mask
+    return decode.astype(np.int16), encode.astype(np.uint8)
+
+
+def _build_alaw_tables() -> tuple[np.ndarray, np.ndarray]:
+    # G.711 A-law as in the reference implementation, on 13 bit samples
+    codes = np.arange(256) ^ 0x55
+    segment = (codes & 0x70) >> 4
+    magnitude = ((codes & 0x0F) << 4) + np.where(segment == 0, 8, 0x108)
+    magnitude = magnitude << np.maximum(segment - 1, 0)
+    decode = np.where(codes & 0x80, magnitude, -magnitude)
+
+    samples = np.arange(-4096, 4096)
+    mask = np.where(samples >= 0, 0xD5, 0x55)
+    magnitude = np.where(samples >= 0, samples, -samples - 1)
+    segment = np.searchsorted(_ALAW_SEGMENT_ENDS, magnitude)
+    shift = np.where(segment < 2, 1, segment)
+    code = (np.minimum(segment, 7) << 4) | ((magnitude >> shift) & 0x0F)
+    encode = np.where(segment >= 8, 0x7F, code) ^ mask
+    return decode.astype(np.int16), encode.astype(np.uint8)
+
+
+ULAW_DECODE, ULAW_ENCODE = _build_ulaw_tables()
+ALAW_DECODE, ALAW_ENCODE = _build_alaw_tables()
+
+# Encode tables are indexed by the top bits of the offset pcm16 sample
+_G711 = {
+    "mulaw": (ULAW_DECODE, ULAW_ENCODE, 2, 8192),
+    "alaw": (ALAW_DECODE, ALAW_ENCODE, 3, 4096),
+}
+
+# Twilio and similar providers name the encoding as a MIME type
+ENCODINGS = {
+    "audio/x-mulaw": "mulaw",
+    "audio/pcmu": "mulaw",
+    "g711_ulaw": "mulaw",
+    "audio/x-alaw": "alaw",
+    "audio/pcma": "alaw",
+    "g711_alaw": "alaw",
+    "audio/l16": "pcm16",
+    "pcm16": "pcm16",
+}
+
+
+def g711_decode(codes: np.ndarray, encoding: str, out: np.ndarray = None) -> np.ndarray:
+    """Decode uint8 μ-law or A-law codes to int16 samples."""
+    return np.take(_G711[encoding][0], codes, out=out)
+
+
+def g711_encode(samples: np.ndarray, encoding: str, out: np.ndarray = None) -> np.ndarray:
+    """Encode int16 samples to uint8 μ-law or A-law codes."""
+    _, table, shift, offset = _G711[encoding]
+    indices = np.right_shift(samples, shift)
+    indices += offset
+    return np.take(table, indices, out=out)
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    encoding: str = "pcm16"
+    sample_rate: int = AUDIO_SAMPLE_RATE
+
+
+SESSION_AUDIO_FORMAT = AudioFormat()
+
+
+def audio_format_from_start(start: dict) -> AudioFormat:
+    """Caller audio format from the ``start`` event, pcm16 24 kHz if not given."""
+    media_format = start.get("mediaFormat") or {}
+    encoding = media_format.get("encoding", "pcm16")
+    if encoding.lower() not in ENCODINGS:
+        raise ValueError(f"Unsupported audio encoding: {encoding}")
+    if int(media_format.get("channels", 1)) != 1:
+        raise ValueError("Only mono audio is supported")
+    return AudioFormat(
+        ENCODINGS[encoding.lower()],
+        int(media_format.get("sampleRate", AUDIO_SAMPLE_RATE)),
+    )
+
+
+class PolyphaseResampler:
+    """Stateful rational resampler for a stream of int16 chunks.
+
+    The input is conceptually upsampled by ``up``, low-pass filtered and
+    downsampled by ``down``. Only the filter phases that produce an output
+    sample are evaluated, each phase as one strided matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        from_rate: int,
+        to_rate: int,
+        taps_per_phase: int = RESAMPLER_TAPS_PER_PHASE,
+    ):
+        divisor = gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+        # Decimation needs a proportionally longer filter for the same cutoff
+        self.taps = taps_per_phase * max(self.up, self.down) // self.up
+
+        length = self.up * self.taps
+        cutoff = 1 / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        kernel = cutoff * np.sinc(cutoff * n) * np.kaiser(length, KAISER_BETA)
+        kernel *= self.up / kernel.sum()
+        # phases[p, j] weights x[n - j] for output phase p, reversed so a
+        # window of past samples in time order can be dotted directly
+        self._phases = np.ascontiguousarray(
+            kernel.reshape(self.taps, self.up).T[:, ::-1], dtype=np.float32
+        )
+        # Position of the next output on the upsampled time axis, relative to
+        # the first sample of the next chunk
+        self._position = 0
+        # Filter history followed by room for the next chunk
+        self._buffer = np.zeros(self.taps, dtype=np.float32)
+        self._windows = sliding_window_view(self._buffer, self.taps)
+        self._output = np.zeros(0, dtype=np.float32)
+
+    def _reserve(self, samples: int, outputs: int):
+        history = self.taps - 1
+        if len(self._buffer) < history + samples:
+            buffer = np.zeros(history + samples, dtype=np.float32)
+            buffer[:history] = self._buffer[:history]
+            self._buffer = buffer
+            # Building the view is far slower than a frame's filtering
+            self._windows = sliding_window_view(buffer, self.taps)
+        if len(self._output) < outputs:
+            # Multiple of up so pure upsampling can fill it as a matrix
+            self._output = np.zeros(-(-outputs // self.up) * self.up, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample the next chunk of int16 samples."""
+        count = len(samples)
+        up, down, history = self.up, self.down, self.taps - 1
+        total = max(0, -(-(count * up - self._position) // down))
+        self._reserve(count, total)
+
+        buffer = self._buffer
+        buffer[history : history + count] = samples
+        windows = self._windows
+        output = self._output[:total]
+        if down == 1:
+            # Every input sample yields one output per phase, in phase order
+            np.matmul(windows[:count], self._phases.T, out=output.reshape(count, up))
+        else:
+            for phase_index in range(min(up, total)):
+                position = self._position + phase_index * down
+                start, phase = divmod(position, up)
+                outputs = output[phase_index::up]
+                np.matmul(
+                    windows[start::down][: len(outputs)],
+                    self._phases[phase],
+                    out=outputs,
+                )
+
+        self._position += total * down - count * up
+        buffer[:history] = buffer[count : count + history]
+        np.minimum(output, 32767, out=output)
+        np.maximum(output, -32768, out=output)
+        return output.astype(np.int16)
+
+
+class AudioTranscoder:
+    """Convert base64 audio payloads of one stream in both directions."""
+
+    def __init__(
+        self,
+        client_format: AudioFormat,
+        session_format: AudioFormat = SESSION_AUDIO_FORMAT,
+    ):
+        self.client_format = client_format
+        self.session_format = session_format
+        if client_format.sample_rate == session_format.sample_rate:
+            self._inbound = self._outbound = None
+        else:
+            self._inbound = PolyphaseResampler(
+                client_format.sample_rate, session_format.sample_rate
+            )
+            self._outbound = PolyphaseResampler(
+                session_format.sample_rate, client_format.sample_rate
+            )
+
+    def _decode(self, payload: str, audio_format: AudioFormat) -> np.ndarray:
+        data = base64.b64decode(payload)
+        if audio_format.encoding == "pcm16":
+            return np.frombuffer(data, dtype="<i2")
+        return g711_decode(np.frombuffer(data, dtype=np.uint8), audio_format.encoding)
+
+    def _encode(self, samples: np.ndarray, audio_format: AudioFormat) -> str:
+        if audio_format.encoding == "pcm16":
+            samples = samples.astype("<i2", copy=False)
+        else:
+            samples = g711_encode(samples, audio_format.encoding)
+        return base64.b64encode(samples).decode("utf-8")
+
+    def to_session(self, payload: str) -> str:
+        """Caller audio to the session format."""
+        samples = self._decode(payload, self.client_format)
+        if self._inbound is not None:
+            samples = self._inbound.process(samples)
+        return self._encode(samples, self.session_format)
+
+    def to_client(self, payload: str) -> str:
+        """Session audio to the caller's format."""
+        samples = self._decode(payload, self.session_format)
+        if self._outbound is not None:
+            samples = self._outbound.process(samples)
+        return self._encode(samples, self.client_format)
+
+
+def create_transcoder(client_format: AudioFormat) -> AudioTranscoder | None:
+    """Transcoder for a stream, None if its audio needs no conversion."""
+    if client_format == SESSION_AUDIO_FORMAT:
+        return None
+    return AudioTranscoder(client_format)
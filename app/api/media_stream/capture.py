@@ -0,0 +1,224 @@
+"""Capture of the websocket traffic of calls, for replay.
+
+With ``CAPTURE`` enabled, the two websockets of every admitted call are
+wrapped so that each message received or sent is put on a bounded queue,
+stamped with the seconds since the call started. Like recordings, a writer
+thread does the rest and messages that do not fit into the queue are dropped
+and counted. Each call becomes ``<CAPTURE_DIR>/<time>_<stream_sid>.jsonl.gz``:
+
+- a header object with the start frame taken while the call was queued, the
+  number of greeting frames played from the cache and the audio buffering
+  settings the call ran with,
+- one ``[seconds, direction, message]`` array per message, direction being
+  one of ``DIRECTIONS``,
+- a trailer object with the number of dropped messages.
+
+``python -m test_client.replay`` feeds the received messages back through
+the pipeline and compares what it sends with the sent ones.
+"""
+
+import gzip
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from app.api.media_stream.recorder import unique_name
+from app.background_writer import BackgroundWriter
+from app.config import (
+    CAPTURE,
+    CAPTURE_DIR,
+    CAPTURE_QUEUE_SIZE,
+    INBOUND_AUDIO_WINDOW_MS,
+    OUTBOUND_AUDIO_LEAD_MS,
+    SILENCE_SUPPRESSION,
+)
+from app.metrics import registry
+
+FORMAT_VERSION = 1
+CLIENT_IN = "client_in"
+CLIENT_OUT = "client_out"
+UPSTREAM_IN = "upstream_in"
+UPSTREAM_OUT = "upstream_out"
+DIRECTIONS = (CLIENT_IN, CLIENT_OUT, UPSTREAM_IN, UPSTREAM_OUT)
+_OPEN = "open"
+_MESSAGE = "message"
+_END = "end"
+
+_dropped = registry.counter(
+    "tooth_call_capture_dropped_total",
+    "Captured messages dropped because writing fell behind.",
+)
+
+
+class SessionCapture:
+    """Capturing side of one call, called from the event loop."""
+
+    __slots__ = ("writer", "name", "clock", "started", "dropped")
+
+    def __init__(self, writer: "CaptureWriter", name: str, clock=time.monotonic):
+        self.writer = writer
+        self.name = name
+        self.clock = clock
+        self.started = clock()
+        self.dropped = 0
+
+    def add(self, direction: str, message: str | bytes):
+        if not self.writer.put((_MESSAGE, self.name, (self.clock() - self.started, direction, message))):
+            self.dropped += 1
+            _dropped.inc()
+
+    def client(self, websocket) -> "CapturedClient":
+        return CapturedClient(websocket, self)
+
+    def upstream(self, openai_ws) -> "CapturedUpstream":
+        return CapturedUpstream(openai_ws, self)
+
+    def close(self):
+        self.writer.put((_END, self.name, {"dropped": self.dropped}), control=True)
+
+
+class CapturedClient:
+    """Client websocket that captures the text frames in both directions."""
+
+    def __init__(self, websocket, capture: SessionCapture):
+        self._websocket = websocket
+        self._capture = capture
+
+    def __getattr__(self, name):
+        return getattr(self._websocket, name)
+
+    async def iter_text(self):
+        async for message in self._websocket.iter_text():
+            self._capture.add(CLIENT_IN, message)
+            yield message
+
+    async def send_text(self, data: str):
+        self._capture.add(CLIENT_OUT, data)
+        await self._websocket.send_text(data)
+
+
+class CapturedUpstream:
+    """Realtime API websocket that captures the messages in both directions."""
+
+    def __init__(self, openai_ws, capture: SessionCapture):
+        self._openai_ws = openai_ws
+        self._capture = capture
+
+    def __getattr__(self, name):
+        return getattr(self._openai_ws, name)
+
+    async def __aiter__(self):
+        async for message in self._openai_ws:
+            self._capture.add(UPSTREAM_IN, message)
+            yield message
+
+    async def send(self, message, text: bool = None):
+        self._capture.add(UPSTREAM_OUT, message)
+        await self._openai_ws.send(message, text=text)
+
+
+class CaptureWriter(BackgroundWriter):
+    thread_name = "traffic-capture"
+    error_event = "capture.write.error"
+
+    def __init__(self, directory: str = CAPTURE_DIR, queue_size: int = CAPTURE_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.directory = directory
+        self._files: dict[str, gzip.GzipFile] = {}
+        self._numbers = itertools.count(1)
+        self.paths: list[str] = []
+
+    def open(self, stream_sid: str = None, start: dict = None, greeting=None, clock=time.monotonic) -> SessionCapture:
+        """Start capturing a call.
+
+        ``start`` is the start frame if it was taken before the session, it
+        does not pass the captured websocket then.
+        """
+        if self._thread is None:
+            self.start()
+        # The stream is only known up front if the call was queued
+        name = unique_name(self._numbers, stream_sid or (start or {}).get("streamSid") or "call")
+        header = {
+            "capture": FORMAT_VERSION,
+            "started_at": time.time(),
+            "start": start,
+            "greeting_frames": len(greeting.frames) if greeting is not None else 0,
+            "config": {
+                "INBOUND_AUDIO_WINDOW_MS": INBOUND_AUDIO_WINDOW_MS,
+                "OUTBOUND_AUDIO_LEAD_MS": OUTBOUND_AUDIO_LEAD_MS,
+                "SILENCE_SUPPRESSION": SILENCE_SUPPRESSION,
+            },
+        }
+        self.put((_OPEN, name, header), control=True)
+        return SessionCapture(self, name, clock)
+
+    def _prepare(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _handle(self, item: tuple):
+        kind, name, payload = item
+        if kind == _OPEN:
+            path = os.path.join(self.directory, f"{name}.jsonl.gz")
+            # Level 1: most of the size is base64 audio, which barely compresses
+            self._files[name] = gzip.open(path, "wt", encoding="utf-8", compresslevel=1)
+            self._files[name].write(json.dumps(payload) + "\n")
+            self.paths.append(path)
+            return
+        file = self._files.get(name)
+        if file is None:
+            return
+        if kind == _MESSAGE:
+            seconds, direction, message = payload
+            if isinstance(message, bytes):
+                message = message.decode("utf-8")
+            file.write(json.dumps([round(seconds, 6), direction, message]) + "\n")
+        elif kind == _END:
+            file.write(json.dumps(payload) + "\n")
+            del self._files[name]
+            file.close()
+
+    def _finish(self):
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+
+capture_writer = CaptureWriter()
+registry.gauge(
+    "tooth_call_capture_queue_depth",
+    "Captured messages waiting to be written.",
+    capture_writer.pending,
+)
+
+
+@contextmanager
+def captured(websocket, start: dict = None, greeting=None):
+    """Yield the call's client websocket and a function for its upstream
+    websocket, once connected, both wrapping them for capture if ``CAPTURE``
+    is on. The capture starts before upstream, with the greeting."""
+    if not CAPTURE:
+        yield websocket, lambda openai_ws: openai_ws
+        return
+    capture = capture_writer.open(start=start, greeting=greeting)
+    try:
+        yield capture.client(websocket), capture.upstream
+    finally:
+        capture.close()
+
+
+def load_capture(path: str) -> tuple[dict, list[tuple[float, str, str]], dict]:
+    """Header, messages and trailer of a capture file."""
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        if header.get("capture") != FORMAT_VERSION:
+            raise ValueError(f"{path}: not a capture of version {FORMAT_VERSION}")
+        messages, trailer = [], {}
+        for line in file:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                trailer = record
+            else:
+                messages.append(tuple(record))
+    return header, messages, trailer
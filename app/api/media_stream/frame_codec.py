@@ -0,0 +1,108 @@
+"""Encode and decode the frames of the media stream hot path.
+
+Audio frames make up almost all traffic in both directions, tens per second
+per call. Their base64 payload is passed through untouched: only the fields
+that are routed on are located in the raw text, and outbound envelopes are
+built from string templates instead of dicts and ``json.dumps``. Everything
+that is not an audio frame, or does not look exactly as expected, falls back
+to regular JSON parsing.
+"""
+
+import json
+import re
+
+_CLIENT_MEDIA_EVENT = ('"event":"media"', '"event": "media"')
+_PAYLOAD_KEYS = ('"payload":"', '"payload": "')
+# Twilio sends the timestamp as a string, e.g. "timestamp":"5"
+_TIMESTAMP = re.compile(r'"timestamp"\s*:\s*"?(-?\d+)"?')
+
+_AUDIO_DELTA_TYPES = ('"type":"response.audio.delta"', '"type": "response.audio.delta"')
+_DELTA_KEYS = ('"delta":"', '"delta": "')
+
+# Audio delta events put their type first, no need to scan the whole frame
+_TYPE_SCAN_LIMIT = 64
+
+_AUDIO_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+_AUDIO_APPEND_SUFFIX = '"}'
+
+
+def _string_span(message: str, keys: tuple[str, str]) -> tuple[int, int] | None:
+    """Locate the raw string value of the first of ``keys`` in ``message``."""
+    for key in keys:
+        start = message.find(key)
+        if start != -1:
+            start += len(key)
+            end = message.find('"', start)
+            # Escaped characters need the JSON parser
+            if end == -1 or message.find("\\", start, end) != -1:
+                return None
+            return start, end
+    return None
+
+
+def decode_client_frame(message: str) -> tuple[str, str | None, int | None, dict | None]:
+    """Split a client message into ``(event, audio_payload, timestamp, data)``.
+
+    Media frames are decoded without JSON parsing and ``data`` is None. All
+    other events are parsed and returned as ``data``.
+    """
+    span = _string_span(message, _PAYLOAD_KEYS)
+    if span is not None:
+        start, end = span
+        # Only the short parts around the payload are searched for the rest
+        envelope = message[:start] + message[end:]
+        if _CLIENT_MEDIA_EVENT[0] in envelope or _CLIENT_MEDIA_EVENT[1] in envelope:
+            timestamp = _TIMESTAMP.search(envelope)
+            return (
+                "media",
+                message[start:end],
+                int(timestamp.group(1)) if timestamp else None,
+                None,
+            )
+
+    data = json.loads(message)
+    event = data.get("event")
+    if event == "media":
+        media = data["media"]
+        timestamp = media.get("timestamp")
+        return event, media["payload"], int(timestamp) if timestamp else None, data
+    return event, None, None, data
+
+
+def decode_upstream_event(message: str) -> tuple[str, str | None, dict | None]:
+    """Split a Realtime API event into ``(type, audio_delta, event)``.
+
+    Audio deltas are decoded without JSON parsing and ``event`` is None.
+    """
+    head = message[:_TYPE_SCAN_LIMIT]
+    if _AUDIO_DELTA_TYPES[0] in head or _AUDIO_DELTA_TYPES[1] in head:
+        span = _string_span(message, _DELTA_KEYS)
+        if span is not None:
+            return "response.audio.delta", message[span[0]:span[1]], None
+
+    event = json.loads(message)
+    return event["type"], event.get("delta"), event
+
+
+def encode_audio_append(audio_payload: str) -> str:
+    """Build an ``input_audio_buffer.append`` event for the Realtime API."""
+    return _AUDIO_APPEND_PREFIX + audio_payload + _AUDIO_APPEND_SUFFIX
+
+
+class ClientMediaEncoder:
+    """Build client ``media`` frames for one stream from a fixed template."""
+
+    def __init__(self, stream_sid: str | None = None):
+        self.set_stream_sid(stream_sid)
+
+    def set_stream_sid(self, stream_sid: str | None):
+        stream_sid = json.dumps(stream_sid)
+        self._prefix = '{"event":"media","streamSid":' + stream_sid + ',"media":{"payload":"'
+        self._clear = '{"event":"clear","streamSid":' + stream_sid + "}"
+
+    def encode(self, audio_payload: str) -> str:
+        return self._prefix + audio_payload + '"}}'
+
+    def encode_clear(self) -> str:
+        """Tell the client to drop audio it has buffered but not yet played."""
+        return self._clear
@@ -0,0 +1,344 @@
+"""Intro greeting rendered once and played from disk.
+
+Without the cache every call starts with a ``response.create`` for the
+intro prompt, and the caller waits for the model to generate the same
+greeting again, paying for the audio output each time. With
+``GREETING_CACHE`` the greeting is rendered once per ``intro_key`` of the
+session payload (prompts and voice) over a dedicated upstream connection
+and stored in ``GREETING_CACHE_DIR`` as ``<key>.pcm`` plus ``<key>.json``
+with its transcript.
+
+A call then plays the stored audio as soon as the caller's stream starts,
+while the upstream connection is still being set up (``GreetingPlayer``),
+and instead of the ``response.create`` the greeting goes upstream as an
+assistant message, so the model knows what it said. When a prompt file or the voice changes, the
+key changes: calls fall back to the generated greeting until the new one is
+rendered, and files of other keys are deleted once they are older than a
+rendering lease.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+
+from app.api.media_stream.admission import START_TIMEOUT
+from app.api.media_stream.audio_buffer import OutboundAudioPacer
+from app.api.media_stream.audio_transcoder import audio_format_from_start, create_transcoder
+from app.api.media_stream.frame_codec import ClientMediaEncoder, decode_client_frame
+from app.api.media_stream.session_bootstrap import SessionPayload, session_bootstrap
+from app.api.media_stream.upstream_pool import connect_upstream
+from app.config import (
+    AUDIO_BYTES_PER_SECOND,
+    GREETING_CACHE,
+    GREETING_CACHE_DIR,
+    GREETING_FRAME_MS,
+    GREETING_RENDER_RETRY,
+    GREETING_RENDER_TIMEOUT,
+    PROMPT_RELOAD_INTERVAL,
+    VOICE,
+)
+from app.event_log import log
+from app.metrics import registry
+
+_greetings = registry.counter(
+    "tooth_call_greetings_total",
+    "Calls by where their greeting came from.",
+    ("source",),
+)
+_greetings_cached = _greetings.labels("cache")
+_greetings_generated = _greetings.labels("generated")
+
+# Seconds after which a lease was left by a worker that died rendering
+LEASE_SECONDS = 2 * GREETING_RENDER_TIMEOUT
+# Files of a cache entry and its lease, the only ones cleaned up
+CACHE_SUFFIXES = (".pcm", ".json", ".lock")
+
+
+@dataclass(frozen=True)
+class Greeting:
+    key: str
+    transcript: str
+    # Session audio in base64 chunks of GREETING_FRAME_MS
+    frames: tuple[str, ...]
+    frame_seconds: float
+    # Prebuilt conversation.item.create of the greeting as assistant message
+    item_create: bytes
+
+    @property
+    def seconds(self) -> float:
+        return len(self.frames) * self.frame_seconds
+
+
+def build_greeting(key: str, transcript: str, pcm: bytes, frame_ms: int = GREETING_FRAME_MS) -> Greeting:
+    frame_bytes = AUDIO_BYTES_PER_SECOND * frame_ms // 1000
+    frames = tuple(
+        base64.b64encode(pcm[offset : offset + frame_bytes]).decode("utf-8")
+        for offset in range(0, len(pcm), frame_bytes)
+    )
+    item_create = {
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": transcript}],
+        },
+    }
+    return Greeting(
+        key=key,
+        transcript=transcript,
+        frames=frames,
+        frame_seconds=frame_ms / 1000,
+        item_create=json.dumps(item_create).encode("utf-8"),
+    )
+
+
+async def render_greeting(payload: SessionPayload, url: str = None) -> tuple[str, bytes]:
+    """Let the model speak the intro once, return its transcript and pcm16 audio."""
+    audio = bytearray()
+    transcript = None
+    async with connect_upstream(url) as openai_ws:
+        await openai_ws.send(payload.session_update, text=True)
+        await openai_ws.send(payload.intro_speech, text=True)
+        async with asyncio.timeout(GREETING_RENDER_TIMEOUT):
+            async for message in openai_ws:
+                event = json.loads(message)
+                if event["type"] == "response.audio.delta":
+                    audio += base64.b64decode(event["delta"])
+                elif event["type"] == "response.audio_transcript.done":
+                    transcript = event["transcript"]
+                elif event["type"] == "error":
+                    raise RuntimeError(event.get("error"))
+                elif event["type"] == "response.done":
+                    status = event["response"]["status"]
+                    if status != "completed":
+                        raise RuntimeError(f"greeting response {status}")
+                    break
+    if not audio or not transcript:
+        raise RuntimeError("greeting response without audio or transcript")
+    return transcript, bytes(audio)
+
+
+class GreetingCache:
+    def __init__(self, directory: str = GREETING_CACHE_DIR, enabled: bool = GREETING_CACHE, url: str = None):
+        self.directory = directory
+        self.enabled = enabled
+        self.url = url
+        # Written to the lock file of a lease this cache holds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._greeting: Greeting | None = None
+        self._failed_key = None
+        self._failed_at = 0.0
+
+    def current(self) -> Greeting | None:
+        """The cached greeting for the current prompts, None to generate it."""
+        greeting = self._greeting
+        if greeting is None or greeting.key != session_bootstrap.payload.intro_key:
+            _greetings_generated.inc()
+            return None
+        _greetings_cached.inc()
+        return greeting
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}.{suffix}")
+
+    def _load(self, key: str) -> Greeting | None:
+        try:
+            with open(self._path(key, "json"), encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(self._path(key, "pcm"), "rb") as file:
+                pcm = file.read()
+        except FileNotFoundError:
+            return None
+        return build_greeting(key, meta["transcript"], pcm)
+
+    def _claim(self, key: str) -> bool:
+        """Take the lease on rendering ``key``, so one worker of a host
+        renders it and the others load it from disk once it is stored.
+
+        The lock file holds the owner, so a worker only ever releases its own
+        lease. A lease older than ``LEASE_SECONDS`` was left by a worker that
+        died rendering and is taken over.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key, "lock")
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self._remove_stale(path):
+                return False
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Another worker took the lease first
+                return False
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(self.owner)
+        return True
+
+    def _remove_stale(self, path: str) -> bool:
+        """Remove the lease at ``path`` if it is stale.
+
+        The lease is renamed away before it is removed, a rename succeeds for
+        one worker only. A worker whose check raced with a takeover can have
+        renamed the new, live lease, it puts that one back.
+        """
+        try:
+            if time.time() - os.path.getmtime(path) < LEASE_SECONDS:
+                return False
+            taken = f"{path}.{self.owner}"
+            os.rename(path, taken)
+        except FileNotFoundError:
+            return False
+        try:
+            if time.time() - os.path.getmtime(taken) < LEASE_SECONDS:
+                try:
+                    os.link(taken, path)
+                except FileExistsError:
+                    pass
+                return False
+            return True
+        finally:
+            os.remove(taken)
+
+    def _release(self, key: str):
+        path = self._path(key, "lock")
+        try:
+            with open(path, encoding="utf-8") as file:
+                if file.read() != self.owner:
+                    # Taken over, the lease is no longer ours
+                    return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _store(self, key: str, transcript: str, pcm: bytes):
+        meta = {"transcript": transcript, "voice": VOICE, "rendered_at": time.time()}
+        # Audio first and each file replaced atomically, the JSON marks a
+        # complete entry. Temporary files are per writer, workers sharing
+        # the directory never write to the same one.
+        for suffix, data in (("pcm", pcm), ("json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))):
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False) as file:
+                file.write(data)
+            os.replace(file.name, self._path(key, suffix))
+        # Only entries and leases of other keys, and only once they are older
+        # than a lease: a worker still on the previous prompts may be loading
+        # or rendering them, and temporary files belong to their writer.
+        expired = time.time() - LEASE_SECONDS
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(f"{key}.") or not entry.name.endswith(CACHE_SUFFIXES):
+                continue
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # Another worker cleaned up first
+                pass
+
+    async def refresh(self):
+        """Load or render the greeting for the current prompts if needed."""
+        payload = session_bootstrap.payload
+        key = payload.intro_key
+        if not self.enabled or (self._greeting is not None and self._greeting.key == key):
+            return
+        greeting = await asyncio.to_thread(self._load, key)
+        if greeting is None:
+            if key == self._failed_key and time.monotonic() - self._failed_at < GREETING_RENDER_RETRY:
+                return
+            if not await asyncio.to_thread(self._claim, key):
+                # Another worker renders it, the next refresh loads it
+                return
+            started = time.monotonic()
+            try:
+                transcript, pcm = await render_greeting(payload, self.url)
+                await asyncio.to_thread(self._store, key, transcript, pcm)
+            except Exception as e:
+                self._failed_key, self._failed_at = key, time.monotonic()
+                log("greeting.render.error", level="error", key=key, error=repr(e))
+                return
+            finally:
+                await asyncio.to_thread(self._release, key)
+            greeting = build_greeting(key, transcript, pcm)
+            log(
+                "greeting.rendered",
+                key=key,
+                seconds=round(greeting.seconds, 2),
+                duration=round(time.monotonic() - started, 3),
+            )
+        self._greeting = greeting
+
+    async def watch(self, interval: float = PROMPT_RELOAD_INTERVAL):
+        """Keep the greeting in line with the prompt files."""
+        while True:
+            try:
+                await self.refresh()
+            except OSError as e:
+                log("greeting.load.error", level="error", error=repr(e))
+            await asyncio.sleep(interval)
+
+
+class GreetingPlayer:
+    """Plays the cached greeting while the upstream session is set up.
+
+    Takes the caller's ``start`` frame, unless the hold line already has it,
+    and queues the greeting on an outbound pacer. The session continues with
+    that pacer, so model audio follows the greeting and a barge-in drops
+    the rest of it. Without a greeting nothing is read or played.
+    """
+
+    def __init__(self, websocket, greeting: Greeting | None, start: dict = None):
+        self.websocket = websocket
+        self.greeting = greeting
+        self.start = start
+        self.pacer = OutboundAudioPacer(websocket.send_text)
+        # Set once the greeting is queued, the session then only records it
+        self.played = False
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._play())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        # Calls whose session never started still hold the pacer
+        await self.pacer.close()
+
+    async def _play(self):
+        if self.greeting is None:
+            return
+        if self.start is None:
+            async for message in self.websocket.iter_text():
+                event, _, _, data = decode_client_frame(message)
+                if event == "start":
+                    self.start = data["start"]
+                    break
+            else:
+                return
+        self.played = True
+        transcoder = create_transcoder(audio_format_from_start(self.start))
+        encoder = ClientMediaEncoder(self.start.get("streamSid"))
+        queued_at = time.monotonic()
+        for frame in self.greeting.frames:
+            if transcoder is not None:
+                frame = transcoder.to_client(frame)
+            await self.pacer.push(encoder.encode(frame), self.greeting.frame_seconds, queued_at)
+
+    async def stream_start(self) -> dict | None:
+        """The caller's start frame, once upstream is ready.
+
+        Waits up to ``START_TIMEOUT`` for it. A caller who has not sent it by
+        then is left to the session, which reads it and plays the greeting.
+        """
+        await asyncio.wait({self._task}, timeout=START_TIMEOUT)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return self.start
+
+
+greeting_cache = GreetingCache()
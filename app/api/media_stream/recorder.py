@@ -0,0 +1,277 @@
+"""Optional recording of calls for quality review.
+
+With ``RECORDING`` enabled every session gets a ``RecorderTap``. It hands
+the caller's audio (in the session format, before silence suppression), the
+assistant's audio, transcripts and tool calls to a bounded queue and returns.
+The base64 payloads are immutable strings, so nothing is copied or decoded
+on the event loop. If the queue is full the item is dropped and counted: the
+recording gets a gap, the call does not get slower.
+
+A single worker thread writes per session:
+
+- ``<name>.inbound.wav`` and ``<name>.outbound.wav``, pcm16 mono. Audio is
+  collected in a preallocated buffer and written in large sequential
+  chunks. The header is rewritten every ``RECORDING_FINALIZE_SECONDS`` of
+  audio, so after a crash the file is valid up to that point.
+- ``<name>.jsonl`` with one record per event, including the position in
+  both audio files at that moment.
+
+Outbound audio arrives faster than real time and without pauses, so the
+two WAV files do not share a time axis. The positions in the JSONL align
+them with the conversation.
+"""
+
+import binascii
+import itertools
+import json
+import os
+import re
+import struct
+import time
+
+from app.background_writer import BackgroundWriter
+from app.config import (
+    AUDIO_SAMPLE_RATE,
+    RECORDING_DIR,
+    RECORDING_FINALIZE_SECONDS,
+    RECORDING_QUEUE_SIZE,
+    RECORDING_WRITE_BUFFER,
+)
+from app.event_log import log
+from app.metrics import registry
+
+INBOUND = "inbound"
+OUTBOUND = "outbound"
+EVENT = "event"
+_OPEN = "open"
+_END = "end"
+
+_dropped = registry.counter(
+    "tooth_call_recorder_dropped_total",
+    "Recorder items dropped because writing fell behind.",
+    ("kind",),
+)
+_dropped_audio = _dropped.labels("audio")
+_dropped_events = _dropped.labels("event")
+
+
+def unique_name(numbers: itertools.count, stream_sid: str) -> str:
+    """File name of a call, unique for calls of the same second and stream
+    sid, also across the workers of a host."""
+    safe_sid = re.sub(r"[^A-Za-z0-9_-]", "_", stream_sid)
+    return f"{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{next(numbers)}_{safe_sid}"
+
+
+def wav_header(data_bytes: int, sample_rate: int) -> bytes:
+    """44-byte header of a pcm16 mono WAV file."""
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_bytes,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        1,  # mono
+        sample_rate,
+        sample_rate * 2,
+        2,
+        16,
+        b"data",
+        data_bytes,
+    )
+
+
+class WavWriter:
+    """pcm16 mono WAV file, written in large chunks and finalized as it grows."""
+
+    def __init__(self, path: str, sample_rate: int, buffer_size: int, finalize_bytes: int):
+        self.sample_rate = sample_rate
+        self.finalize_bytes = finalize_bytes
+        self._file = open(path, "wb", buffering=0)
+        self._file.write(wav_header(0, sample_rate))
+        self._buffer = memoryview(bytearray(buffer_size))
+        self._filled = 0
+        # Audio bytes on disk, and as of the last header update
+        self.written = 0
+        self._finalized = 0
+
+    @property
+    def seconds(self) -> float:
+        """Length of the recording so far, including what is buffered."""
+        return (self.written + self._filled) / (self.sample_rate * 2)
+
+    def write(self, data: bytes):
+        size = len(data)
+        if self._filled + size > len(self._buffer):
+            self.flush()
+        if size > len(self._buffer):
+            self._file.write(data)
+            self.written += size
+            return
+        self._buffer[self._filled : self._filled + size] = data
+        self._filled += size
+
+    def flush(self):
+        if self._filled:
+            self._file.write(self._buffer[: self._filled])
+            self.written += self._filled
+            self._filled = 0
+        if self.written - self._finalized >= self.finalize_bytes:
+            self.finalize()
+
+    def finalize(self):
+        """Rewrite the header, the file is a valid WAV up to the data on disk."""
+        self._file.seek(0)
+        self._file.write(wav_header(self.written, self.sample_rate))
+        self._file.seek(0, os.SEEK_END)
+        self._finalized = self.written
+
+    def close(self):
+        self.flush()
+        self.finalize()
+        self._file.close()
+
+
+class _Recording:
+    """Files of one session, only touched by the worker thread."""
+
+    def __init__(self, recorder: "CallRecorder", name: str):
+        base = os.path.join(recorder.directory, name)
+        finalize_bytes = int(recorder.finalize_seconds * recorder.sample_rate * 2)
+        self.audio = {
+            direction: WavWriter(
+                f"{base}.{direction}.wav",
+                recorder.sample_rate,
+                recorder.buffer_size,
+                finalize_bytes,
+            )
+            for direction in (INBOUND, OUTBOUND)
+        }
+        self.events = open(
+            f"{base}.jsonl", "w", encoding="utf-8", buffering=recorder.buffer_size
+        )
+
+    def event(self, timestamp: float, event_type: str, fields: dict):
+        record = {
+            "ts": round(timestamp, 3),
+            "event": event_type,
+            "inbound_seconds": round(self.audio[INBOUND].seconds, 3),
+            "outbound_seconds": round(self.audio[OUTBOUND].seconds, 3),
+        }
+        record.update(fields)
+        self.events.write(json.dumps(record, ensure_ascii=False, default=repr) + "\n")
+
+    def flush(self):
+        for writer in self.audio.values():
+            writer.flush()
+        self.events.flush()
+
+    def close(self):
+        for writer in self.audio.values():
+            writer.close()
+        self.events.close()
+
+
+class RecorderTap:
+    """Recording side of one session, called from the event loop."""
+
+    __slots__ = ("recorder", "name", "dropped_audio", "dropped_events")
+
+    def __init__(self, recorder: "CallRecorder", name: str):
+        self.recorder = recorder
+        self.name = name
+        self.dropped_audio = 0
+        self.dropped_events = 0
+
+    def inbound(self, audio_payload: str):
+        if not self.recorder.put((INBOUND, self.name, audio_payload)):
+            self.dropped_audio += 1
+            _dropped_audio.inc()
+
+    def outbound(self, audio_payload: str):
+        if not self.recorder.put((OUTBOUND, self.name, audio_payload)):
+            self.dropped_audio += 1
+            _dropped_audio.inc()
+
+    def event(self, event_type: str, **fields):
+        if not self.recorder.put((EVENT, self.name, (time.time(), event_type, fields))):
+            self.dropped_events += 1
+            _dropped_events.inc()
+
+    def close(self):
+        summary = {
+            "dropped_audio": self.dropped_audio,
+            "dropped_events": self.dropped_events,
+        }
+        self.recorder.put((_END, self.name, summary), control=True)
+
+
+class CallRecorder(BackgroundWriter):
+    thread_name = "call-recorder"
+    error_event = "recorder.write.error"
+    # Buffered data is written out after this much idle time
+    idle_seconds = 1.0
+
+    def __init__(
+        self,
+        directory: str = RECORDING_DIR,
+        queue_size: int = RECORDING_QUEUE_SIZE,
+        buffer_size: int = RECORDING_WRITE_BUFFER,
+        finalize_seconds: float = RECORDING_FINALIZE_SECONDS,
+        sample_rate: int = AUDIO_SAMPLE_RATE,
+    ):
+        super().__init__(queue_size)
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.finalize_seconds = finalize_seconds
+        self.sample_rate = sample_rate
+        self._recordings: dict[str, _Recording] = {}
+        self._numbers = itertools.count(1)
+
+    def open(self, stream_sid: str) -> RecorderTap:
+        """Start recording a session."""
+        if self._thread is None:
+            self.start()
+        name = unique_name(self._numbers, stream_sid or "unknown")
+        # A control item, opening and closing a recording is never dropped
+        self.put((_OPEN, name, None), control=True)
+        return RecorderTap(self, name)
+
+    def _prepare(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _handle(self, item: tuple):
+        kind, name, payload = item
+        if kind == _OPEN:
+            self._recordings[name] = _Recording(self, name)
+            return
+        recording = self._recordings.get(name)
+        if recording is None:
+            return
+        if kind == EVENT:
+            recording.event(*payload)
+        elif kind == _END:
+            recording.event(time.time(), "recording.closed", payload)
+            del self._recordings[name]
+            recording.close()
+        else:
+            recording.audio[kind].write(binascii.a2b_base64(payload))
+
+    def _idle(self):
+        for recording in self._recordings.values():
+            recording.flush()
+
+    def _finish(self):
+        """Finalize all recordings."""
+        for recording in self._recordings.values():
+            recording.close()
+        self._recordings.clear()
+
+
+call_recorder = CallRecorder()
+registry.gauge(
+    "tooth_call_recorder_queue_depth",
+    "Recorder items waiting to be written.",
+    call_recorder.pending,
+)
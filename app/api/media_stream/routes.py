@@ -1,14 +1,20 @@
-import asyncio
+import time
 
-import websockets
 from fastapi import APIRouter, Header, HTTPException, WebSocket
+from starlette.websockets import WebSocketState
 
-from app.api.media_stream.services import (
-    initialize_session,
-    receive_from_client,
-    send_to_client,
+from app.api.media_stream.admission import (
+    TRY_AGAIN_LATER,
+    CallRejected,
+    HoldLine,
+    admission_controller,
 )
-from app.config import API_AUTH_KEY, OPENAI_API_KEY
+from app.api.media_stream.capture import captured
+from app.api.media_stream.greeting_cache import GreetingPlayer, greeting_cache
+from app.api.media_stream.session import MediaStreamSession
+from app.api.media_stream.upstream_pool import upstream_pool
+from app.config import API_AUTH_KEY
+from app.event_log import log
 
 router = APIRouter()
 
@@ -22,23 +28,31 @@ async def handle_media_stream(
         await websocket.close(code=1008)  # Policy Violation
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    print("Client connected")
+    log("client.connected")
     await websocket.accept()
 
-    async with websockets.connect(
-        "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01",
-        additional_headers={
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "OpenAI-Beta": "realtime=v1",
-        },
-    ) as openai_ws:
-        await initialize_session(openai_ws)
-        stream_sid = None
-        latest_media_timestamp = 0
-
-        await asyncio.gather(
-            receive_from_client(
-                stream_sid, latest_media_timestamp, websocket, openai_ws
-            ),
-            send_to_client(stream_sid, websocket, openai_ws),
-        )
+    hold = HoldLine(websocket)
+    try:
+        async with admission_controller.slot(hold):
+            admitted_at = time.monotonic()
+            greeting = greeting_cache.current()
+            with captured(websocket, hold.start, greeting) as (client_ws, capture_upstream):
+                # The caller hears the greeting while upstream connects
+                async with GreetingPlayer(client_ws, greeting, hold.start) as player:
+                    async with upstream_pool.session(admitted_at, greeting) as openai_ws:
+                        start = await player.stream_start()
+                        await MediaStreamSession(
+                            client_ws,
+                            capture_upstream(openai_ws),
+                            admitted_at,
+                            greeting,
+                            start,
+                            outbound=player.pacer,
+                            greeting_queued=player.played,
+                        ).run()
+    except CallRejected as e:
+        if (
+            websocket.application_state == WebSocketState.CONNECTED
+            and websocket.client_state == WebSocketState.CONNECTED
+        ):
+            await websocket.close(code=TRY_AGAIN_LATER, reason=e.reason)
@@ -1,131 +1,211 @@
-import base64
+import asyncio
 import json
+import time
 
 from fastapi.websockets import WebSocketDisconnect
 
-from app.config import LOG_EVENT_TYPES, VOICE
-from app.prompts.prompt_file_paths import INTRO_SPEECH, SYSTEM
-from app.tools.cal_tool import CalTool
-from app.tools.notify_staff_tool import NotifyStaffTool
-
-
-async def initialize_session(openai_ws):
-    with open(SYSTEM) as file:
-        system_prompt = file.read()
-    with open(INTRO_SPEECH) as file:
-        intro_speech_prompt = file.read()
-
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "turn_detection": {"type": "server_vad"},
-            "input_audio_format": "pcm16",
-            "output_audio_format": "pcm16",
-            "voice": VOICE,
-            "instructions": system_prompt,
-            "modalities": ["text", "audio"],
-            "temperature": 0.8,
-            "tools": [
-                CalTool.get_create_booking_description(),
-                CalTool.get_cancel_booking_description(),
-                NotifyStaffTool.get_create_call_back_description()
-            ],
-        },
-    }
-    intro_speech = {
-        "type": "response.create",
-        "response": {
-            "instructions": intro_speech_prompt,
-        },
-    }
-
-    print("Sending session update:", json.dumps(session_update))
-    await openai_ws.send(json.dumps(session_update))
-    await openai_ws.send(json.dumps(intro_speech))
-
-
-async def receive_from_client(stream_sid, latest_media_timestamp, websocket, openai_ws):
+from app.api.media_stream.admission import admission_controller
+from app.api.media_stream.audio_buffer import MediaBuffer, base64_audio_seconds
+from app.api.media_stream.audio_transcoder import audio_format_from_start
+from app.api.media_stream.frame_codec import (
+    decode_client_frame,
+    decode_upstream_event,
+    encode_audio_append,
+)
+from app.api.media_stream.session_bootstrap import session_bootstrap
+from app.config import LOG_EVENT_TYPES
+from app.event_log import log
+from app.metrics import (
+    inbound_frames,
+    outbound_frames,
+    response_latency_seconds,
+    session_setup_seconds,
+)
+from app.tools.registry import ToolResult, tool_registry
+
+# Transcripts of both sides, kept in recordings
+RECORDED_EVENT_TYPES = {
+    "conversation.item.input_audio_transcription.completed",
+    "response.audio_transcript.done",
+}
+
+
+async def initialize_session(openai_ws, greeting=None):
+    payload = session_bootstrap.payload
+    log("session.update.sent", version=payload.version)
+    await openai_ws.send(payload.session_update, text=True)
+    await send_intro_speech(openai_ws, greeting)
+
+
+async def send_intro_speech(openai_ws, greeting=None):
+    """Start the greeting on an upstream session that is already configured.
+
+    A cached ``greeting`` is played to the caller locally, upstream only
+    learns that it was said.
+    """
+    if greeting is not None:
+        await openai_ws.send(greeting.item_create, text=True)
+    else:
+        await openai_ws.send(session_bootstrap.payload.intro_speech, text=True)
+
+
+def create_media_buffer(websocket, openai_ws, outbound=None) -> MediaBuffer:
+    async def send_upstream_audio(audio_payload: str):
+        await openai_ws.send(encode_audio_append(audio_payload))
+
+    return MediaBuffer(send_upstream_audio, websocket.send_text, outbound=outbound)
+
+
+async def start_stream(session, start: dict):
+    audio_format = audio_format_from_start(start)
+    session.set_stream_sid(start["streamSid"])
+    session.set_audio_format(audio_format)
+    await session.play_greeting()
+    log(
+        "stream.started",
+        stream_sid=session.stream_sid,
+        encoding=audio_format.encoding,
+        sample_rate=audio_format.sample_rate,
+    )
+    session.latest_media_timestamp = 0
+
+
+async def receive_from_client(session):
     """Receive audio data from client and send it to the OpenAI Realtime API."""
+    media_buffer = session.media_buffer
     try:
-        async for message in websocket.iter_text():
-            data = json.loads(message)
-            if data["event"] == "media":
-                latest_media_timestamp = int(data["media"]["timestamp"])
-                audio_append = {
-                    "type": "input_audio_buffer.append",
-                    "audio": data["media"]["payload"],
-                }
-                await openai_ws.send(json.dumps(audio_append))
-            elif data["event"] == "start":
-                stream_sid = data["start"]["streamSid"]
-                print(f"Incoming stream has started {stream_sid}")
-                latest_media_timestamp = 0
+        # Calls that waited for admission sent their start frame meanwhile
+        if session.pending_start is not None:
+            start, session.pending_start = session.pending_start, None
+            await start_stream(session, start)
+        async for message in session.websocket.iter_text():
+            received_at = session.last_client_activity = time.monotonic()
+            event, audio_payload, timestamp, data = decode_client_frame(message)
+            if event == "media":
+                inbound_frames.inc()
+                if timestamp is not None:
+                    session.latest_media_timestamp = timestamp
+                if session.transcoder is not None:
+                    audio_payload = session.transcoder.to_session(audio_payload)
+                if session.recording is not None:
+                    session.recording.inbound(audio_payload)
+                if session.silence_filter is not None:
+                    audio_payload = session.silence_filter.filter(audio_payload)
+                    if audio_payload is None:
+                        continue
+                await media_buffer.inbound.add(audio_payload, received_at)
+            elif event == "start":
+                await start_stream(session, data["start"])
 
     except WebSocketDisconnect:
-        print("Client disconnected.")
-        if openai_ws.open:
-            await openai_ws.close()
+        log("client.disconnected", stream_sid=session.stream_sid)
 
 
-async def send_to_client(stream_sid, websocket, openai_ws):
+async def send_to_client(session):
+    media_encoder = session.media_encoder
+    media_buffer = session.media_buffer
+    openai_ws = session.openai_ws
     try:
         async for open_message in openai_ws:
-            response = json.loads(open_message)
-            if response["type"] in LOG_EVENT_TYPES:
-                response_type = response["type"]
-                print(f"Received event: {response_type}", response)
-            if response["type"] == "session.updated":
-                print("Session updated succesfully:", response)
-
-            if response.get("type") == "response.done":
-                for item in response["response"]["output"]:
-                    if (
-                        item["type"] == "function_call"
-                        and item["status"] == "completed"
-                    ):
-                        try:
-                            await handle_function_call(openai_ws, item)
-                        except Exception as e:
-                            print(f"Error processing function call: {e}")
-
-            if response.get("type") == "response.audio.delta" and "delta" in response:
-                try:
-                    audio_payload = base64.b64encode(
-                        base64.b64decode(response["delta"])
-                    ).decode("utf-8")
-                    audio_delta = {
-                        "event": "media",
-                        "streamSid": stream_sid,
-                        "media": {"payload": audio_payload},
-                    }
-                    await websocket.send_json(audio_delta)
-
-                except Exception as e:
-                    print(f"Error processing audio data: {e}")
+            received_at = time.monotonic()
+            event_type, audio_delta, response = decode_upstream_event(open_message)
+
+            # Audio deltas are forwarded as they are, without decoding
+            if event_type == "response.audio.delta":
+                if audio_delta:
+                    outbound_frames.inc()
+                    if session.speech_stopped_at is not None:
+                        response_latency_seconds.observe(
+                            received_at - session.speech_stopped_at
+                        )
+                        session.speech_stopped_at = None
+                    try:
+                        seconds = base64_audio_seconds(audio_delta)
+                        if session.recording is not None:
+                            session.recording.outbound(audio_delta)
+                        if session.transcoder is not None:
+                            audio_delta = session.transcoder.to_client(audio_delta)
+                        await media_buffer.outbound.push(
+                            media_encoder.encode(audio_delta), seconds, received_at
+                        )
+                    except Exception as e:
+                        log(
+                            "audio.error",
+                            level="error",
+                            stream_sid=session.stream_sid,
+                            error=repr(e),
+                        )
+                continue
+
+            if event_type in LOG_EVENT_TYPES or event_type == "session.updated":
+                log(event_type, stream_sid=session.stream_sid, payload=response)
+            if event_type == "session.updated":
+                if session.connected_at is not None:
+                    session_setup_seconds.observe(received_at - session.connected_at)
+                    session.connected_at = None
+
+            if session.recording is not None and event_type in RECORDED_EVENT_TYPES:
+                session.recording.event(
+                    event_type,
+                    item_id=response.get("item_id"),
+                    transcript=response.get("transcript"),
+                )
+
+            if event_type == "rate_limits.updated":
+                admission_controller.update_rate_limits(response["rate_limits"])
+
+            if event_type == "input_audio_buffer.speech_stopped":
+                session.speech_stopped_at = received_at
+
+            if event_type == "input_audio_buffer.speech_started":
+                await media_buffer.on_speech_started(media_encoder.encode_clear())
+
+            if event_type == "response.done":
+                function_calls = [
+                    item
+                    for item in response["response"]["output"]
+                    if item["type"] == "function_call" and item["status"] == "completed"
+                ]
+                if function_calls:
+                    results = await handle_function_calls(
+                        openai_ws, function_calls, session.stream_sid
+                    )
+                    if session.recording is not None:
+                        for item, result in zip(function_calls, results):
+                            session.recording.event(
+                                "function_call",
+                                name=item["name"],
+                                arguments=item["arguments"],
+                                output=result.output,
+                            )
 
     except Exception as e:
-        print(f"Error sending audio to client: {e}")
-
+        log(
+            "upstream.error",
+            level="error",
+            stream_sid=session.stream_sid,
+            error=repr(e),
+        )
 
-async def handle_function_call(openai_ws, function_call_item: dict):
-    function_call_name = function_call_item["name"]
-    function_call_arguments = json.loads(function_call_item["arguments"])
-    function_call_result = None
 
-    if function_call_name == "create_booking":
-        function_call_result = CalTool.create_booking(
-            function_call_arguments.get("start"),
-            function_call_arguments.get("attendee_name"),
-            function_call_arguments.get("additional_notes"),
-        )
-    if function_call_name == "cancel_booking":
-        function_call_result = CalTool.cancel_booking(
-            function_call_arguments.get("uid"),
-            function_call_arguments.get("start"),
-            function_call_arguments.get("attendee_name"),
+async def handle_function_calls(
+    openai_ws, function_calls: list[dict], stream_sid: str = None
+) -> list[ToolResult]:
+    """Run the function calls of one response concurrently.
+
+    Results go upstream in the order of the calls, followed by one response
+    with the follow-up instructions of all tools involved.
+    """
+    results = await asyncio.gather(
+        *(
+            tool_registry.call(
+                item["name"], item["arguments"], item["call_id"], stream_sid
+            )
+            for item in function_calls
         )
+    )
 
-    if function_call_result:
+    for function_call_item, result in zip(function_calls, results):
         function_call_response = {
             "type": "conversation.item.create",
             "previous_item_id": function_call_item["id"],
@@ -133,16 +213,17 @@ async def handle_function_call(openai_ws, function_call_item: dict):
                 "id": function_call_item["id"] + "_fcr",
                 "type": "function_call_output",
                 "call_id": function_call_item["call_id"],
-                "output": function_call_result,
+                "output": result.output,
             },
         }
         await openai_ws.send(json.dumps(function_call_response))
 
-        user_feedback = {
-            "type": "response.create",
-            "response": {
-                "instructions": "Teile dem Nutzer das Ergebnis der Terminbuchung mit.",
-            },
-        }
+    user_feedback = {
+        "type": "response.create",
+        "response": {
+            "instructions": " ".join(dict.fromkeys(result.follow_up for result in results)),
+        },
+    }
 
-        await openai_ws.send(json.dumps(user_feedback))
+    await openai_ws.send(json.dumps(user_feedback))
+    return results
@@ -0,0 +1,212 @@
+"""Lifecycle of one media stream call.
+
+A ``MediaStreamSession`` owns the two pump tasks (client to upstream and
+upstream to client) and a watchdog inside one task group. Whichever of them
+ends first, by returning, failing or timing out, ends the whole session: the
+remaining tasks are cancelled and both websockets and the media buffer are
+closed before ``run`` returns. Nothing of a dropped call outlives it.
+"""
+
+import asyncio
+import time
+
+import websockets
+from starlette.websockets import WebSocketState
+
+from app.api.media_stream.audio_transcoder import AudioFormat, create_transcoder
+from app.api.media_stream.frame_codec import ClientMediaEncoder
+from app.api.media_stream.recorder import call_recorder
+from app.api.media_stream.silence_filter import SilenceSuppressor
+from app.api.media_stream.services import (
+    create_media_buffer,
+    receive_from_client,
+    send_to_client,
+)
+from app.config import (
+    RECORDING,
+    SESSION_CLOSE_TIMEOUT,
+    SESSION_HEARTBEAT_INTERVAL,
+    SESSION_HEARTBEAT_TIMEOUT,
+    SESSION_IDLE_TIMEOUT,
+    SILENCE_SUPPRESSION,
+)
+from app.event_log import log
+from app.metrics import registry
+
+live_sessions: set["MediaStreamSession"] = set()
+
+
+def active_session_count() -> int:
+    return len(live_sessions)
+
+
+registry.gauge(
+    "tooth_call_active_sessions", "Media stream sessions in progress.", active_session_count
+)
+
+
+class MediaStreamSession:
+    def __init__(
+        self,
+        websocket,
+        openai_ws,
+        connected_at: float = None,
+        greeting=None,
+        start: dict = None,
+        outbound=None,
+        greeting_queued: bool = False,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        heartbeat_interval: float = SESSION_HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = SESSION_HEARTBEAT_TIMEOUT,
+    ):
+        self.websocket = websocket
+        self.openai_ws = openai_ws
+        self.idle_timeout = idle_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.stream_sid = None
+        self.latest_media_timestamp = 0
+        self.media_encoder = ClientMediaEncoder()
+        # None while the caller sends audio in the session's own format
+        self.transcoder = None
+        self.silence_filter = SilenceSuppressor() if SILENCE_SUPPRESSION else None
+        # Set once the stream is known, if recording is enabled
+        self.recording = None
+        # Cached greeting, played once the stream starts. If it was queued on
+        # ``outbound`` while upstream was set up, it is only recorded.
+        self.greeting = greeting
+        self.greeting_queued = greeting_queued
+        # Start frame already taken from the client while the call was queued
+        # or the greeting played
+        self.pending_start = start
+        self.media_buffer = create_media_buffer(websocket, openai_ws, outbound)
+        self.last_client_activity = time.monotonic()
+        # Accept time of the caller until session.updated is seen
+        self.connected_at = connected_at
+        self.speech_stopped_at = None
+        self.close_reason = None
+        self.failed = False
+        self._tasks: list[asyncio.Task] = []
+
+    def set_stream_sid(self, stream_sid: str):
+        self.stream_sid = stream_sid
+        self.media_encoder.set_stream_sid(stream_sid)
+        if RECORDING:
+            if self.recording is not None:
+                self.recording.close()
+            self.recording = call_recorder.open(stream_sid)
+
+    def set_audio_format(self, audio_format: AudioFormat):
+        self.transcoder = create_transcoder(audio_format)
+
+    async def play_greeting(self):
+        """Queue the cached greeting for the caller, paced like model audio."""
+        greeting, self.greeting = self.greeting, None
+        if greeting is None:
+            return
+        if self.recording is not None:
+            self.recording.event("greeting", transcript=greeting.transcript)
+        queued_at = time.monotonic()
+        for frame in greeting.frames:
+            if self.recording is not None:
+                self.recording.outbound(frame)
+            if self.greeting_queued:
+                continue
+            if self.transcoder is not None:
+                frame = self.transcoder.to_client(frame)
+            await self.media_buffer.outbound.push(
+                self.media_encoder.encode(frame), greeting.frame_seconds, queued_at
+            )
+        log("greeting.played", stream_sid=self.stream_sid, key=greeting.key)
+
+    async def run(self):
+        live_sessions.add(self)
+        try:
+            async with asyncio.TaskGroup() as group:
+                self._tasks = [
+                    group.create_task(self._pump("client", receive_from_client)),
+                    group.create_task(self._pump("upstream", send_to_client)),
+                    group.create_task(self._watchdog()),
+                ]
+        except* Exception as errors:
+            self.failed = True
+            for error in errors.exceptions:
+                log(
+                    "session.failed",
+                    level="error",
+                    stream_sid=self.stream_sid,
+                    error=repr(error),
+                )
+        finally:
+            live_sessions.discard(self)
+            await self._close()
+
+    def stop(self, reason: str):
+        """End the session, cancelling all of its tasks."""
+        if self.close_reason is None:
+            self.close_reason = reason
+        current = asyncio.current_task()
+        for task in self._tasks:
+            if task is not current:
+                task.cancel()
+
+    async def _pump(self, name: str, pump):
+        try:
+            await pump(self)
+        except Exception:
+            self.close_reason = self.close_reason or f"{name} failed"
+            raise
+        self.stop(f"{name} ended")
+
+    async def _heartbeat(self) -> bool:
+        ping = getattr(self.openai_ws, "ping", None)
+        if ping is None:
+            return True
+        try:
+            pong_waiter = await ping()
+            await asyncio.wait_for(pong_waiter, self.heartbeat_timeout)
+            return True
+        except (asyncio.TimeoutError, websockets.ConnectionClosed):
+            return False
+
+    async def _watchdog(self):
+        interval = min(self.idle_timeout, self.heartbeat_interval)
+        last_heartbeat = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            if now - self.last_client_activity > self.idle_timeout:
+                self.stop("client idle")
+                return
+            if now - last_heartbeat >= self.heartbeat_interval:
+                if not await self._heartbeat():
+                    self.stop("upstream heartbeat timeout")
+                    return
+                last_heartbeat = time.monotonic()
+
+    async def _close(self):
+        await self.media_buffer.close()
+        if self.recording is not None:
+            self.recording.close()
+        try:
+            async with asyncio.timeout(SESSION_CLOSE_TIMEOUT):
+                await self.openai_ws.close()
+        except Exception as e:
+            log("upstream.close.error", level="error", error=repr(e))
+
+        if (
+            self.websocket.application_state == WebSocketState.CONNECTED
+            and self.websocket.client_state == WebSocketState.CONNECTED
+        ):
+            try:
+                async with asyncio.timeout(SESSION_CLOSE_TIMEOUT):
+                    await self.websocket.close(code=1011 if self.failed else 1000)
+            except Exception as e:
+                log("client.close.error", level="error", error=repr(e))
+        log(
+            "session.closed",
+            stream_sid=self.stream_sid,
+            reason=self.close_reason,
+            failed=self.failed,
+        )
@@ -0,0 +1,115 @@
+"""Prebuilt frames to initialize a Realtime API session.
+
+The ``session.update`` and intro ``response.create`` frames only change when a
+prompt file or the configuration changes, so they are serialized once and
+sent as ready-made UTF-8 bytes. A background task watches the prompt files
+by mtime and swaps in a rebuilt payload when one of them is edited.
+
+``intro_key`` identifies what the greeting sounds like, the prompts and the
+voice. Unlike ``version`` it is stable across restarts, so a greeting
+rendered to disk can be matched to the payload.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+from app.config import PROMPT_RELOAD_INTERVAL, RECORDING, VOICE
+from app.event_log import log
+from app.prompts.prompt_file_paths import BASE_PATH, INTRO_SPEECH, SYSTEM
+from app.tools.registry import tool_registry
+
+
+@dataclass(frozen=True)
+class SessionPayload:
+    session_update: bytes
+    intro_speech: bytes
+    version: int
+    intro_key: str
+
+
+class SessionBootstrap:
+    def __init__(self, prompt_dir: str = BASE_PATH):
+        self.prompt_dir = prompt_dir
+        self._signature = None
+        self._payload: SessionPayload | None = None
+        self._version = 0
+
+    @property
+    def payload(self) -> SessionPayload:
+        if self._payload is None:
+            self.reload_if_changed()
+        return self._payload
+
+    def _prompt_signature(self) -> tuple:
+        signature = []
+        for entry in sorted(os.scandir(self.prompt_dir), key=lambda e: e.name):
+            if entry.is_file():
+                stat = entry.stat()
+                signature.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _build(self) -> SessionPayload:
+        with open(SYSTEM) as file:
+            system_prompt = file.read()
+        with open(INTRO_SPEECH) as file:
+            intro_speech_prompt = file.read()
+
+        session_update = {
+            "type": "session.update",
+            "session": {
+                "turn_detection": {"type": "server_vad"},
+                "input_audio_format": "pcm16",
+                "output_audio_format": "pcm16",
+                "voice": VOICE,
+                "instructions": system_prompt,
+                "modalities": ["text", "audio"],
+                "temperature": 0.8,
+                "tools": tool_registry.descriptions(),
+            },
+        }
+        if RECORDING:
+            # Recordings keep a transcript of the caller too
+            session_update["session"]["input_audio_transcription"] = {"model": "whisper-1"}
+        intro_speech = {
+            "type": "response.create",
+            "response": {
+                "instructions": intro_speech_prompt,
+            },
+        }
+        intro_key = hashlib.sha256(
+            json.dumps([VOICE, system_prompt, intro_speech_prompt]).encode("utf-8")
+        ).hexdigest()[:16]
+        self._version += 1
+        return SessionPayload(
+            session_update=json.dumps(session_update).encode("utf-8"),
+            intro_speech=json.dumps(intro_speech).encode("utf-8"),
+            version=self._version,
+            intro_key=intro_key,
+        )
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild the payload if a prompt file changed since the last build."""
+        signature = self._prompt_signature()
+        if signature == self._signature and self._payload is not None:
+            return False
+        payload = self._build()
+        # Single reference assignment, so sessions see either payload entirely
+        self._payload = payload
+        self._signature = signature
+        return True
+
+    async def watch(self, interval: float = PROMPT_RELOAD_INTERVAL):
+        """Poll the prompt files and hot-reload the payload on change."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(self.reload_if_changed):
+                    log("prompt.reloaded", version=self._version)
+            except OSError as e:
+                log("prompt.reload.error", level="error", error=repr(e))
+
+
+session_bootstrap = SessionBootstrap()
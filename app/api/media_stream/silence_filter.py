@@ -0,0 +1,156 @@
+"""Optional local silence suppression of caller audio.
+
+Callers are silent for long stretches, e.g. while looking up a date, and
+every one of those frames costs upstream bandwidth, audio minutes and
+``server_vad`` work. With ``SILENCE_SUPPRESSION`` enabled, each inbound frame
+is classified from its energy and zero-crossing rate: voiced speech is loud,
+unvoiced consonants like "s" or "f" are quieter but cross zero often.
+The energy threshold follows the line's noise floor.
+
+Only speech is forwarded, plus:
+
+- a hangover after speech, long enough for ``server_vad`` to see the pause
+  and end the turn,
+- a pre-roll of the audio just before speech, sent along with the onset so
+  the first syllable is not clipped,
+- a keep-alive frame every ``SILENCE_KEEPALIVE_MS`` of suppressed audio.
+
+Durations are measured in audio time, not wall time.
+"""
+
+import base64
+from collections import deque
+
+import numpy as np
+
+from app.api.media_stream.audio_buffer import join_base64_audio
+from app.config import (
+    AUDIO_SAMPLE_RATE,
+    SILENCE_HANGOVER_MS,
+    SILENCE_KEEPALIVE_MS,
+    SILENCE_NOISE_MARGIN_DB,
+    SILENCE_PRE_ROLL_MS,
+    SILENCE_THRESHOLD_DBFS,
+    SILENCE_ZCR_THRESHOLD,
+)
+from app.metrics import registry
+
+# Unvoiced speech may be this much quieter than the threshold
+UNVOICED_RELIEF_DB = 8.0
+# Weight of a frame in the running noise floor estimate. Frames taken as
+# speech pull it up slowly, so a line with loud steady hiss is learned too.
+NOISE_FLOOR_ADAPTATION = 0.05
+NOISE_FLOOR_RISE = 0.001
+# Floor of the energy estimate, digital silence would be -inf
+MIN_DBFS = -100.0
+
+_frames = registry.counter(
+    "tooth_call_silence_filter_frames_total",
+    "Inbound audio frames by silence filter decision.",
+    ("decision",),
+)
+_forwarded = _frames.labels("forwarded")
+_suppressed = _frames.labels("suppressed")
+_keepalive = _frames.labels("keepalive")
+
+
+def frame_features(samples: np.ndarray) -> tuple[float, float]:
+    """Energy in dBFS and zero-crossing rate of a pcm16 frame."""
+    if len(samples) < 2:
+        return MIN_DBFS, 0.0
+    values = samples.astype(np.float32)
+    mean_square = float(np.dot(values, values)) / len(values)
+    energy = 10 * np.log10(mean_square / 32768.0**2) if mean_square else MIN_DBFS
+    signs = np.signbit(samples)
+    crossings = np.count_nonzero(signs[1:] != signs[:-1])
+    return max(energy, MIN_DBFS), crossings / (len(samples) - 1)
+
+
+class SilenceSuppressor:
+    """Decide per pcm16 frame of one stream whether it goes upstream."""
+
+    def __init__(
+        self,
+        sample_rate: int = AUDIO_SAMPLE_RATE,
+        threshold_dbfs: float = SILENCE_THRESHOLD_DBFS,
+        noise_margin_db: float = SILENCE_NOISE_MARGIN_DB,
+        zcr_threshold: float = SILENCE_ZCR_THRESHOLD,
+        hangover_ms: int = SILENCE_HANGOVER_MS,
+        pre_roll_ms: int = SILENCE_PRE_ROLL_MS,
+        keepalive_ms: int = SILENCE_KEEPALIVE_MS,
+    ):
+        self.sample_rate = sample_rate
+        self.threshold_dbfs = threshold_dbfs
+        self.noise_margin_db = noise_margin_db
+        self.zcr_threshold = zcr_threshold
+        # Durations are counted in samples, so frame sums stay exact
+        self.hangover = hangover_ms * sample_rate // 1000
+        self.pre_roll = pre_roll_ms * sample_rate // 1000
+        self.keepalive = keepalive_ms * sample_rate // 1000
+        self.noise_floor = threshold_dbfs - noise_margin_db
+        # Audio since the last speech frame, starts as silence
+        self._since_speech = self.hangover
+        self._since_forwarded = 0
+        self._pre_roll: deque[tuple[str, int]] = deque()
+        self._pre_roll_samples = 0
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.frames_keepalive = 0
+
+    def is_speech(self, samples: np.ndarray) -> bool:
+        energy, zero_crossing_rate = frame_features(samples)
+        threshold = max(self.threshold_dbfs, self.noise_floor + self.noise_margin_db)
+        if energy >= threshold or (
+            energy >= threshold - UNVOICED_RELIEF_DB
+            and zero_crossing_rate >= self.zcr_threshold
+        ):
+            self.noise_floor += NOISE_FLOOR_RISE * (energy - self.noise_floor)
+            return True
+        self.noise_floor += NOISE_FLOOR_ADAPTATION * (energy - self.noise_floor)
+        return False
+
+    def _forward(self, payload: str) -> str:
+        self._since_forwarded = 0
+        self.frames_forwarded += 1 + len(self._pre_roll)
+        _forwarded.inc(1 + len(self._pre_roll))
+        if not self._pre_roll:
+            return payload
+        # Speech starts: send the audio just before it along with it
+        payloads = [chunk for chunk, _ in self._pre_roll]
+        payloads.append(payload)
+        self._pre_roll.clear()
+        self._pre_roll_samples = 0
+        return join_base64_audio(payloads)
+
+    def filter(self, payload: str) -> str | None:
+        """Payload to send upstream for this frame, or None to hold it back."""
+        samples = np.frombuffer(base64.b64decode(payload), dtype="<i2")
+        count = len(samples)
+
+        if self.is_speech(samples):
+            self._since_speech = 0
+            return self._forward(payload)
+
+        self._since_speech += count
+        if self._since_speech <= self.hangover:
+            return self._forward(payload)
+
+        self._pre_roll.append((payload, count))
+        self._pre_roll_samples += count
+        self._since_forwarded += count
+        if self._since_forwarded >= self.keepalive:
+            # The oldest held frame goes out, so audio stays in order
+            self._since_forwarded = 0
+            self.frames_keepalive += 1
+            _keepalive.inc()
+            payload, count = self._pre_roll.popleft()
+            self._pre_roll_samples -= count
+            return payload
+
+        # Frames count as suppressed once they fall out of the pre-roll,
+        # without one (SILENCE_PRE_ROLL_MS=0) right away
+        while self._pre_roll and self._pre_roll_samples - self._pre_roll[0][1] >= self.pre_roll:
+            self._pre_roll_samples -= self._pre_roll.popleft()[1]
+            self.frames_suppressed += 1
+            _suppressed.inc()
+        return None
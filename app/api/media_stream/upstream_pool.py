@@ -0,0 +1,206 @@
+"""Connections to the OpenAI Realtime API, optionally taken from a warm pool.
+
+Opening the upstream socket costs a TLS handshake, the websocket upgrade and
+the ``session.update`` round trip. With ``UPSTREAM_POOL_SIZE`` > 0 that work
+is done ahead of time: the pool keeps connections open and initialized with
+the current session payload, hands one to each incoming call and refills in
+the background. Connections older than ``UPSTREAM_POOL_MAX_IDLE_AGE``, built
+from an outdated prompt version or failing a ping are dropped.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import websockets
+from websockets.protocol import State
+
+from app.api.media_stream.services import initialize_session, send_intro_speech
+from app.api.media_stream.session_bootstrap import session_bootstrap
+from app.config import (
+    OPENAI_API_KEY,
+    REALTIME_API_URL,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_POOL_HEALTH_INTERVAL,
+    UPSTREAM_POOL_MAX_IDLE_AGE,
+    UPSTREAM_POOL_SIZE,
+)
+from app.event_log import log
+from app.metrics import session_setup_seconds
+
+# Seconds to wait before retrying after the pool failed to connect
+REFILL_BACKOFF = 2.0
+
+
+def connect_upstream(url: str = None):
+    return websockets.connect(
+        url or REALTIME_API_URL,
+        additional_headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "OpenAI-Beta": "realtime=v1",
+        },
+        open_timeout=UPSTREAM_CONNECT_TIMEOUT,
+    )
+
+
+@dataclass
+class WarmConnection:
+    websocket: websockets.ClientConnection
+    created_at: float
+    payload_version: int
+
+
+class UpstreamPool:
+    def __init__(
+        self,
+        size: int = UPSTREAM_POOL_SIZE,
+        max_idle_age: float = UPSTREAM_POOL_MAX_IDLE_AGE,
+        health_check_interval: float = UPSTREAM_POOL_HEALTH_INTERVAL,
+        url: str = None,
+    ):
+        self.size = size
+        self.max_idle_age = max_idle_age
+        self.health_check_interval = health_check_interval
+        self.url = url or REALTIME_API_URL
+        self._idle: list[WarmConnection] = []
+        self._connecting = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # Closes of stale connections dropped by acquire, awaited in close
+        self._closing: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        idle, self._idle = self._idle, []
+        await asyncio.gather(
+            *(conn.websocket.close() for conn in idle),
+            *self._closing,
+            return_exceptions=True,
+        )
+
+    def _is_usable(self, conn: WarmConnection) -> bool:
+        return (
+            conn.websocket.state is State.OPEN
+            and time.monotonic() - conn.created_at < self.max_idle_age
+            and conn.payload_version == session_bootstrap.payload.version
+        )
+
+    def acquire(self) -> websockets.ClientConnection | None:
+        """Take a ready connection, or None if the pool has none to offer."""
+        while self._idle:
+            conn = self._idle.pop()
+            if self._is_usable(conn):
+                self.hits += 1
+                self._wakeup.set()
+                return conn.websocket
+            closing = asyncio.create_task(conn.websocket.close())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+        self.misses += 1
+        self._wakeup.set()
+        return None
+
+    async def _open_warm_connection(self) -> WarmConnection:
+        websocket = await connect_upstream(self.url)
+        try:
+            payload = session_bootstrap.payload
+            await websocket.send(payload.session_update, text=True)
+            async with asyncio.timeout(UPSTREAM_CONNECT_TIMEOUT):
+                async for message in websocket:
+                    event = json.loads(message)
+                    if event["type"] == "session.updated":
+                        break
+                    if event["type"] == "error":
+                        raise RuntimeError(event.get("error"))
+        except BaseException:
+            await websocket.close()
+            raise
+        return WarmConnection(websocket, time.monotonic(), payload.version)
+
+    async def _health_check(self):
+        for conn in list(self._idle):
+            healthy = self._is_usable(conn)
+            if healthy:
+                try:
+                    pong_waiter = await conn.websocket.ping()
+                    await asyncio.wait_for(pong_waiter, UPSTREAM_CONNECT_TIMEOUT)
+                except (asyncio.TimeoutError, websockets.ConnectionClosed):
+                    healthy = False
+            if not healthy and conn in self._idle:
+                self._idle.remove(conn)
+                await conn.websocket.close()
+
+    async def _refill(self):
+        missing = self.size - len(self._idle) - self._connecting
+        if missing <= 0:
+            return
+        self._connecting += missing
+        try:
+            results = await asyncio.gather(
+                *(self._open_warm_connection() for _ in range(missing)),
+                return_exceptions=True,
+            )
+        finally:
+            self._connecting -= missing
+        for result in results:
+            if isinstance(result, WarmConnection):
+                self._idle.append(result)
+            else:
+                log("upstream_pool.error", level="error", error=repr(result))
+        if len(self._idle) < self.size:
+            await asyncio.sleep(REFILL_BACKOFF)
+
+    async def _maintain(self):
+        last_health_check = time.monotonic()
+        while True:
+            self._wakeup.clear()
+            await self._refill()
+            if time.monotonic() - last_health_check >= self.health_check_interval:
+                await self._health_check()
+                last_health_check = time.monotonic()
+                continue
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self.health_check_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def session(self, accepted_at: float = None, greeting=None):
+        """Yield an upstream connection that is initialized for a new call.
+
+        With a cached ``greeting`` it is announced instead of generated.
+        """
+        openai_ws = self.acquire() if self.enabled else None
+        if openai_ws is None:
+            async with connect_upstream(self.url) as openai_ws:
+                await initialize_session(openai_ws, greeting)
+                yield openai_ws
+            return
+
+        try:
+            await send_intro_speech(openai_ws, greeting)
+            # Warm connections got session.updated before the call arrived
+            if accepted_at is not None:
+                session_setup_seconds.time_since(accepted_at)
+            yield openai_ws
+        finally:
+            await openai_ws.close()
+
+
+upstream_pool = UpstreamPool()
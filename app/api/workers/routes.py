@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Header, HTTPException
+
+from app.config import API_AUTH_KEY
+from app.shared_state import shared_state
+
+router = APIRouter()
+
+
+@router.get("/workers")
+async def list_workers(authorization: str = Header(alias="Authorization")):
+    """Workers of the host with their load and calls in progress."""
+    if authorization != f"Bearer {API_AUTH_KEY}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    workers = await shared_state.workers()
+    return {
+        "workers": workers,
+        "calls": sum(len(worker["calls"]) for worker in workers),
+    }
@@ -0,0 +1,131 @@
+"""Writer threads that keep slow I/O off the event loop.
+
+The event log, the call-back store, recordings and traffic captures work the
+same way: the event loop puts items on a queue and returns, a daemon thread
+handles them. Data items are refused once ``queue_size`` items are waiting,
+so a slow disk or sink costs data and never call latency. Control items, like
+opening and closing a recording, are always taken. ``close`` handles what is
+queued and stops the thread, it also runs at exit.
+"""
+
+import atexit
+import queue
+import threading
+
+_STOP = object()
+
+
+class BackgroundWriter:
+    thread_name = "background-writer"
+    # Logged when handling fails, None to only count it
+    error_event: str | None = None
+    # Items handled in one go when that many are waiting
+    batch_size = 1
+    # Seconds without items after which ``_idle`` runs, None for never
+    idle_seconds: float | None = None
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        # Unbounded, the size limit only applies to data items
+        self._queue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self.write_errors = 0
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._thread is None:
+            self._prepare()
+            self._thread = threading.Thread(
+                target=self._run, name=self.thread_name, daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """Handle what is queued and stop the thread.
+
+        False if the thread is still busy after ``timeout`` seconds.
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return True
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def put(self, item, control: bool = False) -> bool:
+        """Queue an item, False if it was refused because the queue is full."""
+        if not control and self._queue.qsize() >= self.queue_size:
+            return False
+        self._queue.put(item)
+        return True
+
+    def _take_queued(self) -> list:
+        """Remove and return the items still queued, a pending stop stays."""
+        items = []
+        stopping = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+            else:
+                items.append(item)
+        if stopping:
+            self._queue.put(_STOP)
+        return items
+
+    def _prepare(self):
+        """Runs in ``start``, before the thread."""
+
+    def _handle(self, item):
+        raise NotImplementedError
+
+    def _handle_batch(self, batch: list):
+        for item in batch:
+            try:
+                self._handle(item)
+            except Exception as e:
+                self._failed(e)
+
+    def _idle(self):
+        """Runs on the thread after ``idle_seconds`` without items."""
+
+    def _finish(self):
+        """Runs on the thread after the last item."""
+
+    def _failed(self, error: Exception):
+        self.write_errors += 1
+        if self.error_event is not None:
+            # Imported here, the event log is a background writer itself
+            from app.event_log import log
+
+            log(self.error_event, level="error", error=repr(error))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.idle_seconds)]
+            except queue.Empty:
+                self._idle()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(item is _STOP for item in batch):
+                batch = [item for item in batch if item is not _STOP]
+                stopping = True
+            if not batch:
+                continue
+            try:
+                self._handle_batch(batch)
+            except Exception as e:
+                self._failed(e)
+        self._finish()
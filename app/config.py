@@ -3,6 +3,11 @@
 
 import os
 
+from dotenv import load_dotenv
+
+# Before anything below reads the environment
+load_dotenv()
+
 VOICE = "alloy"
 
 LOG_EVENT_TYPES = [
@@ -16,5 +21,158 @@ LOG_EVENT_TYPES = [
     "error",
 ]
 
+# Structured event log, written to stdout by a background thread
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Longer strings and lists in logged payloads are cut to this size
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+LOG_MAX_LIST_ITEMS = int(os.getenv("LOG_MAX_LIST_ITEMS", "10"))
+# Share of records kept per event, e.g. "rate_limits.updated=0.1,response.done=0.5".
+# Events not listed are always kept.
+LOG_SAMPLE_RATES = {"rate_limits.updated": 0.1}
+LOG_SAMPLE_RATES.update(
+    (event, float(rate))
+    for event, rate in (
+        item.split("=") for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if item
+    )
+)
+
 API_AUTH_KEY = os.getenv("API_AUTH_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+CAL_API_KEY = os.getenv("CAL_API_KEY")
+
+# When the OpenAI SDK is imported and the shared tool clients are built:
+# "background" after the server is listening, off the event loop, "eager"
+# before it starts listening, "lazy" on first use by a tool call
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+# Shared HTTP client settings for tool calls (cal.com, OpenAI)
+CAL_API_BASE_URL = os.getenv("CAL_API_BASE_URL", "https://api.cal.com")
+TOOL_HTTP_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "8.0"))
+TOOL_HTTP_CONNECT_TIMEOUT = float(os.getenv("TOOL_HTTP_CONNECT_TIMEOUT", "3.0"))
+TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "50"))
+TOOL_HTTP_MAX_KEEPALIVE = int(os.getenv("TOOL_HTTP_MAX_KEEPALIVE", "20"))
+TOOL_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("TOOL_HTTP_KEEPALIVE_EXPIRY", "30.0"))
+# Call-back requests for the practice team, written behind to SQLite
+CALLBACK_DB_PATH = os.getenv("CALLBACK_DB_PATH", "callbacks.db")
+CALLBACK_QUEUE_SIZE = int(os.getenv("CALLBACK_QUEUE_SIZE", "10000"))
+CALLBACK_BATCH_SIZE = int(os.getenv("CALLBACK_BATCH_SIZE", "500"))
+
+# Retries of transient cal.com errors within a latency budget, and a circuit
+# breaker that fails fast after consecutive failures until a probe succeeds
+CAL_RETRY_BUDGET = float(os.getenv("CAL_RETRY_BUDGET", "6.0"))
+CAL_RETRY_BASE_DELAY = float(os.getenv("CAL_RETRY_BASE_DELAY", "0.2"))
+CAL_RETRY_MAX_DELAY = float(os.getenv("CAL_RETRY_MAX_DELAY", "2.0"))
+CAL_BREAKER_FAILURES = int(os.getenv("CAL_BREAKER_FAILURES", "5"))
+CAL_BREAKER_RESET = float(os.getenv("CAL_BREAKER_RESET", "30.0"))
+# Longest a tool call may take before the caller hears a fallback answer.
+# Above TOOL_HTTP_TIMEOUT, since a tool may make more than one request.
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "12.0"))
+
+# Appointments booked through cal.com and the practice's bookable hours.
+# Hours are wall-clock times in PRACTICE_TZ, cal.com's times are UTC.
+PRACTICE_TZ = os.getenv("PRACTICE_TZ", "Europe/Berlin")
+CAL_EVENT_TYPE_ID = int(os.getenv("CAL_EVENT_TYPE_ID", "1479842"))
+APPOINTMENT_MINUTES = int(os.getenv("APPOINTMENT_MINUTES", "30"))
+PRACTICE_OPEN_HOUR = int(os.getenv("PRACTICE_OPEN_HOUR", "8"))
+PRACTICE_CLOSE_HOUR = int(os.getenv("PRACTICE_CLOSE_HOUR", "18"))
+# Monday is 0
+PRACTICE_WEEKDAYS = tuple(
+    int(day) for day in os.getenv("PRACTICE_WEEKDAYS", "0,1,2,3,4").split(",")
+)
+
+# Index of busy intervals for the next days, refreshed from cal.com
+AVAILABILITY_DAYS = int(os.getenv("AVAILABILITY_DAYS", "14"))
+# Bookings per page of a cal.com list request
+CAL_BOOKINGS_PAGE_SIZE = int(os.getenv("CAL_BOOKINGS_PAGE_SIZE", "100"))
+AVAILABILITY_REFRESH_INTERVAL = float(os.getenv("AVAILABILITY_REFRESH_INTERVAL", "60.0"))
+
+# In-process cache of the cal.com bookings of a practice day
+BOOKINGS_CACHE_TTL = float(os.getenv("BOOKINGS_CACHE_TTL", "60.0"))
+BOOKINGS_CACHE_MAX_DAYS = int(os.getenv("BOOKINGS_CACHE_MAX_DAYS", "64"))
+
+# State shared by the workers of one host (uvicorn --workers N) in a local
+# SQLite database: the bookings of the availability index, locks on the slots
+# being booked, the calls in progress and the load of every worker. Empty for
+# a single worker, which keeps all of it in memory.
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+# Seconds between heartbeats, which also pick up the bookings of the siblings
+SHARED_STATE_INTERVAL = float(os.getenv("SHARED_STATE_INTERVAL", "1.0"))
+
+# Seconds between checks of the prompt files for changes
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2.0"))
+
+# The intro greeting is rendered once per prompt version and voice, kept on
+# disk and played to every caller instead of being generated per call
+GREETING_CACHE = os.getenv("GREETING_CACHE", "false").lower() == "true"
+GREETING_CACHE_DIR = os.getenv("GREETING_CACHE_DIR", "greetings")
+GREETING_FRAME_MS = int(os.getenv("GREETING_FRAME_MS", "100"))
+GREETING_RENDER_TIMEOUT = float(os.getenv("GREETING_RENDER_TIMEOUT", "30.0"))
+# Seconds before a failed rendering is tried again
+GREETING_RENDER_RETRY = float(os.getenv("GREETING_RENDER_RETRY", "60.0"))
+
+# Upstream OpenAI Realtime API and optional pool of pre-warmed connections
+REALTIME_API_URL = os.getenv(
+    "REALTIME_API_URL",
+    "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01",
+)
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "0"))
+UPSTREAM_POOL_MAX_IDLE_AGE = float(os.getenv("UPSTREAM_POOL_MAX_IDLE_AGE", "300.0"))
+UPSTREAM_POOL_HEALTH_INTERVAL = float(os.getenv("UPSTREAM_POOL_HEALTH_INTERVAL", "15.0"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10.0"))
+
+# Per-session audio buffering, 0 disables the respective stage
+INBOUND_AUDIO_WINDOW_MS = int(os.getenv("INBOUND_AUDIO_WINDOW_MS", "40"))
+OUTBOUND_AUDIO_LEAD_MS = int(os.getenv("OUTBOUND_AUDIO_LEAD_MS", "160"))
+# pcm16 mono at 24 kHz, as configured for the Realtime session
+AUDIO_SAMPLE_RATE = 24000
+AUDIO_BYTES_PER_SECOND = AUDIO_SAMPLE_RATE * 2
+# Filter length of the resampler for callers with another sample rate
+RESAMPLER_TAPS_PER_PHASE = int(os.getenv("RESAMPLER_TAPS_PER_PHASE", "16"))
+
+# Optional local silence suppression of caller audio before it goes upstream.
+# The hangover must outlast server_vad's silence duration (500 ms by default),
+# the pre-roll matches its prefix padding (300 ms).
+SILENCE_SUPPRESSION = os.getenv("SILENCE_SUPPRESSION", "false").lower() == "true"
+SILENCE_THRESHOLD_DBFS = float(os.getenv("SILENCE_THRESHOLD_DBFS", "-50.0"))
+SILENCE_NOISE_MARGIN_DB = float(os.getenv("SILENCE_NOISE_MARGIN_DB", "10.0"))
+SILENCE_ZCR_THRESHOLD = float(os.getenv("SILENCE_ZCR_THRESHOLD", "0.3"))
+SILENCE_HANGOVER_MS = int(os.getenv("SILENCE_HANGOVER_MS", "800"))
+SILENCE_PRE_ROLL_MS = int(os.getenv("SILENCE_PRE_ROLL_MS", "300"))
+SILENCE_KEEPALIVE_MS = int(os.getenv("SILENCE_KEEPALIVE_MS", "1000"))
+
+# Optional recording of both audio directions, transcripts and tool calls
+# per call, written by a background thread. Frames that do not fit into the
+# queue are dropped, never waited for.
+RECORDING = os.getenv("RECORDING", "false").lower() == "true"
+RECORDING_DIR = os.getenv("RECORDING_DIR", "recordings")
+RECORDING_QUEUE_SIZE = int(os.getenv("RECORDING_QUEUE_SIZE", "5000"))
+RECORDING_WRITE_BUFFER = int(os.getenv("RECORDING_WRITE_BUFFER", str(256 * 1024)))
+# Audio between WAV header updates, a crash loses at most this much
+RECORDING_FINALIZE_SECONDS = float(os.getenv("RECORDING_FINALIZE_SECONDS", "5.0"))
+
+# Optional capture of the websocket traffic of every call, both directions of
+# both sockets with timestamps, for replay with test_client.replay
+CAPTURE = os.getenv("CAPTURE", "false").lower() == "true"
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "captures")
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "20000"))
+
+# Admission of new calls. While all sessions are taken, the event loop lags
+# or the upstream rate limits are nearly used up, a call waits in a queue and
+# hears HOLD_MESSAGE_PATH (pcm16 mono 24 kHz WAV) in a loop. Calls beyond the
+# queue or waiting too long are closed with code 1013. 0 disables a check.
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", "100"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "20"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30.0"))
+# A healthy worker at 50 calls lags about 45 ms (p50) and 120 ms (p99),
+# see the README for the measurement
+ADMISSION_MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG", "0.1"))
+# Remaining upstream quota, as last reported by rate_limits.updated
+ADMISSION_MIN_TOKENS = int(os.getenv("ADMISSION_MIN_TOKENS", "5000"))
+ADMISSION_MIN_REQUESTS = int(os.getenv("ADMISSION_MIN_REQUESTS", "1"))
+HOLD_MESSAGE_PATH = os.getenv("HOLD_MESSAGE_PATH")
+
+# Media stream session lifecycle
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "30.0"))
+SESSION_HEARTBEAT_INTERVAL = float(os.getenv("SESSION_HEARTBEAT_INTERVAL", "10.0"))
+SESSION_HEARTBEAT_TIMEOUT = float(os.getenv("SESSION_HEARTBEAT_TIMEOUT", "5.0"))
+SESSION_CLOSE_TIMEOUT = float(os.getenv("SESSION_CLOSE_TIMEOUT", "2.0"))
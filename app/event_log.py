@@ -0,0 +1,130 @@
+"""Structured event log that never blocks the event loop.
+
+``log`` only decides whether a record is sampled and puts it on a bounded
+queue; a background thread formats the records as JSON lines and writes them
+to stdout. If the sink is slow and the queue fills up, new records are
+dropped and counted instead of stalling the audio path.
+
+Payloads are summarized by the writer: long strings (like the system prompt
+in ``session.created``) and long lists are cut to ``LOG_MAX_FIELD_CHARS`` and
+``LOG_MAX_LIST_ITEMS``, deeply nested values are replaced by their size.
+Logged objects must not be mutated afterwards, they are formatted later.
+"""
+
+import json
+import sys
+import time
+
+from app.background_writer import BackgroundWriter
+from app.config import (
+    LOG_MAX_FIELD_CHARS,
+    LOG_MAX_LIST_ITEMS,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_RATES,
+)
+from app.metrics import registry
+
+MAX_DEPTH = 6
+
+_records = registry.counter(
+    "tooth_call_log_records_skipped_total",
+    "Log records not written, by reason.",
+    ("reason",),
+)
+_dropped = _records.labels("queue_full")
+_sampled_out = _records.labels("sampled_out")
+
+
+def summarize(
+    value,
+    max_chars: int = LOG_MAX_FIELD_CHARS,
+    max_items: int = LOG_MAX_LIST_ITEMS,
+    depth: int = 0,
+):
+    """Copy of a JSON-like value with long strings, lists and nesting cut."""
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            return f"{value[:max_chars]}...(+{len(value) - max_chars} chars)"
+        return value
+    if isinstance(value, dict):
+        if depth >= MAX_DEPTH:
+            return f"<dict with {len(value)} keys>"
+        return {
+            str(key): summarize(item, max_chars, max_items, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if depth >= MAX_DEPTH:
+            return f"<list with {len(value)} items>"
+        items = [
+            summarize(item, max_chars, max_items, depth + 1)
+            for item in value[:max_items]
+        ]
+        if len(value) > max_items:
+            items.append(f"...(+{len(value) - max_items} items)")
+        return items
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return summarize(repr(value), max_chars, max_items, depth)
+
+
+class EventLog(BackgroundWriter):
+    thread_name = "event-log-writer"
+    # Records written to the sink in one go when the writer has fallen behind
+    batch_size = 256
+
+    def __init__(
+        self,
+        sink=None,
+        queue_size: int = LOG_QUEUE_SIZE,
+        sample_rates: dict[str, float] = None,
+        max_field_chars: int = LOG_MAX_FIELD_CHARS,
+        max_list_items: int = LOG_MAX_LIST_ITEMS,
+    ):
+        super().__init__(queue_size)
+        # None writes to whatever sys.stdout is at the time of writing
+        self.sink = sink
+        self.max_field_chars = max_field_chars
+        self.max_list_items = max_list_items
+        # Keep every n-th record of a sampled event, 0 drops all of them
+        self._sample_every = {
+            event: round(1 / rate) if rate > 0 else 0
+            for event, rate in (
+                LOG_SAMPLE_RATES if sample_rates is None else sample_rates
+            ).items()
+        }
+        self._seen: dict[str, int] = {}
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def log(self, event: str, level: str = "info", **fields):
+        """Queue a record. Cheap and non-blocking, safe on the audio path."""
+        every = self._sample_every.get(event, 1)
+        if every != 1:
+            seen = self._seen[event] = self._seen.get(event, 0) + 1
+            if every == 0 or (seen - 1) % every:
+                self.sampled_out += 1
+                _sampled_out.inc()
+                return
+        if self._thread is None:
+            self.start()
+        if not self.put((time.time(), level, event, fields)):
+            self.dropped += 1
+            _dropped.inc()
+
+    def _format(self, record) -> str:
+        timestamp, level, event, fields = record
+        line = {"ts": round(timestamp, 3), "level": level, "event": event}
+        line.update(summarize(fields, self.max_field_chars, self.max_list_items))
+        return json.dumps(line, ensure_ascii=False, default=repr) + "\n"
+
+    def _handle_batch(self, batch: list):
+        sink = self.sink or sys.stdout
+        sink.write("".join(self._format(record) for record in batch))
+        sink.flush()
+        self.written += len(batch)
+
+
+event_log = EventLog()
+log = event_log.log
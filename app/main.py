@@ -1,18 +1,97 @@
 """FastAPI setup.
 """
 
-from dotenv import load_dotenv
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from app.api.callbacks.routes import router as callbacks_router
+from app.api.media_stream.admission import admission_controller
+from app.api.media_stream.capture import capture_writer
+from app.api.media_stream.greeting_cache import greeting_cache
+from app.api.media_stream.recorder import call_recorder
 from app.api.media_stream.routes import router as media_stream_router
+from app.api.media_stream.session import live_sessions
+from app.api.media_stream.session_bootstrap import session_bootstrap
+from app.api.media_stream.upstream_pool import upstream_pool
+from app.api.workers.routes import router as workers_router
+from app.config import STARTUP_WARMUP
+from app.event_log import event_log
+from app.metrics import registry
+from app.shared_state import shared_state
+from app.tools.cal_tool import CalTool, availability, bookings_cache
+from app.tools.callback_store import callback_store
+from app.tools.clients import close_clients, warm_up
+
+
+def worker_load() -> dict:
+    """Load of this worker, as reported to its siblings."""
+    return {
+        "sessions": len(live_sessions),
+        "queued": admission_controller.queue_length(),
+        "loop_lag": admission_controller.loop_lag,
+        "calls": [session.stream_sid for session in live_sessions if session.stream_sid],
+    }
+
 
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Building the clients blocks for a while, so do it before the first call
+    # instead of inside a live session. In the background by default, a new
+    # worker starts listening without waiting for it.
+    event_log.start()
+    callback_store.start()
+    warmer = None
+    if STARTUP_WARMUP == "eager":
+        await warm_up()
+    elif STARTUP_WARMUP == "background":
+        warmer = asyncio.create_task(warm_up())
+    session_bootstrap.reload_if_changed()
+    prompt_watcher = asyncio.create_task(session_bootstrap.watch())
+    greeting_watcher = asyncio.create_task(greeting_cache.watch())
+    # With several workers only one of them refreshes the availability index
+    # at a time, the others pick the result up from the shared state
+    if shared_state.enabled:
+        shared_state.start()
+        availability_watcher = asyncio.create_task(
+            shared_state.watch(availability, bookings_cache, CalTool.fetch_bookings, worker_load)
+        )
+    else:
+        availability_watcher = asyncio.create_task(availability.watch(CalTool.fetch_bookings))
+    upstream_pool.start()
+    # The warm-up stalls the loop once, that is no reason to hold back calls
+    admission_controller.start(ignore_lag_until=warmer)
+    yield
+    await admission_controller.close()
+    if warmer is not None:
+        await warmer
+    prompt_watcher.cancel()
+    greeting_watcher.cancel()
+    availability_watcher.cancel()
+    await upstream_pool.close()
+    await shared_state.close()
+    await close_clients()
+    callback_store.close()
+    call_recorder.close()
+    capture_writer.close()
+    event_log.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(media_stream_router)
+app.include_router(callbacks_router)
+app.include_router(workers_router)
 
 
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Tooth call AI Voice Assistant is running!"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,189 @@
+"""Prometheus-style metrics for the media stream and the tools.
+
+Recording sits on the audio hot path, so it has to be cheap: counters are
+plain integer increments and histograms have fixed buckets, an observation
+is one bisect plus two additions. Label children are created once at import,
+nothing is allocated per frame. All metrics are only mutated from the event
+loop thread, which makes locking unnecessary.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+FORWARDING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{labels} {self.value}"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time_since(self, started: float):
+        """Observe the seconds elapsed since a ``time.monotonic()`` value."""
+        self.observe(time.monotonic() - started)
+
+    def samples(self, name: str, labels: str):
+        label_prefix = labels[1:-1] + "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f'{name}_bucket{{{label_prefix}le="{le}"}} {cumulative}'
+        yield f"{name}_sum{labels} {self.sum}"
+        yield f"{name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """Value read from a function at scrape time."""
+
+    def __init__(self, function: Callable[[], float]):
+        self.function = function
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{labels} {self.function()}"
+
+
+class MetricFamily:
+    def __init__(self, kind: str, name: str, help: str, label_names: tuple, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._factory = factory
+        self._children: dict[tuple, object] = {}
+
+    def labels(self, *values: str):
+        """Child for the given label values. Look it up once, not per event."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            labels = ",".join(
+                f'{name}="{value}"' for name, value in zip(self.label_names, values)
+            )
+            lines.extend(child.samples(self.name, f"{{{labels}}}" if labels else ""))
+        return lines
+
+
+class GaugeFamily(MetricFamily):
+    def __init__(self, name: str, help: str, label_names: tuple, function: Callable[[], dict]):
+        super().__init__("gauge", name, help, label_names, None)
+        self.function = function
+
+    def render(self) -> list[str]:
+        self._children = {
+            values: Gauge(lambda value=value: value)
+            for values, value in self.function().items()
+        }
+        return super().render()
+
+
+class Registry:
+    def __init__(self):
+        self._families: list[MetricFamily] = []
+
+    def _add(self, family: MetricFamily) -> MetricFamily:
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help: str, label_names: tuple = ()):
+        family = self._add(MetricFamily("counter", name, help, label_names, Counter))
+        return family if label_names else family.labels()
+
+    def histogram(self, name: str, help: str, buckets: tuple, label_names: tuple = ()):
+        family = self._add(
+            MetricFamily(
+                "histogram", name, help, label_names, lambda: Histogram(buckets)
+            )
+        )
+        return family if label_names else family.labels()
+
+    def gauge(self, name: str, help: str, function: Callable[[], float]):
+        family = self._add(
+            MetricFamily("gauge", name, help, (), lambda: Gauge(function))
+        )
+        return family.labels()
+
+    def gauge_family(
+        self, name: str, help: str, label_names: tuple, function: Callable[[], dict]
+    ):
+        """Gauges whose label values are only known at scrape time, e.g. the
+        other workers. ``function`` maps label value tuples to values."""
+        return self._add(GaugeFamily(name, help, label_names, function))
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+session_setup_seconds = registry.histogram(
+    "tooth_call_session_setup_seconds",
+    "Time from accepting the caller to an initialized upstream session.",
+    LATENCY_BUCKETS,
+)
+response_latency_seconds = registry.histogram(
+    "tooth_call_response_latency_seconds",
+    "Time from the caller's speech_stopped to the first outbound audio delta.",
+    LATENCY_BUCKETS,
+)
+
+_frames = registry.counter(
+    "tooth_call_audio_frames_total", "Audio frames forwarded.", ("direction",)
+)
+inbound_frames = _frames.labels("inbound")
+outbound_frames = _frames.labels("outbound")
+
+_forwarding = registry.histogram(
+    "tooth_call_forwarding_delay_seconds",
+    "Time an audio frame spends in the app before it is handed to the socket.",
+    FORWARDING_BUCKETS,
+    ("direction",),
+)
+inbound_forwarding_seconds = _forwarding.labels("inbound")
+outbound_forwarding_seconds = _forwarding.labels("outbound")
+
+TOOL_NAMES = ("create_booking", "find_free_slots", "cancel_booking", "create_call_back")
+_tool_duration = registry.histogram(
+    "tooth_call_tool_duration_seconds",
+    "Duration of tool calls.",
+    LATENCY_BUCKETS,
+    ("tool",),
+)
+_tool_errors = registry.counter(
+    "tooth_call_tool_errors_total", "Failed tool calls.", ("tool",)
+)
+_tool_timeouts = registry.counter(
+    "tooth_call_tool_timeouts_total",
+    "Tool calls answered with a fallback after their timeout.",
+    ("tool",),
+)
+tool_duration_seconds = {name: _tool_duration.labels(name) for name in TOOL_NAMES}
+tool_errors = {name: _tool_errors.labels(name) for name in TOOL_NAMES}
+tool_timeouts = {name: _tool_timeouts.labels(name) for name in TOOL_NAMES}
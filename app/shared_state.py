@@ -0,0 +1,457 @@
+"""State shared by the workers of one host.
+
+With several uvicorn workers every one of them would otherwise load the
+bookings from cal.com on its own, book slots without knowing what its
+siblings just booked and only know about its own calls. With
+``SHARED_STATE_PATH`` set they share a local SQLite database in WAL mode:
+
+- A snapshot of the bookings of the availability index. When it is older than
+  ``AVAILABILITY_REFRESH_INTERVAL``, the first worker that takes the refresh
+  lease fetches it from cal.com, the others load it from the database.
+  Bookings and cancellations made by any worker since are appended to an event
+  log and applied by all of them, to the index and to the bookings cache.
+- A lease per slot that is being booked, so bookings of the same slot by
+  different workers run one after the other and the later one finds the
+  earlier one in the index instead of asking cal.com.
+- A heartbeat row per worker with its load and calls in progress, written
+  every ``SHARED_STATE_INTERVAL`` seconds. Workers that miss a few heartbeats
+  are dropped, also their calls and leases expire on their own.
+
+The workers keep answering from memory, the database is only read by the
+heartbeat and before a booking, with one indexed query each. All queries run
+in a worker thread so a busy database never stalls the audio of live calls.
+Without ``SHARED_STATE_PATH`` every method is a no-op.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, timedelta
+from typing import Awaitable, Callable
+
+from app.config import (
+    AVAILABILITY_REFRESH_INTERVAL,
+    SHARED_STATE_INTERVAL,
+    SHARED_STATE_PATH,
+    TOOL_CALL_TIMEOUT,
+)
+from app.event_log import log
+from app.metrics import registry
+from app.tools.availability import fetch_range, practice_day, practice_now
+from app.tools.callback_store import connect
+
+# A worker is gone after this many missed heartbeats
+STALE_HEARTBEATS = 5
+# Seconds between attempts to take a slot that a sibling is booking
+SLOT_POLL_INTERVAL = 0.05
+# Held until the snapshot is stored, or as a back-off after a failed fetch
+REFRESH_LEASE = "availability_refresh"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookings_snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    first_day TEXT NOT NULL,
+    last_day TEXT NOT NULL,
+    events_seq INTEGER NOT NULL,
+    bookings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS booking_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    worker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    sessions INTEGER NOT NULL,
+    queued INTEGER NOT NULL,
+    loop_lag REAL NOT NULL,
+    cpu_seconds REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS calls (
+    stream_sid TEXT PRIMARY KEY,
+    worker TEXT NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_worker ON calls (worker);
+"""
+
+ACQUIRE = """
+INSERT INTO leases (name, owner, expires_at) VALUES (:name, :owner, :expires_at)
+ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+WHERE leases.expires_at < :now OR leases.owner = excluded.owner
+"""
+
+HEARTBEAT = """
+INSERT INTO workers (worker, pid, started_at, heartbeat_at, sessions, queued, loop_lag, cpu_seconds)
+VALUES (:worker, :pid, :started_at, :now, :sessions, :queued, :loop_lag, :cpu_seconds)
+ON CONFLICT (worker) DO UPDATE SET
+    heartbeat_at = excluded.heartbeat_at,
+    sessions = excluded.sessions,
+    queued = excluded.queued,
+    loop_lag = excluded.loop_lag,
+    cpu_seconds = excluded.cpu_seconds
+"""
+
+WORKERS = """
+SELECT worker, pid, started_at, heartbeat_at, sessions, queued, loop_lag, cpu_seconds,
+    (SELECT json_group_array(stream_sid) FROM calls WHERE calls.worker = workers.worker) AS calls
+FROM workers WHERE heartbeat_at >= ? ORDER BY worker
+"""
+
+
+class SharedState:
+    def __init__(
+        self,
+        path: str = SHARED_STATE_PATH,
+        interval: float = SHARED_STATE_INTERVAL,
+        refresh_interval: float = AVAILABILITY_REFRESH_INTERVAL,
+        lease_seconds: float = TOOL_CALL_TIMEOUT,
+    ):
+        self.path = path
+        self.interval = interval
+        self.refresh_interval = refresh_interval
+        # Outlasts a booking or a refresh, a crashed holder blocks no longer
+        self.lease_seconds = lease_seconds
+        self.worker = str(os.getpid())
+        self.started_at = time.time()
+        # Workers as of the last heartbeat, for /metrics
+        self.report: list[dict] = []
+        self._connection: sqlite3.Connection | None = None
+        self._connection_lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+        # Slot lease name to the lock of this worker's bookings of it and
+        # how many of them hold or wait for it
+        self._slot_locks: dict[str, list] = {}
+        # Snapshot version and last event applied to this worker's index
+        self._version = 0
+        self._seq = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self):
+        if self.enabled and self._connection is None:
+            # Used from the threads of asyncio.to_thread, one at a time
+            connection = connect(self.path, check_same_thread=False)
+            connection.isolation_level = None
+            connection.executescript(SCHEMA)
+            self._connection = connection
+
+    async def close(self):
+        """Leave the host: drop this worker's row and calls, release leases."""
+        if self._connection is None:
+            return
+        try:
+            await self._run(self._leave)
+        except sqlite3.Error as e:
+            log("shared_state.error", level="error", operation="close", error=repr(e))
+        with self._connection_lock:
+            self._connection.close()
+            self._connection = None
+
+    def _locked(self, function, *args):
+        with self._connection_lock:
+            return function(*args)
+
+    async def _run(self, function, *args):
+        return await asyncio.to_thread(self._locked, function, *args)
+
+    @contextmanager
+    def _transaction(self, mode: str = "DEFERRED"):
+        # Autocommit connection, so that reads see one consistent state too
+        self._connection.execute(f"BEGIN {mode}")
+        try:
+            yield self._connection
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    # Leases
+
+    def _acquire(self, name: str, owner: str, seconds: float) -> bool:
+        now = time.time()
+        cursor = self._connection.execute(
+            ACQUIRE,
+            {"name": name, "owner": owner, "expires_at": now + seconds, "now": now},
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, name: str, owner: str):
+        self._connection.execute(
+            "DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner)
+        )
+
+    @asynccontextmanager
+    async def slot_lock(self, start: str):
+        """Hold the slot ``start`` while booking it, one booking at a time.
+
+        Bookings of the same slot wait for each other, within the worker on
+        a lock and across the host on a lease, also without shared state.
+        Waiting is bounded by the timeout of the tool call.
+        """
+        name = f"slot:{start}"
+        entry = self._slot_locks.get(name)
+        if entry is None:
+            entry = self._slot_locks[name] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if self._connection is None:
+                    yield
+                    return
+                owner = f"{self.worker}:{uuid.uuid4().hex}"
+                try:
+                    await self._acquire_slot(name, owner)
+                    yield
+                finally:
+                    # Also when the tool call is cancelled, the siblings wait otherwise
+                    await asyncio.shield(self._run(self._release, name, owner))
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._slot_locks[name]
+
+    async def _acquire_slot(self, name: str, owner: str):
+        while not await self._run(self._acquire, name, owner, self.lease_seconds):
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+    # Bookings
+
+    def _append_event(self, kind: str, value):
+        self._connection.execute(
+            "INSERT INTO booking_events (worker, kind, value) VALUES (?, ?, ?)",
+            (self.worker, kind, json.dumps(value)),
+        )
+
+    async def record_booking(self, booking: dict):
+        """Tell the siblings about a booking made by this worker."""
+        if self._connection is not None:
+            await self._run(self._append_event, "add", booking)
+
+    async def record_cancellation(self, uid: str):
+        """Tell the siblings about a booking cancelled by this worker."""
+        if self._connection is not None:
+            await self._run(self._append_event, "remove", uid)
+
+    def _changes(self, version: int, seq: int):
+        with self._transaction() as connection:
+            snapshot = connection.execute(
+                "SELECT version, first_day, last_day, events_seq, bookings "
+                "FROM bookings_snapshot WHERE id = 1"
+            ).fetchone()
+            if snapshot is not None and snapshot["version"] != version:
+                seq = snapshot["events_seq"]
+                snapshot = (
+                    snapshot["version"],
+                    seq,
+                    json.loads(snapshot["bookings"]),
+                    date.fromisoformat(snapshot["first_day"]),
+                    date.fromisoformat(snapshot["last_day"]),
+                )
+            else:
+                snapshot = None
+            events = connection.execute(
+                "SELECT seq, worker, kind, value FROM booking_events WHERE seq > ? ORDER BY seq",
+                (seq,),
+            ).fetchall()
+        return snapshot, [
+            (row["seq"], row["worker"], row["kind"], json.loads(row["value"])) for row in events
+        ]
+
+    async def sync_bookings(self, index, cache):
+        """Apply a new snapshot and the siblings' bookings and cancellations
+        since to ``index``, and the latter to ``cache``."""
+        if self._connection is None:
+            return
+        async with self._sync_lock:
+            snapshot, events = await self._run(self._changes, self._version, self._seq)
+            if snapshot is not None:
+                self._version, self._seq, bookings, first_day, last_day = snapshot
+                index.load(bookings, first_day, last_day)
+            for self._seq, worker, kind, value in events:
+                # Own writes go to the index again, they may be newer than the
+                # snapshot. The cache has them since they were made.
+                if kind == "add":
+                    index.add_booking(value)
+                    if worker != self.worker:
+                        cache.add_booking(practice_day(value["start"]), value)
+                else:
+                    index.remove_booking(value)
+                    if worker != self.worker:
+                        cache.remove_booking(value)
+
+    def _claim_refresh(self, owner: str) -> int | None:
+        """Event sequence number to fetch a snapshot at, None if it is fresh
+        or a sibling is fetching it."""
+        row = self._connection.execute(
+            "SELECT fetched_at FROM bookings_snapshot WHERE id = 1"
+        ).fetchone()
+        if row is not None and time.time() - row["fetched_at"] < self.refresh_interval:
+            return None
+        if not self._acquire(REFRESH_LEASE, owner, self.lease_seconds):
+            return None
+        row = self._connection.execute("SELECT max(seq) FROM booking_events").fetchone()
+        return row[0] or 0
+
+    def _store_snapshot(
+        self, owner: str, bookings: list[dict], first_day: date, last_day: date, events_seq: int
+    ):
+        with self._transaction("IMMEDIATE") as connection:
+            connection.execute(
+                "INSERT INTO bookings_snapshot "
+                "(id, version, fetched_at, first_day, last_day, events_seq, bookings) "
+                "VALUES (1, 1, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET version = version + 1, "
+                "fetched_at = excluded.fetched_at, first_day = excluded.first_day, "
+                "last_day = excluded.last_day, events_seq = excluded.events_seq, "
+                "bookings = excluded.bookings",
+                (time.time(), first_day.isoformat(), last_day.isoformat(), events_seq, json.dumps(bookings)),
+            )
+            # Made before the fetch started, so cal.com returned them already
+            connection.execute("DELETE FROM booking_events WHERE seq <= ?", (events_seq,))
+            self._release(REFRESH_LEASE, owner)
+
+    async def _refresh_if_stale(
+        self, days: int, fetch: Callable[[str, str], Awaitable[list[dict]]]
+    ):
+        owner = f"{self.worker}:{uuid.uuid4().hex}"
+        events_seq = await self._run(self._claim_refresh, owner)
+        if events_seq is None:
+            return
+        first_day = practice_now().date()
+        last_day = first_day + timedelta(days=days - 1)
+        try:
+            bookings = await fetch(*fetch_range(first_day, last_day))
+        except Exception as e:
+            # The lease stays taken until it expires, as a back-off for all workers
+            log("availability.refresh.error", level="error", error=repr(e))
+            return
+        await self._run(self._store_snapshot, owner, bookings, first_day, last_day, events_seq)
+
+    # Workers and calls
+
+    def _heartbeat(self, load: dict) -> list[dict]:
+        now = time.time()
+        calls = load["calls"]
+        with self._transaction("IMMEDIATE") as connection:
+            connection.execute(
+                HEARTBEAT,
+                {
+                    "worker": self.worker,
+                    "pid": os.getpid(),
+                    "started_at": self.started_at,
+                    "now": now,
+                    "sessions": load["sessions"],
+                    "queued": load["queued"],
+                    "loop_lag": load["loop_lag"],
+                    "cpu_seconds": time.process_time(),
+                },
+            )
+            connection.execute(
+                "DELETE FROM calls WHERE worker = ? "
+                "AND stream_sid NOT IN (SELECT value FROM json_each(?))",
+                (self.worker, json.dumps(calls)),
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO calls (stream_sid, worker, started_at) VALUES (?, ?, ?)",
+                [(stream_sid, self.worker, now) for stream_sid in calls],
+            )
+            stale = now - STALE_HEARTBEATS * self.interval
+            connection.execute(
+                "DELETE FROM calls WHERE worker IN "
+                "(SELECT worker FROM workers WHERE heartbeat_at < ?)",
+                (stale,),
+            )
+            connection.execute("DELETE FROM workers WHERE heartbeat_at < ?", (stale,))
+        return self._workers()
+
+    def _workers(self) -> list[dict]:
+        rows = self._connection.execute(
+            WORKERS, (time.time() - STALE_HEARTBEATS * self.interval,)
+        ).fetchall()
+        return [dict(row, calls=json.loads(row["calls"])) for row in rows]
+
+    def _leave(self):
+        with self._transaction("IMMEDIATE") as connection:
+            connection.execute("DELETE FROM calls WHERE worker = ?", (self.worker,))
+            connection.execute("DELETE FROM workers WHERE worker = ?", (self.worker,))
+            connection.execute(
+                "DELETE FROM leases WHERE owner LIKE ?", (f"{self.worker}:%",)
+            )
+
+    async def workers(self) -> list[dict]:
+        """Live workers of the host with their load and calls in progress."""
+        if self._connection is None:
+            return []
+        return await self._run(self._workers)
+
+    async def watch(
+        self,
+        index,
+        cache,
+        fetch: Callable[[str, str], Awaitable[list[dict]]],
+        load: Callable[[], dict],
+    ):
+        """Heartbeat, keep the bookings snapshot fresh and apply it to
+        ``index`` and ``cache`` every ``interval`` seconds."""
+        while True:
+            try:
+                self.report = await self._run(self._heartbeat, load())
+                await self._refresh_if_stale(index.days, fetch)
+                await self.sync_bookings(index, cache)
+            except Exception as e:
+                # Whatever fails, the next heartbeat tries again
+                log("shared_state.error", level="error", error=repr(e))
+            await asyncio.sleep(self.interval)
+
+
+shared_state = SharedState()
+
+
+def _worker_values(field: str) -> Callable[[], dict]:
+    return lambda: {(worker["worker"],): worker[field] for worker in shared_state.report}
+
+
+# Every worker reports all of them, a scrape reaches any one
+registry.gauge_family(
+    "tooth_call_worker_sessions",
+    "Calls in progress per worker of the host.",
+    ("worker",),
+    _worker_values("sessions"),
+)
+registry.gauge_family(
+    "tooth_call_worker_queued",
+    "Calls waiting for admission per worker of the host.",
+    ("worker",),
+    _worker_values("queued"),
+)
+registry.gauge_family(
+    "tooth_call_worker_loop_lag_seconds",
+    "Smoothed event-loop lag per worker of the host.",
+    ("worker",),
+    _worker_values("loop_lag"),
+)
+registry.gauge_family(
+    "tooth_call_worker_cpu_seconds",
+    "CPU time used per worker of the host.",
+    ("worker",),
+    _worker_values("cpu_seconds"),
+)
@@ -0,0 +1,193 @@
+"""Find a caller's booking in a day listing from a possibly misheard name.
+
+Names arrive through speech recognition, so "Peter Müller" may show up as
+"Peter Muuhler". Every booking is scored with a mix of German phonetic
+similarity (Kölner Phonetik) and normalized edit distance. Only when the best
+candidates are too close to call does the caller need the LLM fallback.
+"""
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from app.tools.models import CalendarBookingInformation
+
+# Score at or above which the best candidate is accepted without fallback
+MATCH_CONFIDENCE = 0.75
+# Score below which a candidate is not considered a match at all
+MIN_CONFIDENCE = 0.45
+# Minimal lead of the best over the second best candidate
+AMBIGUITY_MARGIN = 0.1
+
+PHONETIC_WEIGHT = 0.6
+
+_UMLAUTS = str.maketrans({"Ä": "A", "Ö": "O", "Ü": "U", "ß": "S"})
+
+
+@dataclass
+class AttendeeMatch:
+    """Result of matching a spoken name against a day's bookings.
+
+    ``booking`` is only set for a confident match. ``candidates`` holds the raw
+    bookings that remain plausible when the match is ambiguous.
+    """
+
+    booking: CalendarBookingInformation | None
+    confidence: float
+    candidates: list[dict] = field(default_factory=list)
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return self.booking is None and bool(self.candidates)
+
+
+def _normalize(name: str) -> str:
+    name = name.upper().translate(_UMLAUTS)
+    return "".join(char if char.isalpha() else " " for char in name)
+
+
+@lru_cache(maxsize=4096)
+def koelner_phonetik(word: str) -> str:
+    """Encode a single word with the Kölner Phonetik."""
+    letters = [char for char in _normalize(word) if char != " "]
+    codes = []
+    for index, char in enumerate(letters):
+        previous = letters[index - 1] if index > 0 else ""
+        following = letters[index + 1] if index + 1 < len(letters) else ""
+
+        if char in "AEIJOUY":
+            code = "0"
+        elif char == "H":
+            code = ""
+        elif char == "B":
+            code = "1"
+        elif char == "P":
+            code = "3" if following == "H" else "1"
+        elif char in "DT":
+            code = "8" if following in ("C", "S", "Z") else "2"
+        elif char in "FVW":
+            code = "3"
+        elif char in "GKQ":
+            code = "4"
+        elif char == "C":
+            if index == 0:
+                code = "4" if following and following in "AHKLOQRUX" else "8"
+            elif previous in ("S", "Z"):
+                code = "8"
+            else:
+                code = "4" if following and following in "AHKOQUX" else "8"
+        elif char == "X":
+            code = "8" if previous in ("C", "K", "Q") else "48"
+        elif char == "L":
+            code = "5"
+        elif char in "MN":
+            code = "6"
+        elif char == "R":
+            code = "7"
+        elif char in "SZ":
+            code = "8"
+        else:
+            code = ""
+        codes.append(code)
+
+    collapsed = []
+    for code in "".join(codes):
+        if not collapsed or collapsed[-1] != code:
+            collapsed.append(code)
+    if not collapsed:
+        return ""
+    return collapsed[0] + "".join(code for code in collapsed[1:] if code != "0")
+
+
+def _levenshtein(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def _similarity(a: str, b: str) -> float:
+    if not a and not b:
+        return 1.0
+    return 1.0 - _levenshtein(a, b) / max(len(a), len(b))
+
+
+@lru_cache(maxsize=4096)
+def _token_similarity(spoken: str, booked: str) -> float:
+    phonetic = _similarity(koelner_phonetik(spoken), koelner_phonetik(booked))
+    spelling = _similarity(spoken, booked)
+    return PHONETIC_WEIGHT * phonetic + (1 - PHONETIC_WEIGHT) * spelling
+
+
+def name_similarity(spoken_name: str, booked_name: str) -> float:
+    """Score in [0, 1] how likely two names refer to the same person.
+
+    Each spoken token is matched to its best booked token, so word order and
+    a missing first name do not hurt the score.
+    """
+    spoken_tokens = _normalize(spoken_name).split()
+    booked_tokens = _normalize(booked_name).split()
+    if not spoken_tokens or not booked_tokens:
+        return 0.0
+    scores = [
+        max(_token_similarity(spoken, booked) for booked in booked_tokens)
+        for spoken in spoken_tokens
+    ]
+    return sum(scores) / len(scores)
+
+
+def booking_attendee_name(booking: dict) -> str:
+    attendees = booking.get("attendees") or []
+    if attendees:
+        return attendees[0].get("name", "")
+    return booking.get("title", "")
+
+
+def match_attendee(bookings: list[dict], attendee_name: str) -> AttendeeMatch:
+    """Pick the booking of ``attendee_name`` from raw cal.com bookings.
+
+    Only accepted bookings are considered, a day listing also holds the
+    cancelled ones.
+    """
+    scored = sorted(
+        (
+            (name_similarity(attendee_name, booking_attendee_name(booking)), booking)
+            for booking in bookings
+            if booking.get("status", "accepted") == "accepted"
+        ),
+        key=lambda item: item[0],
+        reverse=True,
+    )
+    scored = [(score, booking) for score, booking in scored if score >= MIN_CONFIDENCE]
+    if not scored:
+        return AttendeeMatch(booking=None, confidence=0.0)
+
+    best_score, best_booking = scored[0]
+    runner_up_score = scored[1][0] if len(scored) > 1 else 0.0
+    if (
+        best_score >= MATCH_CONFIDENCE
+        and best_score - runner_up_score >= AMBIGUITY_MARGIN
+    ):
+        booking = CalendarBookingInformation(
+            uid=best_booking["uid"],
+            attendee_name=booking_attendee_name(best_booking),
+            start=best_booking["start"],
+        )
+        return AttendeeMatch(booking=booking, confidence=best_score)
+
+    candidates = [
+        booking
+        for score, booking in scored
+        if best_score - score < AMBIGUITY_MARGIN or score >= MATCH_CONFIDENCE
+    ]
+    return AttendeeMatch(booking=None, confidence=best_score, candidates=candidates)
@@ -0,0 +1,252 @@
+"""In-memory index of free appointment slots.
+
+Busy intervals of the next ``AVAILABILITY_DAYS`` days are loaded from cal.com
+in one paginated range request and refreshed in the background. Bookings and cancellations
+made through ``CalTool`` are applied right away, also to a refresh that is
+still in flight. Queries are answered from memory: the free slots of a day
+are derived once from its busy intervals and cached until the day changes.
+
+Times in the index are naive wall-clock times of the practice in
+``PRACTICE_TZ``. Times from cal.com and tool arguments with a trailing ``Z``
+or an offset are converted to it, times without one are taken as practice
+time. Slots are offered with the practice's offset and sent to cal.com in
+UTC.
+"""
+
+import asyncio
+import time
+from bisect import insort
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable
+from zoneinfo import ZoneInfo
+
+from app.config import (
+    APPOINTMENT_MINUTES,
+    AVAILABILITY_DAYS,
+    AVAILABILITY_REFRESH_INTERVAL,
+    PRACTICE_CLOSE_HOUR,
+    PRACTICE_OPEN_HOUR,
+    PRACTICE_TZ,
+    PRACTICE_WEEKDAYS,
+)
+from app.event_log import log
+
+# Why a requested slot cannot be booked
+CLOSED = "closed"
+PAST = "past"
+BUSY = "busy"
+
+Interval = tuple[datetime, datetime, str]
+
+PRACTICE_ZONE = ZoneInfo(PRACTICE_TZ)
+
+
+def practice_now() -> datetime:
+    """The current wall-clock time of the practice."""
+    return datetime.now(PRACTICE_ZONE).replace(tzinfo=None)
+
+
+def parse_time(value: str) -> datetime:
+    """Practice wall-clock time from an ISO 8601 string like
+    ``2024-08-13T09:00:00Z``, converted if it has a ``Z`` or an offset."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(PRACTICE_ZONE)
+    return parsed.replace(tzinfo=None)
+
+
+def format_time(value: datetime) -> str:
+    """Format a slot the way the tools expect ``start`` arguments, with the
+    practice's offset, e.g. ``2024-08-13T09:00:00+02:00``."""
+    return value.replace(tzinfo=PRACTICE_ZONE).isoformat(timespec="seconds")
+
+
+def utc_time(value: datetime) -> str:
+    """Format a practice time in UTC, the way cal.com expects it."""
+    return value.replace(tzinfo=PRACTICE_ZONE).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def practice_day(value: str) -> str:
+    """The practice day of an ISO 8601 time, as ``YYYY-MM-DD``."""
+    try:
+        return parse_time(value).date().isoformat()
+    except (TypeError, ValueError):
+        return value[:10]
+
+
+def fetch_range(first_day: date, last_day: date) -> tuple[str, str]:
+    """UTC bounds of the practice days ``first_day`` to ``last_day``."""
+    return (
+        utc_time(datetime(first_day.year, first_day.month, first_day.day)),
+        utc_time(datetime(last_day.year, last_day.month, last_day.day, 23, 59, 59)),
+    )
+
+
+def booking_interval(booking: dict, minutes: int = APPOINTMENT_MINUTES) -> Interval:
+    start = parse_time(booking["start"])
+    end = parse_time(booking["end"]) if booking.get("end") else None
+    return start, end or start + timedelta(minutes=minutes), booking.get("uid", "")
+
+
+class AvailabilityIndex:
+    def __init__(
+        self,
+        days: int = AVAILABILITY_DAYS,
+        slot_minutes: int = APPOINTMENT_MINUTES,
+        open_hour: int = PRACTICE_OPEN_HOUR,
+        close_hour: int = PRACTICE_CLOSE_HOUR,
+        weekdays: tuple[int, ...] = PRACTICE_WEEKDAYS,
+    ):
+        self.days = days
+        self.slot = timedelta(minutes=slot_minutes)
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.weekdays = weekdays
+        self._busy: dict[date, list[Interval]] = {}
+        self._free: dict[date, list[datetime]] = {}
+        self._first_day: date | None = None
+        self._last_day: date | None = None
+        # Local writes while a refresh is in flight, replayed onto its result
+        self._pending_writes: list[tuple[str, object]] | None = None
+        self.refreshed_at: float | None = None
+
+    def covers(self, day: date) -> bool:
+        return self._first_day is not None and self._first_day <= day <= self._last_day
+
+    def load(self, bookings: list[dict], first_day: date, last_day: date):
+        """Replace the index with the bookings of ``first_day`` to ``last_day``."""
+        busy: dict[date, list[Interval]] = {}
+        for booking in bookings:
+            if booking.get("status", "accepted") == "accepted":
+                interval = booking_interval(booking)
+                insort(busy.setdefault(interval[0].date(), []), interval)
+        self._busy = busy
+        self._free = {}
+        self._first_day = first_day
+        self._last_day = last_day
+        self.refreshed_at = time.monotonic()
+
+    def add_booking(self, booking: dict):
+        """Write-through for a booking created by us."""
+        if self._pending_writes is not None:
+            self._pending_writes.append(("add", booking))
+        interval = booking_interval(booking)
+        day = interval[0].date()
+        if interval not in self._busy.get(day, ()):
+            insort(self._busy.setdefault(day, []), interval)
+        self._free.pop(day, None)
+
+    def remove_booking(self, uid: str):
+        """Write-through for a booking cancelled by us."""
+        if self._pending_writes is not None:
+            self._pending_writes.append(("remove", uid))
+        for day, intervals in self._busy.items():
+            remaining = [interval for interval in intervals if interval[2] != uid]
+            if len(remaining) != len(intervals):
+                self._busy[day] = remaining
+                self._free.pop(day, None)
+
+    def _is_open(self, start: datetime) -> bool:
+        opening = start.replace(hour=self.open_hour, minute=0, second=0, microsecond=0)
+        closing = opening.replace(hour=self.close_hour)
+        return (
+            start.weekday() in self.weekdays
+            and opening <= start
+            and start + self.slot <= closing
+        )
+
+    def _overlaps(self, start: datetime, end: datetime) -> bool:
+        return any(
+            busy_start < end and start < busy_end
+            for busy_start, busy_end, _ in self._busy.get(start.date(), ())
+        )
+
+    def free_slots_of_day(self, day: date) -> list[datetime]:
+        """All free slots of a covered day on the appointment grid."""
+        free = self._free.get(day)
+        if free is not None:
+            return free
+        free = []
+        if day.weekday() in self.weekdays:
+            slot = datetime(day.year, day.month, day.day, self.open_hour)
+            closing = datetime(day.year, day.month, day.day, self.close_hour)
+            intervals = self._busy.get(day, [])
+            position = 0
+            while slot + self.slot <= closing:
+                # Intervals are sorted by start, skip the ones that ended
+                while position < len(intervals) and intervals[position][1] <= slot:
+                    position += 1
+                if not any(
+                    busy_start < slot + self.slot and slot < busy_end
+                    for busy_start, busy_end, _ in intervals[position:]
+                ):
+                    free.append(slot)
+                slot += self.slot
+        self._free[day] = free
+        return free
+
+    def check_slot(self, start: datetime, now: datetime = None) -> str | None:
+        """Reason a slot cannot be booked, or None if it is free or unknown."""
+        if not self.covers(start.date()):
+            return None
+        if start < (now or practice_now()):
+            return PAST
+        if not self._is_open(start):
+            return CLOSED
+        if self._overlaps(start, start + self.slot):
+            return BUSY
+        return None
+
+    def find_free_slots(
+        self, near: datetime, count: int = 3, now: datetime = None
+    ) -> list[datetime]:
+        """The ``count`` free slots closest to ``near``, in time order."""
+        if self._first_day is None:
+            return []
+        now = now or practice_now()
+        near = max(near, now)
+        day = max(near.date(), self._first_day)
+        found: list[tuple[timedelta, datetime]] = []
+        # Search outward from the requested day until no closer slot is left
+        for offset in range((self._last_day - self._first_day).days + 1):
+            for candidate in {day + timedelta(days=offset), day - timedelta(days=offset)}:
+                if not self.covers(candidate):
+                    continue
+                for slot in self.free_slots_of_day(candidate):
+                    if slot >= now:
+                        found.append((abs(slot - near), slot))
+            found.sort()
+            del found[count:]
+            if len(found) == count and found[-1][0] < timedelta(days=offset):
+                break
+        return sorted(slot for _, slot in found)
+
+    async def refresh(self, fetch: Callable[[str, str], Awaitable[list[dict]]]):
+        """Reload the busy intervals of today and the following days."""
+        first_day = practice_now().date()
+        last_day = first_day + timedelta(days=self.days - 1)
+        self._pending_writes = []
+        try:
+            bookings = await fetch(*fetch_range(first_day, last_day))
+            writes, self._pending_writes = self._pending_writes, None
+            self.load(bookings, first_day, last_day)
+            for kind, value in writes:
+                if kind == "add":
+                    self.add_booking(value)
+                else:
+                    self.remove_booking(value)
+        finally:
+            self._pending_writes = None
+
+    async def watch(
+        self,
+        fetch: Callable[[str, str], Awaitable[list[dict]]],
+        interval: float = AVAILABILITY_REFRESH_INTERVAL,
+    ):
+        """Refresh the index now and then every ``interval`` seconds."""
+        while True:
+            try:
+                await self.refresh(fetch)
+            except Exception as e:
+                log("availability.refresh.error", level="error", error=repr(e))
+            await asyncio.sleep(interval)
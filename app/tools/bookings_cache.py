@@ -0,0 +1,100 @@
+"""In-process cache of cal.com bookings per practice day.
+
+Entries expire after a TTL and the least recently used day is evicted once
+``max_days`` is reached. Concurrent misses for the same day share a single
+upstream request. Writes made through ``CalTool`` update the cached day so a
+caller cancelling right after booking still finds the appointment.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class BookingsCache:
+    def __init__(self, ttl: float, max_days: int):
+        self.ttl = ttl
+        self.max_days = max_days
+        self._days: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        # Writes to a day while its fetch is in flight, so a fetch that started
+        # before one is not stored. Only days being fetched have an entry.
+        self._writes_during_fetch: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, day: str) -> list[dict] | None:
+        entry = self._days.get(day)
+        if entry is None:
+            return None
+        stored_at, bookings = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._days[day]
+            return None
+        self._days.move_to_end(day)
+        return bookings
+
+    def _store(self, day: str, bookings: list[dict]):
+        self._days[day] = (time.monotonic(), bookings)
+        self._days.move_to_end(day)
+        while len(self._days) > self.max_days:
+            self._days.popitem(last=False)
+
+    async def get(
+        self, day: str, fetch: Callable[[str], Awaitable[list[dict]]]
+    ) -> list[dict]:
+        """Return the bookings of ``day``, calling ``fetch(day)`` on a miss."""
+        bookings = self._lookup(day)
+        if bookings is not None:
+            self.hits += 1
+            return list(bookings)
+
+        self.misses += 1
+        task = self._inflight.get(day)
+        if task is None:
+            task = asyncio.create_task(self._fetch(day, fetch))
+            self._inflight[day] = task
+        # A caller hanging up mid-lookup leaves the day's fetch running, other
+        # calls asking for the same day are waiting on it
+        return list(await asyncio.shield(task))
+
+    async def _fetch(
+        self, day: str, fetch: Callable[[str], Awaitable[list[dict]]]
+    ) -> list[dict]:
+        self._writes_during_fetch[day] = 0
+        try:
+            bookings = await fetch(day)
+        finally:
+            self._inflight.pop(day, None)
+            writes = self._writes_during_fetch.pop(day, 0)
+        if not writes:
+            self._store(day, bookings)
+        return bookings
+
+    def _written(self, day: str):
+        if day in self._writes_during_fetch:
+            self._writes_during_fetch[day] += 1
+
+    def add_booking(self, day: str, booking: dict):
+        """Write-through for a booking created by us."""
+        self._written(day)
+        bookings = self._lookup(day)
+        if bookings is not None:
+            self._store(day, bookings + [booking])
+
+    def remove_booking(self, uid: str):
+        """Write-through for a booking cancelled by us."""
+        for day in self._inflight:
+            self._written(day)
+        for day, (stored_at, bookings) in list(self._days.items()):
+            remaining = [booking for booking in bookings if booking.get("uid") != uid]
+            if len(remaining) != len(bookings):
+                self._days[day] = (stored_at, remaining)
+
+    def invalidate(self, day: str = None):
+        """Drop one day, or everything if no day is given."""
+        days = [day] if day else list(self._days) + list(self._inflight)
+        for key in days:
+            self._days.pop(key, None)
+            self._written(key)
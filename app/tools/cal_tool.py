@@ -1,30 +1,74 @@
 """Interact with calendars from cal.com.
 """
 
+import asyncio
 import json
-import os
 from datetime import datetime
 
-import openai
-import requests
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel
+import httpx
 
+from app.config import (
+    AVAILABILITY_DAYS,
+    BOOKINGS_CACHE_MAX_DAYS,
+    BOOKINGS_CACHE_TTL,
+    CAL_API_KEY,
+    CAL_BOOKINGS_PAGE_SIZE,
+    CAL_BREAKER_FAILURES,
+    CAL_BREAKER_RESET,
+    CAL_EVENT_TYPE_ID,
+    CAL_RETRY_BASE_DELAY,
+    CAL_RETRY_BUDGET,
+    CAL_RETRY_MAX_DELAY,
+    PRACTICE_TZ,
+)
+from app.event_log import log
+from app.metrics import tool_errors
 from app.prompts.prompt_file_paths import FIND_CALENDAR_ENTRIES
+from app.shared_state import shared_state
+from app.tools.attendee_matcher import booking_attendee_name, match_attendee
+from app.tools.availability import (
+    BUSY,
+    CLOSED,
+    PAST,
+    AvailabilityIndex,
+    format_time,
+    parse_time,
+    practice_day,
+    utc_time,
+)
+from app.tools.bookings_cache import BookingsCache
+from app.tools.clients import close_clients, get_cal_client, load_openai_client
+from app.tools.models import CalendarBookingInformation
+from app.tools.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientRequests,
+    idempotency_key,
+)
 
-load_dotenv()
+# Identical bookings in flight, e.g. re-emitted with another call_id, share one
+bookings_in_flight: dict[str, asyncio.Task] = {}
+bookings_cache = BookingsCache(ttl=BOOKINGS_CACHE_TTL, max_days=BOOKINGS_CACHE_MAX_DAYS)
+availability = AvailabilityIndex()
+cal_requests = ResilientRequests(
+    "cal",
+    get_cal_client,
+    CircuitBreaker(CAL_BREAKER_FAILURES, CAL_BREAKER_RESET),
+    budget=CAL_RETRY_BUDGET,
+    base_delay=CAL_RETRY_BASE_DELAY,
+    max_delay=CAL_RETRY_MAX_DELAY,
+)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-CAL_API_KEY = os.getenv("CAL_API_KEY")
+CAL_UNAVAILABLE = (
+    "Der Kalender ist gerade nicht erreichbar. "
+    "Biete dem Anrufer an, dass das Praxisteam zurückruft."
+)
 
-openai.api_key = OPENAI_API_KEY
-
-
-class CalendarBookingInformation(BaseModel):
-    uid: str
-    attendee_name: str
-    start: str
+UNAVAILABLE_REASONS = {
+    PAST: "der Zeitpunkt liegt in der Vergangenheit",
+    CLOSED: "die Praxis hat zu dieser Zeit geschlossen",
+    BUSY: "der Termin ist bereits belegt",
+}
 
 
 class CalTool:
@@ -50,6 +94,27 @@ class CalTool:
         },
     }
 
+    find_free_slots_description = {
+        "type": "function",
+        "name": "find_free_slots",
+        "description": "Sucht die freien Termine, die einem Wunschzeitpunkt am nächsten liegen. Nutze das, bevor du Termine vorschlägst oder wenn ein Wunschtermin nicht frei ist.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "near": {
+                    "type": "string",
+                    "description": "Wunschzeitpunkt. Beispiel des korrekten Formats: 2024-08-13T09:00:00Z",
+                },
+                "count": {
+                    "type": "integer",
+                    "description": "Anzahl der gesuchten Termine, standardmäßig 3.",
+                },
+            },
+            "required": ["near"],
+            "additionalProperties": False,
+        },
+    }
+
     cancel_booking_description = {
         "type": "function",
         "name": "cancel_booking",
@@ -76,117 +141,348 @@ class CalTool:
     def get_create_booking_description(self) -> str:
         return self.create_booking_description
 
+    @classmethod
+    def get_find_free_slots_description(self) -> str:
+        return self.find_free_slots_description
+
     @classmethod
     def get_cancel_booking_description(self) -> str:
         return self.cancel_booking_description
 
     @classmethod
-    def create_booking(
-        self, start: str, attendee_name: str, additonal_notes: str = None
+    def _headers(self) -> dict:
+        return {
+            "cal-api-version": "2024-08-13",
+            "Authorization": f"Bearer {CAL_API_KEY}",
+        }
+
+    @classmethod
+    def _describe_free_slots(self, near: str, count: int = 3) -> str:
+        try:
+            near_time = parse_time(near)
+        except (TypeError, ValueError):
+            return "Ungültiger Zeitpunkt. Beispiel des korrekten Formats: 2024-08-13T09:00:00Z"
+        slots = availability.find_free_slots(near_time, count or 3)
+        if not slots:
+            return f"In den nächsten {AVAILABILITY_DAYS} Tagen ist kein Termin frei."
+        return "Freie Termine: " + ", ".join(format_time(slot) for slot in slots)
+
+    @classmethod
+    async def find_free_slots(self, near: str, count: int = 3) -> str:
+        """Answer from the in-memory index, without a request to cal.com."""
+        return self._describe_free_slots(near, count)
+
+    @classmethod
+    async def create_booking(
+        self,
+        start: str,
+        attendee_name: str,
+        additonal_notes: str = None,
+        call_id: str = None,
     ):
-        url = "https://api.cal.com/v2/bookings"
-        payload = {
+        arguments = {
             "start": start,
-            "eventTypeId": 1479842,
+            "attendee_name": attendee_name,
+            "additonal_notes": additonal_notes,
+        }
+        key = idempotency_key("create_booking", call_id, arguments)
+        # A re-emitted call gets its original answer, its slot is taken by now
+        replayed = cal_requests.completed(key) is not None
+        try:
+            start_time = parse_time(start)
+        except (TypeError, ValueError):
+            start_time = None
+
+        arguments_key = idempotency_key("create_booking", None, arguments)
+        task = bookings_in_flight.get(arguments_key)
+        if task is None:
+            task = asyncio.create_task(
+                self._book_slot(start, start_time, attendee_name, additonal_notes, key, replayed)
+            )
+            bookings_in_flight[arguments_key] = task
+            task.add_done_callback(lambda _: bookings_in_flight.pop(arguments_key, None))
+        # Callers joined onto this booking still get its answer when the one
+        # that started it times out or hangs up
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _book_slot(
+        self,
+        start: str,
+        start_time: datetime | None,
+        attendee_name: str,
+        additonal_notes: str,
+        key: str,
+        replayed: bool,
+    ) -> str:
+        # Bookings of the same slot wait for each other, in this worker and on
+        # the others of the host, so the later one finds the earlier one's
+        # booking in the index instead of asking cal.com
+        async with shared_state.slot_lock(format_time(start_time) if start_time else str(start)):
+            await shared_state.sync_bookings(availability, bookings_cache)
+            return await self._book(
+                start, start_time, attendee_name, additonal_notes, key, replayed
+            )
+
+    @classmethod
+    async def _book(
+        self,
+        start: str,
+        start_time: datetime | None,
+        attendee_name: str,
+        additonal_notes: str,
+        key: str,
+        replayed: bool,
+    ) -> str:
+        # Reject slots that are known to be impossible without asking cal.com,
+        # and offer the closest free ones instead
+        reason = availability.check_slot(start_time) if start_time and not replayed else None
+        if reason is not None:
+            return (
+                f"Kalendereintrag konnte nicht gebucht werden, {UNAVAILABLE_REASONS[reason]}. "
+                + self._describe_free_slots(start)
+            )
+
+        payload = {
+            "start": utc_time(start_time) if start_time else start,
+            "eventTypeId": CAL_EVENT_TYPE_ID,
             "attendee": {
                 "name": attendee_name,
                 "email": "john.doe@example.com",
-                "timeZone": "Europe/Berlin",
+                "timeZone": PRACTICE_TZ,
                 "language": "de",
             },
         }
         if additonal_notes:
             payload["metadata"] = {"additonal_notes": additonal_notes}
 
-        headers = {
-            "cal-api-version": "2024-08-13",
-            "Content-Type": "application/json",
-            "Auhtorization": f"Bearer {CAL_API_KEY}",
-        }
-
-        response = requests.request("POST", url, json=payload, headers=headers)
+        try:
+            response = await cal_requests.request(
+                "POST",
+                "/v2/bookings",
+                json=payload,
+                headers=self._headers(),
+                idempotency_key=key,
+                repeatable=False,
+            )
+            response = response.json()
+        except CircuitOpenError as e:
+            log("create_booking.error", level="error", error=repr(e))
+            tool_errors["create_booking"].inc()
+            return CAL_UNAVAILABLE
+        except (httpx.HTTPError, ValueError) as e:
+            log("create_booking.error", level="error", error=repr(e))
+            # Not sent again, but it may have gone through before the
+            # response was lost
+            booking = await self._find_created_booking(start_time, attendee_name)
+            if booking is None:
+                tool_errors["create_booking"].inc()
+                return "Kalendereintrag konnte nicht gebucht werden. Anderes Datum oder Uhrzeit versuchen."
+            log("create_booking.recovered", uid=booking.get("uid"))
+            response = {"status": "success", "data": booking}
 
-        response = json.loads(response.text)
         response_result = response.get("status")
 
         if response_result == "error":
             return "Kalendereintrag konnte nicht gebucht werden. Anderes Datum oder Uhrzeit versuchen."
 
         booking_uid = response["data"]["uid"]
+        if not replayed:
+            bookings_cache.add_booking(practice_day(start), response["data"])
+            availability.add_booking(response["data"])
+            await shared_state.record_booking(response["data"])
         return f"Kalendereintrag konnte erfolgreich gebucht werden. bookingUid: {booking_uid}"
 
     @classmethod
-    def cancel_booking(
-        self, uid: str = None, start: str = None, attendee_name: str = None
-    ):
-        headers = {
-            "cal-api-version": "2024-08-13",
-            "Authorization": f"Bearer {CAL_API_KEY}",
-        }
+    async def _find_created_booking(
+        self, start_time: datetime | None, attendee_name: str
+    ) -> dict | None:
+        """The booking of ``attendee_name`` at ``start_time``, if cal.com has it."""
+        if start_time is None:
+            return None
+        try:
+            bookings = await self._fetch_day_bookings(start_time.date().isoformat())
+        except (CircuitOpenError, httpx.HTTPError, RuntimeError, ValueError) as e:
+            log("create_booking.lookup.error", level="error", error=repr(e))
+            return None
+        for booking in bookings:
+            if (
+                booking.get("status", "accepted") == "accepted"
+                and booking_attendee_name(booking) == attendee_name
+                and parse_time(booking["start"]) == start_time
+            ):
+                return booking
+        return None
 
-        # If uid is available from conversation, cancel directly
-        if uid:
-            url = f"https://api.cal.com/v2/bookings/{uid}/cancel"
-            response = requests.request("POST", url, headers=headers)
-
-        # Otherwise we have to find uid from date and name
-        # We assume that we at least have the correct date
-        # However, name might not be spelled correctly
-        else:
-            input_date = datetime.strptime(start, "%Y-%m-%d")
-            start_datetime = input_date.replace(
-                hour=7, minute=0, second=0, microsecond=0
-            )
-            end_datetime = input_date.replace(
-                hour=22, minute=0, second=0, microsecond=0
-            )
-            start_datetime_str = start_datetime.strftime(
-                "%Y-%m-%dT%H:%M:%S.000Z")
-            end_datetime_str = end_datetime.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-
-            url = f"https://api.cal.com/v2/bookings?afterStart={start_datetime_str}&beforeEnd={end_datetime_str}"
-            response = requests.request("GET", url, headers=headers)
-
-            # Use OpenAI to find the correct entry from list of calendar entries
-            # This allows fuzzy inputs for name and accounts for misspelling
-            client = OpenAI()
-            response_text = str(response.text)
-
-            with open(FIND_CALENDAR_ENTRIES) as file:
-                find_calendar_entries_prompt = file.read()
-            find_calendar_entries_prompt = find_calendar_entries_prompt.replace(
-                "{{attendee_name}}", attendee_name
-            )
-            find_calendar_entries_prompt = find_calendar_entries_prompt.replace(
-                "{{start}}", start
+    @classmethod
+    def _parse_bookings(self, response: dict) -> list[dict]:
+        data = response.get("data") or []
+        if isinstance(data, dict):
+            data = data.get("bookings", [])
+        return data
+
+    @classmethod
+    async def fetch_bookings(self, after_start: str, before_end: str) -> list[dict]:
+        """Load the bookings of the appointment event type in a time range.
+
+        Follows cal.com's pagination. A full page without pagination info
+        may be cut off, that fails rather than passing for the whole range.
+        """
+        bookings = []
+        while True:
+            response = await cal_requests.request(
+                "GET",
+                "/v2/bookings",
+                params={
+                    "afterStart": after_start,
+                    "beforeEnd": before_end,
+                    "eventTypeId": CAL_EVENT_TYPE_ID,
+                    "take": CAL_BOOKINGS_PAGE_SIZE,
+                    "skip": len(bookings),
+                },
+                headers=self._headers(),
             )
+            response.raise_for_status()
+            body = response.json()
+            page = self._parse_bookings(body)
+            bookings.extend(page)
+            pagination = body.get("pagination")
+            if pagination is None:
+                if len(page) >= CAL_BOOKINGS_PAGE_SIZE:
+                    raise RuntimeError(f"bookings truncated at {len(bookings)}, no pagination")
+                return bookings
+            if not pagination.get("hasNextPage") or not page:
+                return bookings
 
-            completion = client.beta.chat.completions.parse(
+    @classmethod
+    async def _fetch_day_bookings(self, day: str) -> list[dict]:
+        """Load all bookings of a practice day (07:00 to 22:00) from cal.com."""
+        input_date = datetime.strptime(day, "%Y-%m-%d")
+        start_datetime = input_date.replace(
+            hour=7, minute=0, second=0, microsecond=0)
+        end_datetime = input_date.replace(
+            hour=22, minute=0, second=0, microsecond=0)
+        return await self.fetch_bookings(utc_time(start_datetime), utc_time(end_datetime))
+
+    @classmethod
+    async def _find_booking_with_llm(
+        self, bookings: list[dict], start: str, attendee_name: str
+    ) -> CalendarBookingInformation | None:
+        """Use OpenAI to find the correct entry from list of calendar entries.
+
+        Raises ``ValueError`` if the request fails.
+        """
+        # Loaded with the client, by the warm-up or on first use
+        client = await load_openai_client()
+        from openai import OpenAIError
+
+        with open(FIND_CALENDAR_ENTRIES) as file:
+            find_calendar_entries_prompt = file.read()
+        find_calendar_entries_prompt = find_calendar_entries_prompt.replace(
+            "{{attendee_name}}", attendee_name
+        )
+        find_calendar_entries_prompt = find_calendar_entries_prompt.replace(
+            "{{start}}", start
+        )
+
+        try:
+            completion = await client.beta.chat.completions.parse(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": find_calendar_entries_prompt},
-                    {"role": "user", "content": response_text},
+                    {"role": "user", "content": json.dumps(bookings)},
                 ],
                 response_format=CalendarBookingInformation,
             )
-            calendar_booking_information = completion.choices[0].message.parsed
+        except OpenAIError as e:
+            raise ValueError(f"booking lookup failed: {e!r}") from e
+        return completion.choices[0].message.parsed
+
+    @classmethod
+    async def cancel_booking(
+        self,
+        uid: str = None,
+        start: str = None,
+        attendee_name: str = None,
+        call_id: str = None,
+    ):
+        headers = self._headers()
+        key = idempotency_key(
+            "cancel_booking",
+            call_id,
+            {"uid": uid, "start": start, "attendee_name": attendee_name},
+        )
+
+        try:
+            # If uid is available from conversation, cancel directly
+            if uid:
+                response = await cal_requests.request(
+                    "POST",
+                    f"/v2/bookings/{uid}/cancel",
+                    headers=headers,
+                    idempotency_key=key,
+                )
 
-            url = f"https://api.cal.com/v2/bookings/{calendar_booking_information.uid}/cancel"
-            response = requests.request("POST", url, headers=headers)
+            # Otherwise we have to find uid from date and name
+            # We assume that we at least have the correct date
+            # However, name might not be spelled correctly
+            else:
+                bookings = await bookings_cache.get(
+                    practice_day(start), self._fetch_day_bookings
+                )
+
+                # Match the spoken name locally, this accounts for misspelling
+                # and misheard names without another network round trip
+                match = match_attendee(bookings, attendee_name)
+                calendar_booking_information = match.booking
+
+                # Only let OpenAI decide between candidates that are too close
+                if match.is_ambiguous:
+                    calendar_booking_information = await self._find_booking_with_llm(
+                        match.candidates, start, attendee_name
+                    )
+
+                if calendar_booking_information is None:
+                    return "Kalendereintrag konnte nicht storniert werden."
+
+                uid = calendar_booking_information.uid
+                response = await cal_requests.request(
+                    "POST",
+                    f"/v2/bookings/{uid}/cancel",
+                    headers=headers,
+                    idempotency_key=key,
+                )
+
+            response = response.json()
+        except CircuitOpenError as e:
+            log("cancel_booking.error", level="error", error=repr(e))
+            tool_errors["cancel_booking"].inc()
+            return CAL_UNAVAILABLE
+        except (httpx.HTTPError, ValueError) as e:
+            log("cancel_booking.error", level="error", error=repr(e))
+            tool_errors["cancel_booking"].inc()
+            return "Kalendereintrag konnte nicht storniert werden."
 
-        response = json.loads(response.text)
         response_result = response.get("status")
         if response_result != "success":
             return "Kalendereintrag konnte nicht storniert werden."
 
+        bookings_cache.remove_booking(uid)
+        availability.remove_booking(uid)
+        await shared_state.record_cancellation(uid)
+
         return "Kalendereintrag wurde erfolgreich storniert."
 
 
 if __name__ == "__main__":
     # Function calls for quick integration testing during development
-    CalTool.create_booking(
-        start="2024-12-08T10:00:00Z",
-        attendee_name="Peter Müller",
-        additonal_notes="Zahnreinigung",
-    )
-    CalTool.cancel_booking(start="2024-12-10", attendee_name="Peter Muuhler")
+    async def main():
+        await CalTool.create_booking(
+            start="2024-12-08T10:00:00Z",
+            attendee_name="Peter Müller",
+            additonal_notes="Zahnreinigung",
+        )
+        await CalTool.cancel_booking(start="2024-12-10", attendee_name="Peter Muuhler")
+        await close_clients()
+
+    asyncio.run(main())
@@ -0,0 +1,256 @@
+"""Durable store of call-back requests for the practice team.
+
+``create_call_back`` runs inside a live call, so it only puts the record on
+a bounded in-memory queue and returns. A background thread writes the queue
+to a local SQLite database in WAL mode: whatever has piled up since the last
+commit goes in as one multi-row transaction, so throughput grows with load
+while a single record is committed within milliseconds. ``close`` drains the
+queue on shutdown, what a stuck writer does not reach is written by
+``close`` itself. Records are only lost if the process dies in the few
+milliseconds between enqueue and commit.
+
+Reads for the practice team use their own connections and never block the
+writer, WAL lets them see the last committed state.
+"""
+
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from app.background_writer import BackgroundWriter
+from app.config import CALLBACK_BATCH_SIZE, CALLBACK_DB_PATH, CALLBACK_QUEUE_SIZE
+from app.event_log import log
+from app.metrics import registry
+
+# Attempts to commit a batch before its records are given up
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+# Recent enqueue-to-commit latencies kept for inspection
+LATENCY_SAMPLES = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callbacks (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open',
+    name TEXT NOT NULL,
+    preferred_contact TEXT NOT NULL,
+    description TEXT NOT NULL,
+    call_id TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS callbacks_status_created ON callbacks (status, created_at);
+CREATE INDEX IF NOT EXISTS callbacks_created ON callbacks (created_at);
+"""
+
+# A repeated call_id is the model re-emitting a call, the first one stays.
+# Any other constraint violation fails the row, and it is logged.
+INSERT = """
+INSERT INTO callbacks (created_at, name, preferred_contact, description, call_id)
+VALUES (:created_at, :name, :preferred_contact, :description, :call_id)
+ON CONFLICT(call_id) DO NOTHING
+"""
+
+_rejected = registry.counter(
+    "tooth_call_callbacks_rejected_total",
+    "Call-back requests not queued because the writer fell behind.",
+)
+
+
+def connect(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=5.0, check_same_thread=check_same_thread)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL survives a crash of the app, only power loss may
+    # lose the last transactions
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class CallbackStore(BackgroundWriter):
+    thread_name = "callback-writer"
+    error_event = "callback_store.write.error"
+
+    def __init__(
+        self,
+        path: str = CALLBACK_DB_PATH,
+        queue_size: int = CALLBACK_QUEUE_SIZE,
+        batch_size: int = CALLBACK_BATCH_SIZE,
+    ):
+        super().__init__(queue_size)
+        self.path = path
+        self.batch_size = batch_size
+        self._connection: sqlite3.Connection | None = None
+        self.written = 0
+        self.rejected = 0
+        self.failed = 0
+        # Rows rejected by the database or repeating a call_id
+        self.skipped = 0
+        self.batches = 0
+        # Seconds from enqueue to commit, written by the writer thread
+        self.flush_latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def enqueue(
+        self, name: str, preferred_contact: str, description: str, call_id: str = None
+    ) -> bool:
+        """Queue a call-back request. Non-blocking, False if it was not taken.
+
+        Raises ``ValueError`` if a required field is empty, the row would be
+        rejected by the database after the caller was told it is noted.
+        """
+        for field, value in (
+            ("name", name),
+            ("preferred_contact", preferred_contact),
+            ("description", description),
+        ):
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"{field} is required")
+        if self._thread is None:
+            self.start()
+        record = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "name": name,
+            "preferred_contact": preferred_contact,
+            "description": description,
+            "call_id": call_id,
+        }
+        if not self.put((time.monotonic(), record)):
+            self.rejected += 1
+            _rejected.inc()
+            return False
+        return True
+
+    def _prepare(self):
+        connection = connect(self.path)
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    def _insert(self, connection: sqlite3.Connection, batch: list) -> int:
+        """Insert a batch in one transaction, return how many rows were skipped."""
+        records = [record for _, record in batch]
+        try:
+            with connection:
+                if connection.executemany(INSERT, records).rowcount == len(records):
+                    return 0
+                # Rows were skipped, go again row by row to log them
+                connection.rollback()
+        except sqlite3.IntegrityError:
+            pass
+        return self._insert_rows(connection, records)
+
+    def _insert_rows(self, connection: sqlite3.Connection, records: list[dict]) -> int:
+        skipped = 0
+        with connection:
+            for record in records:
+                try:
+                    inserted = connection.execute(INSERT, record).rowcount
+                except sqlite3.IntegrityError as e:
+                    log(
+                        "callback_store.row.rejected",
+                        level="error",
+                        call_id=record["call_id"],
+                        error=repr(e),
+                    )
+                    skipped += 1
+                    continue
+                if not inserted:
+                    log("callback_store.row.duplicate", call_id=record["call_id"])
+                    skipped += 1
+        return skipped
+
+    def _commit(self, connection: sqlite3.Connection, batch: list) -> int | None:
+        """Rows skipped of a committed batch, None if it could not be written."""
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                return self._insert(connection, batch)
+            except sqlite3.Error as e:
+                log(
+                    "callback_store.write.error",
+                    level="error",
+                    error=repr(e),
+                    attempt=attempt,
+                )
+                time.sleep(RETRY_DELAY)
+        return None
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """Write what is queued and stop the writer thread.
+
+        What the writer has not reached after ``timeout`` seconds is written
+        from here, the callers were told their request is noted.
+        """
+        if super().close(timeout):
+            return True
+        batch = self._take_queued()
+        if batch:
+            log("callback_store.close.draining", level="warning", records=len(batch))
+            connection = connect(self.path)
+            try:
+                for start in range(0, len(batch), self.batch_size):
+                    self._store(connection, batch[start : start + self.batch_size])
+            finally:
+                connection.close()
+        return False
+
+    def _handle_batch(self, batch: list):
+        if self._connection is None:
+            self._connection = connect(self.path)
+        self._store(self._connection, batch)
+
+    def _store(self, connection: sqlite3.Connection, batch: list):
+        skipped = self._commit(connection, batch)
+        if skipped is None:
+            self.failed += len(batch)
+            return
+        committed_at = time.monotonic()
+        self.flush_latencies.extend(committed_at - queued_at for queued_at, _ in batch)
+        self.written += len(batch) - skipped
+        self.skipped += skipped
+        self.batches += 1
+
+    def _finish(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def query(
+        self,
+        status: str = None,
+        since: str = None,
+        until: str = None,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Newest call-back requests, optionally by status and ISO date range.
+
+        ``since`` is inclusive and ``until`` exclusive, a bare date means the
+        start of that day in UTC. Blocking, run it in a thread.
+        """
+        conditions, parameters = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            parameters.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        connection.row_factory = sqlite3.Row
+        try:
+            rows = connection.execute(
+                f"SELECT * FROM callbacks {where} ORDER BY created_at DESC LIMIT ?",
+                (*parameters, limit),
+            ).fetchall()
+        finally:
+            connection.close()
+        return [dict(row) for row in rows]
+
+
+callback_store = CallbackStore()
+registry.gauge(
+    "tooth_call_callback_queue_depth",
+    "Call-back requests waiting to be written.",
+    callback_store.pending,
+)
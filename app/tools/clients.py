@@ -0,0 +1,124 @@
+"""Process-wide async HTTP clients shared by all tools.
+
+Every tool call of every live session goes through the same keep-alive
+connection pools, so a booking does not pay a fresh TLS handshake and never
+blocks the event loop that forwards audio for the other calls.
+
+Building them is not free: the OpenAI SDK takes longer to import than the
+rest of the app, and loading the certificates blocks as well. ``warm_up``
+does both in a worker thread, so that a new worker can accept calls before
+it is done, and the clients themselves are then built once, on the loop.
+Tools use ``load_openai_client``, which never imports the SDK on the loop.
+"""
+
+import asyncio
+import functools
+import ssl
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+
+from app.config import (
+    CAL_API_BASE_URL,
+    TOOL_HTTP_CONNECT_TIMEOUT,
+    TOOL_HTTP_KEEPALIVE_EXPIRY,
+    TOOL_HTTP_MAX_CONNECTIONS,
+    TOOL_HTTP_MAX_KEEPALIVE,
+    TOOL_HTTP_TIMEOUT,
+)
+from app.event_log import log
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_cal_client: httpx.AsyncClient | None = None
+_openai_client: "AsyncOpenAI | None" = None
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(TOOL_HTTP_TIMEOUT, connect=TOOL_HTTP_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=TOOL_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=TOOL_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=TOOL_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+@functools.cache
+def _ssl_context() -> ssl.SSLContext:
+    # Loading the CA bundle is the slow part of creating a client, share it
+    return httpx.create_ssl_context()
+
+
+def get_cal_client() -> httpx.AsyncClient:
+    """Return the shared cal.com client, creating it on first use."""
+    global _cal_client
+    if _cal_client is None or _cal_client.is_closed:
+        _cal_client = httpx.AsyncClient(
+            base_url=CAL_API_BASE_URL,
+            timeout=_timeout(),
+            limits=_limits(),
+            verify=_ssl_context(),
+        )
+    return _cal_client
+
+
+def get_openai_client() -> "AsyncOpenAI":
+    """Return the shared OpenAI client, creating it on first use."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+
+        _openai_client = AsyncOpenAI(
+            timeout=_timeout(),
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=_timeout(), limits=_limits(), verify=_ssl_context()
+            ),
+        )
+    return _openai_client
+
+
+def _load_dependencies():
+    _ssl_context()
+    # Importing the SDK is most of the work
+    import openai
+
+
+async def load_openai_client() -> "AsyncOpenAI":
+    """Return the shared OpenAI client, loading the SDK off the event loop.
+
+    Waits for a warm-up that is still importing it instead of blocking the
+    audio of the other calls on the import lock.
+    """
+    if _openai_client is None:
+        await asyncio.to_thread(_load_dependencies)
+    return get_openai_client()
+
+
+async def warm_up():
+    """Load what the clients need off the event loop, then build them."""
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(_load_dependencies)
+        get_cal_client()
+        get_openai_client()
+    except Exception as e:
+        log("clients.warm_up.error", level="error", error=repr(e))
+        return
+    log("clients.warmed_up", seconds=round(time.monotonic() - started, 3))
+
+
+async def close_clients():
+    """Close the shared clients. Called on application shutdown."""
+    global _cal_client, _openai_client
+    if _cal_client is not None:
+        await _cal_client.aclose()
+        _cal_client = None
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
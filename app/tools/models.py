@@ -0,0 +1,10 @@
+"""Data models shared by the calendar tools.
+"""
+
+from pydantic import BaseModel
+
+
+class CalendarBookingInformation(BaseModel):
+    uid: str
+    attendee_name: str
+    start: str
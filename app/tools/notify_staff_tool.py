@@ -1,3 +1,7 @@
+from app.event_log import log
+from app.tools.callback_store import callback_store
+
+
 class NotifyStaffTool():
     create_call_back_description = {
         "type": "function",
@@ -26,8 +30,22 @@ class NotifyStaffTool():
         return self.create_call_back_description
 
     @classmethod
-    def create_call_back() -> str:
-        """Not yet implemented.
-        TODO: Add database interaction.
-        """
+    async def create_call_back(
+        self,
+        description: str,
+        name: str,
+        preferred_contact: str,
+        call_id: str = None,
+    ) -> str:
+        """Queue the request, it is written to the database in the background."""
+        try:
+            queued = callback_store.enqueue(name, preferred_contact, description, call_id)
+        except ValueError as e:
+            log("create_call_back.invalid", level="error", call_id=call_id, error=str(e))
+            return (
+                "Rückrufbitte konnte nicht notiert werden. "
+                "Frage den Anrufer nach Name, Kontaktweg und Anliegen."
+            )
+        if not queued:
+            return "Rückrufbitte konnte nicht notiert werden."
         return ("Rückrufbitte erfolgreich notiert.")
@@ -0,0 +1,164 @@
+"""Tools the model may call, and how their calls are run.
+
+Every tool is declared once with its schema, an async handler, a timeout and
+the instruction for the response that follows its result. The session
+advertises the schemas and dispatches function calls by name through the
+registry. A call never leaves the model waiting: if its handler fails or
+runs into its timeout, the caller hears the tool's fallback answer instead.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from app.config import TOOL_CALL_TIMEOUT
+from app.event_log import log
+from app.metrics import tool_duration_seconds, tool_errors, tool_timeouts
+from app.tools.cal_tool import CalTool
+from app.tools.notify_staff_tool import NotifyStaffTool
+
+DEFAULT_FOLLOW_UP = "Teile dem Nutzer das Ergebnis mit."
+DEFAULT_FALLBACK = (
+    "Das System antwortet gerade nicht. Biete dem Anrufer an, dass das Praxisteam zurückruft."
+)
+
+
+@dataclass(frozen=True)
+class Tool:
+    description: dict
+    handler: Callable[..., Awaitable[str]]
+    follow_up: str = DEFAULT_FOLLOW_UP
+    timeout: float = TOOL_CALL_TIMEOUT
+    fallback: str = DEFAULT_FALLBACK
+    # Pass the model's call_id to the handler, e.g. for idempotency keys
+    takes_call_id: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.description["name"]
+
+    @property
+    def parameters(self) -> dict:
+        return self.description["parameters"]["properties"]
+
+
+@dataclass(frozen=True)
+class ToolResult:
+    output: str
+    follow_up: str
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: dict[str, Tool] = {}
+
+    def register(self, tool: Tool):
+        self._tools[tool.name] = tool
+
+    def get(self, name: str) -> Tool | None:
+        return self._tools.get(name)
+
+    def descriptions(self) -> list[dict]:
+        """Schemas for the ``tools`` of the session, in registration order."""
+        return [tool.description for tool in self._tools.values()]
+
+    async def call(
+        self, name: str, arguments: str, call_id: str = None, stream_sid: str = None
+    ) -> ToolResult:
+        """Run one function call of the model, always with an answer."""
+        tool = self._tools.get(name)
+        if tool is None:
+            log(
+                "function_call.error",
+                level="error",
+                stream_sid=stream_sid,
+                name=name,
+                error="unknown tool",
+            )
+            return ToolResult(DEFAULT_FALLBACK, DEFAULT_FOLLOW_UP)
+
+        started = time.monotonic()
+        try:
+            # The model may invent arguments, only the declared ones are passed on
+            kwargs = {
+                key: value
+                for key, value in json.loads(arguments or "{}").items()
+                if key in tool.parameters
+            }
+            if tool.takes_call_id:
+                kwargs["call_id"] = call_id
+            async with asyncio.timeout(tool.timeout):
+                output = await tool.handler(**kwargs)
+        except TimeoutError:
+            log(
+                "function_call.timeout",
+                level="error",
+                stream_sid=stream_sid,
+                name=name,
+                timeout=tool.timeout,
+            )
+            tool_timeouts[name].inc()
+            output = tool.fallback
+        except Exception as e:
+            log(
+                "function_call.error",
+                level="error",
+                stream_sid=stream_sid,
+                name=name,
+                error=repr(e),
+            )
+            tool_errors[name].inc()
+            output = tool.fallback
+        finally:
+            tool_duration_seconds[name].time_since(started)
+        return ToolResult(output or tool.fallback, tool.follow_up)
+
+
+tool_registry = ToolRegistry()
+tool_registry.register(
+    Tool(
+        CalTool.get_create_booking_description(),
+        CalTool.create_booking,
+        takes_call_id=True,
+        follow_up="Teile dem Nutzer das Ergebnis der Terminbuchung mit.",
+        fallback=(
+            "Die Terminbuchung konnte nicht rechtzeitig bestätigt werden. "
+            "Biete dem Anrufer an, dass das Praxisteam zurückruft und den Termin bestätigt."
+        ),
+    )
+)
+tool_registry.register(
+    Tool(
+        CalTool.get_find_free_slots_description(),
+        CalTool.find_free_slots,
+        follow_up="Schlage dem Nutzer die freien Termine vor.",
+        # Answered from memory, anything slow is a bug
+        timeout=2.0,
+    )
+)
+tool_registry.register(
+    Tool(
+        CalTool.get_cancel_booking_description(),
+        CalTool.cancel_booking,
+        takes_call_id=True,
+        follow_up="Teile dem Nutzer das Ergebnis der Stornierung mit.",
+        fallback=(
+            "Die Stornierung konnte nicht rechtzeitig bestätigt werden. "
+            "Biete dem Anrufer an, dass das Praxisteam zurückruft und die Stornierung bestätigt."
+        ),
+    )
+)
+tool_registry.register(
+    Tool(
+        NotifyStaffTool.get_create_call_back_description(),
+        NotifyStaffTool.create_call_back,
+        takes_call_id=True,
+        follow_up="Teile dem Nutzer mit, ob die Rückrufbitte notiert wurde.",
+        fallback=(
+            "Die Rückrufbitte konnte nicht gespeichert werden. "
+            "Bitte den Anrufer, es später noch einmal zu versuchen."
+        ),
+    )
+)
@@ -0,0 +1,259 @@
+"""Resilient requests to an external HTTP API.
+
+Calls to cal.com decide whether a caller's appointment exists, so a network
+blip must neither double-book nor end in a failure message for a booking
+that went through. ``ResilientRequests`` wraps the shared client:
+
+- writes carry an idempotency key derived from the model's ``call_id`` and
+  the arguments, a re-emitted call is answered from memory for a while,
+- identical requests in flight at the same time share one upstream request,
+- transient errors (connection problems, timeouts, 5xx, 429) are retried
+  with jittered exponential backoff while a latency budget lasts,
+- cal.com does not document that it honours the ``Idempotency-Key`` header,
+  so writes that must not be applied twice (``repeatable=False``) are only
+  retried when the request cannot have been applied: it was not sent, or it
+  was turned away with 429 or 503,
+- a circuit breaker opens after consecutive transient failures and rejects
+  requests right away until a probe succeeds again.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import httpx
+
+from app.config import TOOL_HTTP_CONNECT_TIMEOUT, TOOL_HTTP_TIMEOUT
+from app.metrics import registry
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# Completed writes answered from memory, against re-emitted function calls
+COMPLETED_TTL = 600.0
+COMPLETED_MAX_ENTRIES = 1024
+
+_retries = registry.counter(
+    "tooth_call_http_retries_total",
+    "Retried requests to external APIs after a transient error.",
+    ("api",),
+)
+_rejected = registry.counter(
+    "tooth_call_http_breaker_rejections_total",
+    "Requests to external APIs rejected by an open circuit breaker.",
+    ("api",),
+)
+_deduplicated = registry.counter(
+    "tooth_call_http_deduplicated_total",
+    "Requests to external APIs answered by an identical one in flight or completed.",
+    ("api",),
+)
+
+
+class CircuitOpenError(Exception):
+    """The API is considered degraded, the request was not sent."""
+
+
+def idempotency_key(operation: str, call_id: str | None, arguments: dict) -> str:
+    """Stable key for one function call of the model and its arguments."""
+    canonical = json.dumps([operation, call_id, arguments], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_transient(response: httpx.Response) -> bool:
+    return response.status_code >= 500 or response.status_code == 429
+
+
+# Errors and statuses after which the API cannot have applied a request
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+NOT_APPLIED_STATUSES = (429, 503)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single probe when half open."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self):
+        """A request ended without an outcome, e.g. it was cancelled."""
+        self._probing = False
+
+
+class ResilientRequests:
+    def __init__(
+        self,
+        api: str,
+        get_client: Callable[[], httpx.AsyncClient],
+        breaker: CircuitBreaker,
+        budget: float,
+        base_delay: float,
+        max_delay: float,
+    ):
+        self.get_client = get_client
+        self.breaker = breaker
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._completed: OrderedDict[str, tuple[float, httpx.Response]] = OrderedDict()
+        self._retries = _retries.labels(api)
+        self._rejected = _rejected.labels(api)
+        self._deduplicated = _deduplicated.labels(api)
+
+    def completed(self, key: str) -> httpx.Response | None:
+        """Response of a write with this idempotency key, if it is recent."""
+        entry = self._completed.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > COMPLETED_TTL:
+            del self._completed[key]
+            return None
+        return entry[1]
+
+    def _remember(self, key: str, response: httpx.Response):
+        self._completed[key] = (time.monotonic(), response)
+        self._completed.move_to_end(key)
+        while len(self._completed) > COMPLETED_MAX_ENTRIES:
+            self._completed.popitem(last=False)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        idempotency_key: str = None,
+        headers: dict = None,
+        repeatable: bool = True,
+        **kwargs,
+    ) -> httpx.Response:
+        """Send a request, retried and deduplicated.
+
+        Raises ``CircuitOpenError`` while the API is degraded and the last
+        ``httpx.HTTPError`` once the budget is spent. Other 4xx responses
+        are returned like successful ones. A request that is not
+        ``repeatable`` raises right away if it may have been applied.
+        """
+        if idempotency_key is not None:
+            response = self.completed(idempotency_key)
+            if response is not None:
+                self._deduplicated.inc()
+                return response
+            headers = {**(headers or {}), IDEMPOTENCY_HEADER: idempotency_key}
+
+        key = (
+            method,
+            url,
+            json.dumps(kwargs.get("json"), sort_keys=True),
+            json.dumps(kwargs.get("params"), sort_keys=True),
+        )
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                self._send(method, url, idempotency_key, headers, repeatable, kwargs)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self._deduplicated.inc()
+        # Callers deduplicated onto this request keep waiting for it when the
+        # one that started it is cancelled
+        return await asyncio.shield(task)
+
+    def _finished(self, key: tuple, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved, all callers may have gone
+            task.exception()
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        idempotency_key: str,
+        headers: dict,
+        repeatable: bool,
+        kwargs: dict,
+    ) -> httpx.Response:
+        deadline = time.monotonic() + self.budget
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._rejected.inc()
+                raise CircuitOpenError(f"{url} is unavailable")
+            if attempt:
+                # Retries must not outlast the budget
+                remaining = max(deadline - time.monotonic(), 0.01)
+                kwargs["timeout"] = httpx.Timeout(
+                    min(TOOL_HTTP_TIMEOUT, remaining),
+                    connect=min(TOOL_HTTP_CONNECT_TIMEOUT, remaining),
+                )
+            try:
+                response = await self.get_client().request(
+                    method, url, headers=headers, **kwargs
+                )
+            except httpx.TransportError as e:
+                error = e
+                applied = not isinstance(e, NOT_SENT_ERRORS)
+            except BaseException:
+                # Cancelled, or no outcome to judge the API by, e.g. a closed
+                # client. A half open breaker must not keep waiting for it.
+                self.breaker.abandon()
+                raise
+            else:
+                if not is_transient(response):
+                    self.breaker.record_success()
+                    if idempotency_key is not None:
+                        self._remember(idempotency_key, response)
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} from {url}",
+                    request=response.request,
+                    response=response,
+                )
+                applied = response.status_code not in NOT_APPLIED_STATUSES
+
+            self.breaker.record_failure()
+            if applied and not repeatable:
+                raise error
+            attempt += 1
+            # Full jitter, so callers hit by the same blip do not retry in step
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+            if time.monotonic() + delay >= deadline:
+                raise error
+            self._retries.inc()
+            await asyncio.sleep(delay)
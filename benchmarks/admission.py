@@ -0,0 +1,220 @@
+"""Admission control, end to end and under a surge of calls.
+
+1. Through the app, against the fake Realtime API, with room for one call
+   and one waiting call: the second caller hears the hold message and gets
+   the assistant once the first hangs up, the third is closed with 1013.
+   Rate limits reported upstream hold back the next call until they reset.
+2. A surge of callers against one event loop, each call costing
+   ``CALL_CPU`` of CPU per 20 ms frame. Measured is how late the frames of
+   calls in progress are, without admission control and with the event-loop
+   lag limit.
+
+Run with ``python -m benchmarks.admission``.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+SURGE_CALLS = 120
+SURGE_SECONDS = 6.0
+CALL_SECONDS = 6.0
+FRAME_SECONDS = 0.02
+CALL_CPU = 0.0005
+LAG_LIMIT = 0.02
+
+
+def write_hold_message(path: str):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(24000)
+        wav.writeframes((np.sin(np.arange(24000) / 8) * 2000).astype("<i2").tobytes())
+
+
+class Caller:
+    def __init__(self, app_url: str, api_key: str, stream_sid: str):
+        self.app_url = app_url
+        self.api_key = api_key
+        self.stream_sid = stream_sid
+        self.events: list[dict] = []
+        self.close_code = None
+
+    async def run(self, hang_up: asyncio.Event):
+        import websockets
+
+        async with websockets.connect(
+            f"{self.app_url}/media-stream",
+            additional_headers={"Authorization": f"Bearer {self.api_key}"},
+        ) as websocket:
+            receiving = asyncio.create_task(self._receive(websocket))
+            hanging_up = asyncio.create_task(hang_up.wait())
+            with contextlib.suppress(websockets.ConnectionClosed):
+                await websocket.send(json.dumps({"event": "start", "start": {"streamSid": self.stream_sid}}))
+            await asyncio.wait({receiving, hanging_up}, return_when=asyncio.FIRST_COMPLETED)
+            receiving.cancel()
+            hanging_up.cancel()
+        self.close_code = websocket.close_code
+
+    async def _receive(self, websocket):
+        async for message in websocket:
+            self.events.append(json.loads(message))
+
+    def count(self, event: str) -> int:
+        return sum(item["event"] == event for item in self.events)
+
+
+async def until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+async def end_to_end(directory: str) -> dict:
+    from test_client.fake_realtime_server import FakeRealtimeServer
+    from test_client.servers import serve_in_background
+
+    fake_realtime = FakeRealtimeServer()
+    async with fake_realtime.serve() as realtime_url:
+        os.environ.update(
+            API_AUTH_KEY="admission",
+            OPENAI_API_KEY="admission",
+            REALTIME_API_URL=realtime_url,
+            CAL_API_BASE_URL="http://127.0.0.1:9",
+            CALLBACK_DB_PATH=os.path.join(directory, "callbacks.db"),
+            GREETING_CACHE="false",
+            HOLD_MESSAGE_PATH=os.path.join(directory, "hold.wav"),
+            ADMISSION_MAX_SESSIONS="1",
+            ADMISSION_MAX_QUEUE="1",
+        )
+        write_hold_message(os.environ["HOLD_MESSAGE_PATH"])
+
+        from app.api.media_stream.admission import admission_controller
+        from app.main import app
+
+        async with serve_in_background(app) as base_url:
+            app_url = base_url.replace("http", "ws")
+            first, second, third = (Caller(app_url, "admission", sid) for sid in ("MZfirst", "MZsecond", "MZthird"))
+            first_hangs_up, second_hangs_up, never = asyncio.Event(), asyncio.Event(), asyncio.Event()
+            tasks = [asyncio.create_task(first.run(first_hangs_up))]
+            await until(lambda: first.count("media"))
+            tasks.append(asyncio.create_task(second.run(second_hangs_up)))
+            await until(lambda: second.count("media") >= 5)
+            hold_frames = second.count("media")
+            await third.run(never)
+            first_hangs_up.set()
+            await until(lambda: second.count("clear") and second.count("media") > hold_frames + 5)
+            after_admission = second.events[[item["event"] for item in second.events].index("clear") + 1 :]
+            second_hangs_up.set()
+            await asyncio.gather(*tasks)
+
+            # Upstream quota used up for the next 0.5 s
+            admission_controller.update_rate_limits(
+                [{"name": "tokens", "limit": 40000, "remaining": 10, "reset_seconds": 0.5}]
+            )
+            limited = Caller(app_url, "admission", "MZlimited")
+            limited_hangs_up = asyncio.Event()
+            started = time.monotonic()
+            task = asyncio.create_task(limited.run(limited_hangs_up))
+            # Hold message until admitted, then clear
+            await until(lambda: limited.count("clear"))
+            rate_limited_wait = time.monotonic() - started
+            limited_hangs_up.set()
+            await task
+
+    return {
+        "first caller served": first.count("media") > 0,
+        "second caller hold frames": hold_frames,
+        "second caller audio after admission": sum(
+            item["event"] == "media" and item["streamSid"] == "MZsecond" for item in after_admission
+        ),
+        "third caller close code": third.close_code,
+        "wait while rate limited (s)": round(rate_limited_wait, 2),
+    }
+
+
+async def surge(admission: bool) -> dict:
+    from app.api.media_stream.admission import AdmissionController, CallRejected
+
+    controller = AdmissionController(
+        max_sessions=0,
+        max_queue=SURGE_CALLS if admission else 0,
+        queue_timeout=10.0,
+        max_loop_lag=LAG_LIMIT if admission else 0.0,
+        min_tokens=0,
+        min_requests=0,
+    )
+    controller.start()
+    lateness, peak = [], 0
+    outcomes = {"admitted": 0, "rejected": 0}
+
+    async def call():
+        nonlocal peak
+        try:
+            async with controller.slot():
+                outcomes["admitted"] += 1
+                peak = max(peak, controller.active)
+                started = time.perf_counter()
+                for frame in range(int(CALL_SECONDS / FRAME_SECONDS)):
+                    due = started + frame * FRAME_SECONDS
+                    await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                    lateness.append(max(0.0, time.perf_counter() - due))
+                    busy_until = time.perf_counter() + CALL_CPU
+                    while time.perf_counter() < busy_until:
+                        pass
+        except CallRejected:
+            outcomes["rejected"] += 1
+
+    tasks = []
+    for _ in range(SURGE_CALLS):
+        tasks.append(asyncio.create_task(call()))
+        await asyncio.sleep(SURGE_SECONDS / SURGE_CALLS)
+    await asyncio.gather(*tasks)
+    await controller.close()
+    lateness.sort()
+    return {
+        **outcomes,
+        "peak concurrent": peak,
+        "frame lateness p50 ms": round(lateness[len(lateness) // 2] * 1000, 1),
+        "frame lateness p99 ms": round(lateness[int(len(lateness) * 0.99)] * 1000, 1),
+    }
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.redirect_stdout(io.StringIO()):
+            checked = await end_to_end(directory)
+    print("through the app, room for one call and one waiting")
+    for name, value in checked.items():
+        print(f"  {name:<38}{value}")
+
+    without = await surge(admission=False)
+    with_admission = await surge(admission=True)
+    print(
+        f"surge of {SURGE_CALLS} calls over {SURGE_SECONDS:.0f} s, {CALL_CPU * 1000:.1f} ms CPU"
+        f" per {FRAME_SECONDS * 1000:.0f} ms frame"
+    )
+    print(f"  {'':<24}{'no admission':>14}{'lag limit':>12}")
+    for name in without:
+        print(f"  {name:<24}{without[name]:>14}{with_admission[name]:>12}")
+
+    assert checked["first caller served"] and checked["second caller hold frames"] >= 5
+    assert checked["second caller audio after admission"] > 0
+    assert checked["third caller close code"] == 1013
+    assert checked["wait while rate limited (s)"] >= 0.4
+    assert with_admission["admitted"] == SURGE_CALLS
+    assert with_admission["frame lateness p99 ms"] < without["frame lateness p99 ms"] / 2
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""Latency and accuracy of the local attendee matcher on synthetic day listings.
+
+Each trial builds a day with ``BOOKINGS_PER_DAY`` random German names and asks
+for one of them with a speech-recognition style misspelling such as
+"Peter Muuhler". Reported are the share of confident correct matches, wrong
+matches, LLM fallbacks and the per-lookup latency.
+
+Run with ``python -m benchmarks.attendee_matching``. Pass ``--llm`` to also
+time the previous gpt-4o-mini lookup on a few trials (needs OPENAI_API_KEY).
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from app.tools.attendee_matcher import match_attendee
+
+TRIALS = 2000
+BOOKINGS_PER_DAY = 24
+LLM_TRIALS = 10
+
+FIRST_NAMES = [
+    "Peter", "Anna", "Thomas", "Julia", "Michael", "Sabine", "Andreas", "Katrin",
+    "Stefan", "Claudia", "Jürgen", "Petra", "Christian", "Monika", "Frank", "Ute",
+    "Klaus", "Birgit", "Markus", "Sandra", "Wolfgang", "Heike", "Tobias", "Jana",
+]
+LAST_NAMES = [
+    "Müller", "Schmidt", "Schneider", "Fischer", "Weber", "Meyer", "Wagner",
+    "Becker", "Schulz", "Hoffmann", "Schäfer", "Koch", "Bauer", "Richter", "Klein",
+    "Wolf", "Schröder", "Neumann", "Schwarz", "Zimmermann", "Braun", "Krüger",
+    "Hofmann", "Hartmann", "Lange", "Schmitt", "Werner", "Krause", "Meier", "Lehmann",
+]
+# Typical confusions of a speech recognizer transcribing German names
+SUBSTITUTIONS = [
+    ("ü", "uu"), ("ü", "ue"), ("ü", "u"), ("ö", "oe"), ("ä", "ae"), ("ei", "ai"),
+    ("ei", "ey"), ("ll", "l"), ("mm", "m"), ("ch", "k"), ("ck", "k"), ("tz", "z"),
+    ("f", "ph"), ("dt", "t"), ("sch", "sh"), ("er", "a"), ("mann", "man"), ("l", "hl"),
+]
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    options = [(a, b) for a, b in SUBSTITUTIONS if a in name]
+    if options:
+        a, b = rng.choice(options)
+        name = name.replace(a, b, 1)
+    if rng.random() < 0.3 and len(name) > 4:
+        index = rng.randrange(1, len(name) - 1)
+        name = name[:index] + name[index + 1:]
+    return name
+
+
+def day_listing(rng: random.Random) -> list[dict]:
+    names = set()
+    while len(names) < BOOKINGS_PER_DAY:
+        names.add(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+    return [
+        {
+            "uid": f"uid-{index}",
+            "start": f"2024-12-10T{7 + index // 2:02d}:{30 * (index % 2):02d}:00.000Z",
+            "attendees": [{"name": name}],
+        }
+        for index, name in enumerate(sorted(names))
+    ]
+
+
+def main():
+    rng = random.Random(42)
+    trials = []
+    for _ in range(TRIALS):
+        bookings = day_listing(rng)
+        target = rng.choice(bookings)
+        spoken = misspell(target["attendees"][0]["name"], rng)
+        trials.append((bookings, target, spoken))
+
+    latencies = []
+    correct = wrong = fallback = missed = 0
+    for bookings, target, spoken in trials:
+        started = time.perf_counter()
+        match = match_attendee(bookings, spoken)
+        latencies.append(time.perf_counter() - started)
+        if match.booking is not None:
+            if match.booking.uid == target["uid"]:
+                correct += 1
+            else:
+                wrong += 1
+        elif match.is_ambiguous:
+            fallback += 1
+            missed += target not in match.candidates
+        else:
+            missed += 1
+
+    latencies.sort()
+    print(f"trials:                 {TRIALS} ({BOOKINGS_PER_DAY} bookings per day)")
+    print(f"confident and correct:  {correct / TRIALS:.1%}")
+    print(f"confident but wrong:    {wrong / TRIALS:.1%}")
+    print(f"LLM fallback needed:    {fallback / TRIALS:.1%}")
+    print(f"target not found:       {missed / TRIALS:.1%}")
+    print(f"local latency p50:      {statistics.median(latencies) * 1000:.3f} ms")
+    print(f"local latency p99:      {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms")
+
+    if "--llm" in sys.argv:
+        asyncio.run(time_llm(trials[:LLM_TRIALS]))
+
+
+async def time_llm(trials):
+    from app.tools.cal_tool import CalTool
+    from app.tools.clients import close_clients
+
+    latencies = []
+    correct = 0
+    for bookings, target, spoken in trials:
+        started = time.perf_counter()
+        booking = await CalTool._find_booking_with_llm(bookings, "2024-12-10", spoken)
+        latencies.append(time.perf_counter() - started)
+        correct += booking is not None and booking.uid == target["uid"]
+    await close_clients()
+    print(f"LLM correct:            {correct / len(trials):.1%}")
+    print(f"LLM latency p50:        {statistics.median(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
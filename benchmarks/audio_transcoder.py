@@ -0,0 +1,138 @@
+"""Throughput of the streaming audio transcoder, frames per second per core.
+
+Transcodes 20 ms frames as a telephony call would: μ-law or A-law 8 kHz
+from the caller to pcm16 24 kHz for the session, and back. Base64 decoding
+and encoding of the payloads is included, it is part of the stage. Where
+``audioop`` still exists (before Python 3.13) the G.711 tables are checked
+against it bit for bit and its ``ratecv`` based conversion is timed for
+comparison. ``ratecv`` interpolates linearly without an anti-aliasing
+filter, so it is cheaper but folds everything above 4 kHz into the
+telephone band.
+
+Memory is traced while frames are transcoded: the peak above the steady
+state shows what a frame allocates transiently, the growth that nothing is
+kept per frame.
+
+Run with ``python -m benchmarks.audio_transcoder``.
+"""
+
+import base64
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from app.api.media_stream.audio_transcoder import (
+    AudioFormat,
+    AudioTranscoder,
+    g711_decode,
+    g711_encode,
+)
+
+FRAMES = 20_000
+FRAMES_PER_SECOND = 50  # 20 ms frames
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+
+def telephony_payload(encoding: str) -> str:
+    t = np.arange(160) / 8000
+    pcm = (np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2")
+    return base64.b64encode(g711_encode(pcm, encoding)).decode("utf-8")
+
+
+def session_payload() -> str:
+    t = np.arange(480) / 24000
+    return base64.b64encode((np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2")).decode("utf-8")
+
+
+def check_against_audioop():
+    samples = np.arange(-32768, 32768, dtype=np.int16)
+    codes = np.arange(256, dtype=np.uint8)
+    for encoding, encode, decode in (
+        ("mulaw", audioop.lin2ulaw, audioop.ulaw2lin),
+        ("alaw", audioop.lin2alaw, audioop.alaw2lin),
+    ):
+        assert g711_encode(samples, encoding).tobytes() == encode(samples.tobytes(), 2)
+        assert g711_decode(codes, encoding).tobytes() == decode(codes.tobytes(), 2)
+    print("G.711 tables match audioop for all inputs")
+
+
+def timed(function, payload: str) -> float:
+    """CPU seconds per frame."""
+    for _ in range(100):
+        function(payload)
+    started = time.process_time()
+    for _ in range(FRAMES):
+        function(payload)
+    return (time.process_time() - started) / FRAMES
+
+
+def audioop_converters(encoding: str):
+    encode = audioop.lin2ulaw if encoding == "mulaw" else audioop.lin2alaw
+    decode = audioop.ulaw2lin if encoding == "mulaw" else audioop.alaw2lin
+    state = {"in": None, "out": None}
+
+    def to_session(payload: str) -> str:
+        pcm = decode(base64.b64decode(payload), 2)
+        pcm, state["in"] = audioop.ratecv(pcm, 2, 1, 8000, 24000, state["in"])
+        return base64.b64encode(pcm).decode("utf-8")
+
+    def to_client(payload: str) -> str:
+        pcm, state["out"] = audioop.ratecv(base64.b64decode(payload), 2, 1, 24000, 8000, state["out"])
+        return base64.b64encode(encode(pcm, 2)).decode("utf-8")
+
+    return to_session, to_client
+
+
+def traced_per_frame(function, payload: str) -> tuple[int, int]:
+    function(payload)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    for _ in range(1000):
+        function(payload)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline, current - baseline
+
+
+def report(name: str, seconds: float):
+    print(
+        f"{name:<28} {seconds * 1e6:7.1f} µs/frame   {1 / seconds:9.0f} frames/s/core"
+        f"   {1 / seconds / FRAMES_PER_SECOND:7.0f} call directions/core"
+    )
+
+
+def main():
+    if audioop is not None:
+        check_against_audioop()
+
+    outbound = session_payload()
+    for encoding in ("mulaw", "alaw"):
+        inbound = telephony_payload(encoding)
+        transcoder = AudioTranscoder(AudioFormat(encoding, 8000))
+        report(f"{encoding} 8k -> pcm16 24k", timed(transcoder.to_session, inbound))
+        report(f"pcm16 24k -> {encoding} 8k", timed(transcoder.to_client, outbound))
+        if audioop is not None:
+            to_session, to_client = audioop_converters(encoding)
+            report(f"  audioop {encoding} in", timed(to_session, inbound))
+            report(f"  audioop {encoding} out", timed(to_client, outbound))
+
+    transcoder = AudioTranscoder(AudioFormat("mulaw", 8000))
+    for name, function, payload in (
+        ("inbound", transcoder.to_session, telephony_payload("mulaw")),
+        ("outbound", transcoder.to_client, outbound),
+    ):
+        peak, growth = traced_per_frame(function, payload)
+        print(f"{name:<9} transient per frame {peak:6d} B, growth over 1000 frames {growth} B")
+
+
+if __name__ == "__main__":
+    main()
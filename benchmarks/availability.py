@@ -0,0 +1,170 @@
+"""Free-slot lookups from memory versus trial-and-error bookings.
+
+Seeds the local cal.com stub with a busy calendar for the next days, more
+bookings than one page of the list holds, loads the availability index with
+one paginated range request and then:
+
+- times ``find_free_slots`` and the local slot check of ``create_booking``,
+- lets a caller ask for a fully booked morning. Without the index every
+  guess is a booking request to cal.com until one succeeds; with it the
+  taken slot is rejected locally together with the closest free ones, and
+  the first of those is booked in one request,
+- lets two callers book the same free slot at the same moment: the second
+  waits for the first and is offered free slots without a request.
+
+Run with ``python -m benchmarks.availability``.
+"""
+
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+CAL_DELAY = 0.2
+LOOKUPS = 10_000
+BUSY_SHARE = 0.6
+
+
+def seed_calendar(bookings: dict, event_type_id: int, first_day: date, days: int):
+    """Book a share of every slot of the practice days, the first morning fully."""
+    from app.config import APPOINTMENT_MINUTES, PRACTICE_CLOSE_HOUR, PRACTICE_OPEN_HOUR, PRACTICE_WEEKDAYS
+    from app.tools.availability import utc_time
+
+    rng = random.Random(5)
+    slot = timedelta(minutes=APPOINTMENT_MINUTES)
+    morning = None
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if day.weekday() not in PRACTICE_WEEKDAYS:
+            continue
+        morning = morning or day
+        start = datetime(day.year, day.month, day.day, PRACTICE_OPEN_HOUR)
+        while start + slot <= datetime(day.year, day.month, day.day, PRACTICE_CLOSE_HOUR):
+            if (day == morning and start.hour < 12) or rng.random() < BUSY_SHARE:
+                uid = f"seed-{len(bookings)}"
+                bookings[uid] = {
+                    "uid": uid,
+                    "start": utc_time(start),
+                    "end": utc_time(start + slot),
+                    "eventTypeId": event_type_id,
+                    "status": "accepted",
+                    "attendees": [{"name": f"Patient {len(bookings)}"}],
+                    "metadata": {},
+                }
+            start += slot
+    return morning
+
+
+def post_count(requests: dict) -> int:
+    return requests.get("POST /v2/bookings", 0)
+
+
+async def book_by_trial(cal_tool, wanted: datetime) -> tuple[int, str]:
+    """The assistant guesses slot after slot until cal.com accepts one."""
+    from app.tools.availability import format_time
+
+    attempts = 0
+    start = wanted
+    while True:
+        attempts += 1
+        result = await cal_tool.create_booking(format_time(start), "Erika Muster")
+        if "erfolgreich" in result:
+            return attempts, result
+        start += timedelta(minutes=30)
+
+
+async def main():
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    fake_cal = create_app(delay=CAL_DELAY)
+    async with serve_in_background(fake_cal) as base_url:
+        os.environ["CAL_API_BASE_URL"] = base_url
+
+        from app.config import AVAILABILITY_DAYS, CAL_BOOKINGS_PAGE_SIZE, CAL_EVENT_TYPE_ID, PRACTICE_OPEN_HOUR
+        from app.tools import cal_tool
+        from app.tools.availability import BUSY, AvailabilityIndex, format_time, practice_now
+        from app.tools.cal_tool import CalTool
+        from app.tools.clients import close_clients, get_cal_client
+
+        get_cal_client()  # created at startup by the app lifespan
+        morning = seed_calendar(
+            fake_cal.state.bookings,
+            CAL_EVENT_TYPE_ID,
+            practice_now().date() + timedelta(days=1),
+            AVAILABILITY_DAYS - 1,
+        )
+        wanted = datetime(morning.year, morning.month, morning.day, PRACTICE_OPEN_HOUR)
+
+        # Without the index: an empty one never rejects anything
+        cal_tool.availability = AvailabilityIndex()
+        posts_before = post_count(fake_cal.state.requests)
+        started = time.perf_counter()
+        attempts, _ = await book_by_trial(CalTool, wanted)
+        trial_seconds = time.perf_counter() - started
+        trial_posts = post_count(fake_cal.state.requests) - posts_before
+
+        # With the index, loaded in one range request
+        index = cal_tool.availability = AvailabilityIndex()
+        seeded = len(fake_cal.state.bookings)
+        gets_before = fake_cal.state.requests.get("GET /v2/bookings", 0)
+        started = time.perf_counter()
+        await index.refresh(CalTool.fetch_bookings)
+        refresh_seconds = time.perf_counter() - started
+        refresh_gets = fake_cal.state.requests["GET /v2/bookings"] - gets_before
+        busy_intervals = sum(len(intervals) for intervals in index._busy.values())
+
+        near = format_time(wanted)
+        started = time.perf_counter()
+        for _ in range(LOOKUPS):
+            await CalTool.find_free_slots(near)
+        lookup_seconds = (time.perf_counter() - started) / LOOKUPS
+        started = time.perf_counter()
+        for _ in range(LOOKUPS):
+            index.check_slot(wanted)
+        check_seconds = (time.perf_counter() - started) / LOOKUPS
+
+        posts_before = post_count(fake_cal.state.requests)
+        started = time.perf_counter()
+        rejected = await CalTool.create_booking(near, "Max Muster")
+        first_free = index.find_free_slots(wanted, 1)[0]
+        booked = await CalTool.create_booking(format_time(first_free), "Max Muster")
+        indexed_seconds = time.perf_counter() - started
+        indexed_posts = post_count(fake_cal.state.requests) - posts_before
+
+        # Two callers want the same free slot at the same moment
+        contested = format_time(index.find_free_slots(wanted, 1)[0])
+        posts_before = post_count(fake_cal.state.requests)
+        contested_answers = await asyncio.gather(
+            CalTool.create_booking(contested, "Anna Muster"),
+            CalTool.create_booking(contested, "Ben Muster"),
+        )
+        contested_posts = post_count(fake_cal.state.requests) - posts_before
+        await close_clients()
+
+    print(f"index refresh:          {refresh_gets} requests, {busy_intervals} busy intervals, {refresh_seconds * 1000:.0f} ms")
+    print(f"find_free_slots:        {lookup_seconds * 1e6:.1f} µs")
+    print(f"check_slot:             {check_seconds * 1e6:.1f} µs")
+    print(f"local reject:           {rejected}")
+    print(
+        f"trial and error:        {trial_posts} booking requests, {trial_seconds:.2f} s"
+        f" (cal.com delay {CAL_DELAY * 1000:.0f} ms)"
+    )
+    print(f"with index:             {indexed_posts} booking request, {indexed_seconds:.2f} s")
+    print(f"cal.com requests saved: {trial_posts - indexed_posts}")
+    print(f"same slot at once:      {contested_posts} booking request, second caller: {contested_answers[1]}")
+
+    # More bookings than fit into one page of cal.com's list, all loaded
+    assert busy_intervals == seeded > CAL_BOOKINGS_PAGE_SIZE and refresh_gets > 1
+    assert attempts == trial_posts and trial_posts > 1
+    assert indexed_posts == 1 and "erfolgreich" in booked
+    assert index.check_slot(first_free) == BUSY, "own booking not written through"
+    # The second waits for the first and is offered other slots
+    assert contested_posts == 1 and "erfolgreich" in contested_answers[0]
+    assert "Freie Termine" in contested_answers[1]
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
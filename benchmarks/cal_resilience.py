@@ -0,0 +1,161 @@
+"""Calendar writes against a cal.com stub that injects faults.
+
+1. Flaky network: the stub answers 503 for some requests and loses the
+   response of others after booking. Bookings are made once with single
+   attempts, as before, and once through the resilient write layer. Counted
+   are bookings the caller is told failed although they exist, and bookings
+   that exist twice.
+2. Repeated calls: the model re-emits a function call with the same
+   ``call_id``, and several identical calls run at the same time. Each has
+   to end up as one booking and one request.
+3. Outage: every request fails. Once the circuit breaker is open, calls
+   have to be answered right away with the spoken fallback and without a
+   request, and the breaker has to close again when cal.com recovers.
+
+Run with ``python -m benchmarks.cal_resilience``.
+"""
+
+import asyncio
+import os
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BOOKINGS = 100
+FAULTS = {"unavailable": 0.1, "lost_response": 0.1}
+BREAKER_RESET = 1.0
+
+
+def slot(index: int) -> str:
+    day, hour = divmod(index, 8)
+    start = datetime(2030, 6, 3, 8 + hour) + timedelta(days=day)
+    return start.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def booked_names(bookings: dict) -> Counter:
+    return Counter(
+        booking["attendees"][0]["name"]
+        for booking in bookings.values()
+        if booking["status"] == "accepted"
+    )
+
+
+async def flaky_network(fake_cal, cal_tool, requests) -> dict:
+    fake_cal.state.bookings.clear()
+    fake_cal.state.faults.update(FAULTS)
+    cal_tool.cal_requests = requests
+    names = [f"Patient {id(requests)}-{index}" for index in range(BOOKINGS)]
+    answers = await asyncio.gather(
+        *(
+            cal_tool.CalTool.create_booking(slot(index), name, call_id=f"call_{index}")
+            for index, name in enumerate(names)
+        )
+    )
+    fake_cal.state.faults.update(unavailable=0.0, lost_response=0.0)
+    booked = booked_names(fake_cal.state.bookings)
+    told_success = ["erfolgreich" in answer for answer in answers]
+    return {
+        "told success": sum(told_success),
+        "booked, told failed": sum(
+            booked[name] > 0 and not success for name, success in zip(names, told_success)
+        ),
+        "told success, not booked": sum(
+            booked[name] == 0 and success for name, success in zip(names, told_success)
+        ),
+        "double bookings": sum(count > 1 for count in booked.values()),
+    }
+
+
+async def main():
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    fake_cal = create_app(seed=7)
+    async with serve_in_background(fake_cal) as base_url:
+        os.environ["CAL_API_BASE_URL"] = base_url
+
+        from app.config import CAL_BREAKER_FAILURES, CAL_RETRY_BASE_DELAY, CAL_RETRY_MAX_DELAY
+        from app.tools import cal_tool
+        from app.tools.clients import close_clients, get_cal_client
+        from app.tools.resilience import CircuitBreaker, ResilientRequests
+
+        get_cal_client()  # created at startup by the app lifespan
+
+        def resilient(budget: float, failures: int = CAL_BREAKER_FAILURES) -> ResilientRequests:
+            return ResilientRequests(
+                "cal",
+                get_cal_client,
+                CircuitBreaker(failures, BREAKER_RESET),
+                budget=budget,
+                base_delay=CAL_RETRY_BASE_DELAY,
+                max_delay=CAL_RETRY_MAX_DELAY,
+            )
+
+        # A budget of 0 leaves no room for retries, like the raw requests before
+        single = await flaky_network(fake_cal, cal_tool, resilient(0.0, failures=10**6))
+        retried = await flaky_network(fake_cal, cal_tool, resilient(6.0))
+
+        # Repeated and concurrent identical calls
+        cal_tool.cal_requests = resilient(6.0)
+        posts = fake_cal.state.requests.get("POST /v2/bookings", 0)
+        first = await cal_tool.CalTool.create_booking(slot(200), "Erika Muster", call_id="call_x")
+        again = await cal_tool.CalTool.create_booking(slot(200), "Erika Muster", call_id="call_x")
+        together = await asyncio.gather(
+            *(
+                cal_tool.CalTool.create_booking(slot(201), "Max Muster", call_id=f"call_{index}")
+                for index in range(5)
+            )
+        )
+        repeat_posts = fake_cal.state.requests["POST /v2/bookings"] - posts
+        booked = booked_names(fake_cal.state.bookings)
+
+        # Outage and recovery
+        requests = cal_tool.cal_requests = resilient(1.0)
+        fake_cal.state.faults["unavailable"] = 1.0
+        fail_fast, answers, posts_while_open = [], [], 0
+        for index in range(20):
+            posts = fake_cal.state.requests.get("POST /v2/bookings", 0)
+            was_open = requests.breaker.state == "open"
+            started = time.perf_counter()
+            answers.append(
+                await cal_tool.CalTool.create_booking(slot(300 + index), "Outage", call_id=f"o{index}")
+            )
+            if was_open:
+                fail_fast.append(time.perf_counter() - started)
+                posts_while_open += fake_cal.state.requests["POST /v2/bookings"] - posts
+        fake_cal.state.faults["unavailable"] = 0.0
+        await asyncio.sleep(BREAKER_RESET * 1.1)
+        recovered = await cal_tool.CalTool.create_booking(slot(400), "Recovered", call_id="r")
+        await close_clients()
+
+    print(f"flaky network, {BOOKINGS} bookings, faults {FAULTS}")
+    print(f"  {'':<26}{'single attempt':>16}{'resilient':>12}")
+    for name in single:
+        print(f"  {name:<26}{single[name]:>16}{retried[name]:>12}")
+    print("repeated calls")
+    print(f"  re-emitted call, same answer: {first == again}")
+    print(f"  identical calls in parallel:  {len(set(together))} distinct answer(s)")
+    print(f"  booking requests for 7 calls: {repeat_posts}")
+    print("outage")
+    print(f"  calls before the breaker opened: {len(answers) - len(fail_fast)}")
+    print(
+        f"  fail-fast answers: {len(fail_fast)}, median {statistics.median(fail_fast) * 1000:.2f} ms,"
+        f" requests while open: {posts_while_open}"
+    )
+    print(f"  after recovery: {recovered}")
+
+    assert single["booked, told failed"] > 0
+    assert retried["booked, told failed"] == 0 and retried["told success, not booked"] == 0
+    assert retried["double bookings"] == 0
+    assert retried["told success"] == BOOKINGS
+    assert first == again and len(set(together)) == 1
+    assert booked["Erika Muster"] == 1 and booked["Max Muster"] == 1 and repeat_posts == 2
+    assert fail_fast and statistics.median(fail_fast) < 0.01 and posts_while_open == 0
+    assert set(answers[-len(fail_fast):]) == {cal_tool.CAL_UNAVAILABLE}
+    assert "erfolgreich" in recovered
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
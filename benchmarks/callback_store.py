@@ -0,0 +1,149 @@
+"""Write-behind throughput and latency of the call-back store.
+
+- What a live call pays: the time ``enqueue`` takes, against committing each
+  record to SQLite right away as a synchronous tool would.
+- Sustained inserts per second: records are queued as fast as the writer
+  drains them, which commits them in multi-row transactions.
+- Flush latency, from enqueue to commit, at a steady rate of call-back
+  requests and in bursts.
+- A re-emitted ``call_id`` is skipped without the rest of its batch.
+- The practice team's queries by status and date on the filled table, and
+  the indexes SQLite uses for them.
+
+Run with ``python -m benchmarks.callback_store``.
+"""
+
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from app.tools.callback_store import INSERT, SCHEMA, CallbackStore, connect
+
+SYNC_RECORDS = 2_000
+SUSTAINED_RECORDS = 200_000
+PACED_RATE = 2_000  # records per second
+PACED_SECONDS = 3
+BURSTS = 20
+BURST_SIZE = 1_000
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    pick = lambda share: values[min(len(values) - 1, int(len(values) * share))]
+    return (
+        f"p50 {pick(0.5) * 1000:7.3f} ms  p90 {pick(0.9) * 1000:7.3f} ms"
+        f"  p99 {pick(0.99) * 1000:7.3f} ms  max {values[-1] * 1000:7.3f} ms"
+    )
+
+
+def record(index: int) -> dict:
+    return {
+        "name": f"Patient {index}",
+        "preferred_contact": "0170 1234567",
+        "description": "Frage zur Rechnung",
+        "call_id": f"call_{index}",
+    }
+
+
+def synchronous_inserts(path: str) -> list[float]:
+    connection = connect(path)
+    connection.executescript(SCHEMA)
+    durations = []
+    for index in range(SYNC_RECORDS):
+        started = time.perf_counter()
+        with connection:
+            connection.execute(INSERT, {"created_at": "2024-08-13T09:00:00.000+00:00", **record(index)})
+        durations.append(time.perf_counter() - started)
+    connection.close()
+    return durations
+
+
+def wait_written(store: CallbackStore, count: int):
+    while store.written + store.skipped + store.failed < count:
+        time.sleep(0.001)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        sync = synchronous_inserts(os.path.join(directory, "sync.db"))
+
+        store = CallbackStore(os.path.join(directory, "callbacks.db"), queue_size=SUSTAINED_RECORDS)
+        store.start()
+        enqueue = []
+        started = time.perf_counter()
+        for index in range(SUSTAINED_RECORDS):
+            before = time.perf_counter()
+            store.enqueue(**record(index))
+            enqueue.append(time.perf_counter() - before)
+        wait_written(store, SUSTAINED_RECORDS)
+        sustained = SUSTAINED_RECORDS / (time.perf_counter() - started)
+        sustained_batches = store.batches
+
+        store.flush_latencies.clear()
+        written = store.written
+        for index in range(PACED_RATE * PACED_SECONDS):
+            store.enqueue(**record(SUSTAINED_RECORDS + index))
+            time.sleep(1 / PACED_RATE)
+        wait_written(store, written + PACED_RATE * PACED_SECONDS)
+        paced = list(store.flush_latencies)
+
+        store.flush_latencies.clear()
+        written = store.written
+        offset = SUSTAINED_RECORDS + PACED_RATE * PACED_SECONDS
+        for burst in range(BURSTS):
+            for index in range(BURST_SIZE):
+                store.enqueue(**record(offset + burst * BURST_SIZE + index))
+            time.sleep(0.05)
+        wait_written(store, written + BURSTS * BURST_SIZE)
+        bursts = list(store.flush_latencies)
+
+        # A re-emitted call_id next to a new record: only the repeat is skipped
+        written, skipped = store.written, store.skipped
+        store.enqueue(**record(0))
+        store.enqueue(**record(offset + BURSTS * BURST_SIZE))
+        wait_written(store, written + skipped + 2)
+        repeat = (store.written - written, store.skipped - skipped)
+        store.close()
+
+        store.flush_latencies.clear()
+        connection = sqlite3.connect(store.path)
+        total = connection.execute("SELECT count(*) FROM callbacks").fetchone()[0]
+        plans = [
+            connection.execute(f"EXPLAIN QUERY PLAN {query}", parameters).fetchall()[0][-1]
+            for query, parameters in (
+                ("SELECT * FROM callbacks WHERE status = ? AND created_at >= ? ORDER BY created_at DESC LIMIT 100", ("open", "2024-01-01")),
+                ("SELECT * FROM callbacks WHERE created_at >= ? ORDER BY created_at DESC LIMIT 100", ("2024-01-01",)),
+            )
+        ]
+        connection.close()
+        query_durations = []
+        for _ in range(200):
+            started = time.perf_counter()
+            rows = store.query(status="open", since="2024-01-01", limit=100)
+            query_durations.append(time.perf_counter() - started)
+
+    print(f"synchronous insert + commit:  {percentiles(sync)}")
+    print(f"enqueue (paid by the call):   {percentiles(enqueue)}")
+    print(
+        f"sustained write-behind:       {sustained:,.0f} inserts/s,"
+        f" {SUSTAINED_RECORDS / sustained_batches:.0f} records per transaction"
+    )
+    print(f"flush latency at {PACED_RATE}/s:     {percentiles(paced)}")
+    print(f"flush latency, bursts of {BURST_SIZE}: {percentiles(bursts)}")
+    print(f"rows: {total:,}, query by status and date: {statistics.median(query_durations) * 1000:.2f} ms")
+    for plan in plans:
+        print(f"  {plan}")
+
+    print(f"re-emitted call_id:           written {repeat[0]}, skipped {repeat[1]}")
+
+    assert store.written == total and not store.failed and not store.rejected
+    assert repeat == (1, 1)
+    assert len(rows) == 100
+    assert all("INDEX" in plan for plan in plans)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
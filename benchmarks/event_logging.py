@@ -0,0 +1,167 @@
+"""Event-loop lag with a slow log sink, before and after the event log.
+
+Fake sessions replay a Realtime event stream through ``MediaStreamSession``:
+an audio delta every 20 ms plus the events that get logged, a
+``rate_limits.updated`` and a large ``response.done`` per second and a
+``session.created`` carrying the whole system prompt. The log sink is slow,
+like a backed-up stdout pipe: every write sleeps for a fixed latency plus
+its size over a limited bandwidth.
+
+"Before" logs synchronously on the event loop, like the previous ``print``
+of every payload. "After" uses the event log with its defaults, "stalled"
+the event log with a small queue in front of a sink that hangs for two
+seconds per write. Lag is the extra delay of a 10 ms ``asyncio.sleep`` while
+the sessions run.
+
+Run with ``python -m benchmarks.event_logging``.
+"""
+
+import asyncio
+import json
+import time
+
+import app.api.media_stream.services as services
+import app.api.media_stream.session as session_module
+from app.api.media_stream.session import MediaStreamSession
+from app.event_log import EventLog
+from test_client.fakes import FakeClientWebSocket, FakeUpstream, audio_delta_events
+
+SESSIONS = 40
+SECONDS = 4
+FRAME_INTERVAL = 0.02
+LAG_INTERVAL = 0.01
+
+# A stdout pipe whose reader cannot keep up
+SINK_WRITE_LATENCY = 0.002
+SINK_BYTES_PER_SECOND = 2 * 1024 * 1024
+
+SYSTEM_PROMPT = "Du bist die freundliche Telefonassistenz der Zahnarztpraxis. " * 300
+TRANSCRIPT = "Ich habe Ihnen einen Termin am Dienstag um neun Uhr eingetragen. " * 20
+
+
+class SlowSink:
+    def __init__(self, write_latency: float = SINK_WRITE_LATENCY):
+        self.write_latency = write_latency
+        self.bytes_written = 0
+
+    def write(self, data: str):
+        time.sleep(self.write_latency + len(data) / SINK_BYTES_PER_SECOND)
+        self.bytes_written += len(data)
+
+    def flush(self):
+        pass
+
+
+def event_stream(seconds: int) -> list:
+    events = [{"type": "session.created", "session": {"instructions": SYSTEM_PROMPT}}]
+    for second in range(seconds):
+        events.extend(audio_delta_events(int(1 / FRAME_INTERVAL) - 2))
+        events.append(
+            {
+                "type": "rate_limits.updated",
+                "rate_limits": [
+                    {"name": "requests", "limit": 5000, "remaining": 4999 - second},
+                    {"name": "tokens", "limit": 40000, "remaining": 38000},
+                ],
+            }
+        )
+        events.append(
+            {
+                "type": "response.done",
+                "response": {
+                    "id": f"resp_{second}",
+                    "status": "completed",
+                    "output": [
+                        {
+                            "type": "message",
+                            "role": "assistant",
+                            "content": [{"type": "audio", "transcript": TRANSCRIPT}],
+                        }
+                    ],
+                    "usage": {"total_tokens": 1200, "input_tokens": 900, "output_tokens": 300},
+                },
+            }
+        )
+    return [json.dumps(event) for event in events]
+
+
+def print_log(sink: SlowSink):
+    """The previous behaviour: the full record written on the event loop."""
+
+    def log(event: str, level: str = "info", **fields):
+        print(event, level, fields, file=sink)
+
+    return log
+
+
+async def sample_lag(samples: list):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+# Modules on the session path whose ``log`` is swapped per run
+LOGGING_MODULES = (services, session_module)
+
+
+async def run(log) -> list:
+    for module in LOGGING_MODULES:
+        module.log = log
+    events = event_stream(SECONDS)
+    lag = []
+    sampler = asyncio.create_task(sample_lag(lag))
+    sessions = [
+        MediaStreamSession(FakeClientWebSocket(), FakeUpstream(events, FRAME_INTERVAL))
+        for _ in range(SESSIONS)
+    ]
+    await asyncio.gather(*(session.run() for session in sessions))
+    sampler.cancel()
+    return lag
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def report(name: str, lag: list, sink: SlowSink):
+    ms = 1000
+    print(
+        f"{name:<7} lag p50 {percentile(lag, 0.5) * ms:7.2f} ms   p99 {percentile(lag, 0.99) * ms:7.2f} ms"
+        f"   max {max(lag) * ms:7.2f} ms   sink {sink.bytes_written / 1024:8.0f} KiB"
+    )
+
+
+async def main():
+    print(
+        f"{SESSIONS} sessions for {SECONDS} s, sink {SINK_WRITE_LATENCY * 1000:.0f} ms"
+        f" + {SINK_BYTES_PER_SECOND // 1024} KiB/s per write"
+    )
+    original_log = services.log
+
+    before_sink = SlowSink()
+    before = await run(print_log(before_sink))
+    report("before", before, before_sink)
+
+    # A stalled sink with a small queue shows records being dropped instead
+    for name, sink, queue_size in (
+        ("after", SlowSink(), 10000),
+        ("stalled", SlowSink(write_latency=2.0), 20),
+    ):
+        event_log = EventLog(sink=sink, queue_size=queue_size)
+        lag = await run(event_log.log)
+        # The writer may still be draining, the loop no longer waits for it
+        event_log.close(timeout=10)
+        report(name, lag, sink)
+        print(
+            f"        records written {event_log.written}, sampled out {event_log.sampled_out},"
+            f" dropped {event_log.dropped}"
+        )
+
+    for module in LOGGING_MODULES:
+        module.log = original_log
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
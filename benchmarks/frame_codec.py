@@ -0,0 +1,114 @@
+"""Per-frame CPU cost of forwarding audio, before and after the frame codec.
+
+"Before" repeats the previous hot path: ``json.loads`` and ``json.dumps`` of
+every inbound media event, and ``b64decode``/``b64encode`` plus
+``send_json`` serialization of every outbound audio delta. "After" runs the
+frame codec. Socket I/O is left out, only the work per frame is timed.
+
+Calls per core assume 50 frames per second in each direction (20 ms frames).
+
+Run with ``python -m benchmarks.frame_codec``.
+"""
+
+import base64
+import json
+import time
+
+from app.api.media_stream.frame_codec import (
+    ClientMediaEncoder,
+    decode_client_frame,
+    decode_upstream_event,
+    encode_audio_append,
+)
+
+FRAMES = 100_000
+FRAMES_PER_SECOND_PER_DIRECTION = 50
+PCM_BYTES = 960  # 20 ms pcm16 at 24 kHz
+
+PAYLOAD = base64.b64encode(bytes(range(256)) * (PCM_BYTES // 256) + bytes(PCM_BYTES % 256)).decode("utf-8")
+CLIENT_FRAME = json.dumps({"event": "media", "media": {"payload": PAYLOAD, "timestamp": 1733822400000}})
+# As Twilio sends it, with the timestamp as a string
+TWILIO_FRAME = json.dumps(
+    {
+        "event": "media",
+        "sequenceNumber": "4",
+        "media": {"track": "inbound", "chunk": "2", "timestamp": "5", "payload": PAYLOAD},
+        "streamSid": "MZ18ad3ab5a668481ce02b83e7395059f0",
+    }
+)
+UPSTREAM_FRAME = json.dumps(
+    {
+        "type": "response.audio.delta",
+        "event_id": "event_AbCdEfGhIjKl",
+        "response_id": "resp_AbCdEfGhIjKl",
+        "item_id": "item_AbCdEfGhIjKl",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": PAYLOAD,
+    }
+)
+
+
+def inbound_before(message):
+    data = json.loads(message)
+    if data["event"] == "media":
+        latest_media_timestamp = int(data["media"]["timestamp"])
+        audio_append = {"type": "input_audio_buffer.append", "audio": data["media"]["payload"]}
+        return json.dumps(audio_append), latest_media_timestamp
+
+
+def inbound_after(message):
+    event, audio_payload, timestamp, _ = decode_client_frame(message)
+    if event == "media":
+        return encode_audio_append(audio_payload), timestamp
+
+
+def outbound_before(message, stream_sid="stream_1"):
+    response = json.loads(message)
+    if response["type"] in ("response.done", "session.updated"):
+        return None
+    if response.get("type") == "response.audio.delta" and "delta" in response:
+        audio_payload = base64.b64encode(base64.b64decode(response["delta"])).decode("utf-8")
+        audio_delta = {"event": "media", "streamSid": stream_sid, "media": {"payload": audio_payload}}
+        # Starlette's send_json serializes with separators=(",", ":")
+        return json.dumps(audio_delta, separators=(",", ":"))
+
+
+encoder = ClientMediaEncoder("stream_1")
+
+
+def outbound_after(message):
+    event_type, audio_delta, _ = decode_upstream_event(message)
+    if event_type == "response.audio.delta":
+        return encoder.encode(audio_delta)
+
+
+def per_frame(function, frame) -> float:
+    started = time.process_time()
+    for _ in range(FRAMES):
+        function(frame)
+    return (time.process_time() - started) / FRAMES
+
+
+def main():
+    assert json.loads(inbound_before(CLIENT_FRAME)[0]) == json.loads(inbound_after(CLIENT_FRAME)[0])
+    for frame in (CLIENT_FRAME, TWILIO_FRAME):
+        assert inbound_before(frame)[1] == inbound_after(frame)[1]
+    assert json.loads(outbound_before(UPSTREAM_FRAME)) == json.loads(outbound_after(UPSTREAM_FRAME))
+
+    results = {
+        "before": (per_frame(inbound_before, CLIENT_FRAME), per_frame(outbound_before, UPSTREAM_FRAME)),
+        "after": (per_frame(inbound_after, CLIENT_FRAME), per_frame(outbound_after, UPSTREAM_FRAME)),
+    }
+    print(f"{FRAMES} frames per direction, {PCM_BYTES} byte pcm16 payloads")
+    for name, (inbound, outbound) in results.items():
+        cpu_per_call_second = (inbound + outbound) * FRAMES_PER_SECOND_PER_DIRECTION
+        print(
+            f"{name:<7} inbound {inbound * 1e6:6.2f} us/frame   "
+            f"outbound {outbound * 1e6:6.2f} us/frame   "
+            f"calls/core (codec only) {1 / cpu_per_call_second:8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Time to the first greeting audio at the caller, generated and cached.
+
+Calls run like ``/media-stream`` runs them, through the greeting player and
+the real session against the local fake Realtime API. Its handshake takes
+``CONNECT_DELAY``, like connecting to the real one, and it takes
+``GENERATION_DELAY`` to start speaking, like the model does. For every call
+the clock starts when the caller's ``start`` frame is sent, right as the
+call connects, and stops at the first ``media`` frame the caller receives.
+A cached greeting must not wait for upstream. Also counted are the
+responses upstream has to generate per call.
+
+Afterwards the cache is checked: a restart loads the greeting from disk
+without rendering, a changed prompt invalidates it until it is rendered
+again, and workers sharing the directory render a new greeting once.
+
+Run with ``python -m benchmarks.greeting_cache``.
+"""
+
+import asyncio
+import contextlib
+import dataclasses
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from app.api.media_stream.greeting_cache import GreetingCache, GreetingPlayer
+from app.api.media_stream.session import MediaStreamSession
+from app.api.media_stream.session_bootstrap import session_bootstrap
+from app.api.media_stream.upstream_pool import UpstreamPool
+from test_client.fake_realtime_server import FakeRealtimeConfig, FakeRealtimeServer
+from test_client.fakes import FakeClientWebSocket
+
+CALLS = 20
+CONNECT_DELAY = 0.3
+GENERATION_DELAY = 0.6
+# 3 s of greeting in 20 ms deltas
+GREETING_DELTAS = 150
+WORKERS = 4
+
+
+async def time_to_first_audio(pool: UpstreamPool, greeting) -> float:
+    client = FakeClientWebSocket()
+
+    async def call():
+        async with GreetingPlayer(client, greeting) as player:
+            async with pool.session(greeting=greeting) as openai_ws:
+                start = await player.stream_start()
+                await MediaStreamSession(
+                    client,
+                    openai_ws,
+                    greeting=greeting,
+                    start=start,
+                    outbound=player.pacer,
+                    greeting_queued=player.played,
+                ).run()
+
+    started = time.perf_counter()
+    client.inbound.put_nowait(json.dumps({"event": "start", "start": {"streamSid": "MZbench"}}))
+    task = asyncio.create_task(call())
+    while not any('"event":"media"' in message for message in client.sent):
+        await asyncio.sleep(0.001)
+    first_audio = time.perf_counter() - started
+    client.inbound.put_nowait(None)
+    await task
+    return first_audio
+
+
+async def measure(server: FakeRealtimeServer, pool: UpstreamPool, greeting) -> tuple[list[float], float]:
+    responses = server.responses
+    durations = [await time_to_first_audio(pool, greeting) for _ in range(CALLS)]
+    return durations, (server.responses - responses) / CALLS
+
+
+async def main():
+    server = FakeRealtimeServer(
+        FakeRealtimeConfig(
+            handshake_delay=CONNECT_DELAY,
+            response_delay=GENERATION_DELAY,
+            audio_deltas_per_response=GREETING_DELTAS,
+        )
+    )
+    session_bootstrap.reload_if_changed()
+    with tempfile.TemporaryDirectory() as directory:
+        async with server.serve() as url:
+            pool = UpstreamPool(size=0, url=url)
+            cache = GreetingCache(directory, enabled=True, url=url)
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert cache.current() is None
+                generated, generated_responses = await measure(server, pool, None)
+
+                render_started = time.perf_counter()
+                await cache.refresh()
+                render = time.perf_counter() - render_started
+                greeting = cache.current()
+                cached, cached_responses = await measure(server, pool, greeting)
+                assistant_messages = server.assistant_messages
+
+                # A restart finds the greeting on disk
+                responses = server.responses
+                restarted = GreetingCache(directory, enabled=True, url=url)
+                await restarted.refresh()
+                loaded = restarted.current()
+                renders_on_restart = server.responses - responses
+
+                # An edited prompt changes the key, a day later. Files that are
+                # not cache entries stay.
+                for name in os.listdir(directory):
+                    os.utime(os.path.join(directory, name), (time.time() - 86400,) * 2)
+                for name in ("notes.txt", "other.pcm.tmp"):
+                    open(os.path.join(directory, name), "w").close()
+                payload = session_bootstrap.payload
+                session_bootstrap._payload = dataclasses.replace(payload, intro_key="edited")
+                stale = cache.current()
+                await cache.refresh()
+                rerendered = cache.current()
+                files = sorted(os.listdir(directory))
+
+                # Workers of one host refresh at the same moment
+                session_bootstrap._payload = dataclasses.replace(payload, intro_key="workers")
+                workers = [GreetingCache(directory, enabled=True, url=url) for _ in range(WORKERS)]
+                responses = server.responses
+                await asyncio.gather(*(worker.refresh() for worker in workers))
+                await asyncio.gather(*(worker.refresh() for worker in workers))
+                worker_renders = server.responses - responses
+                worker_greetings = sum(worker.current() is not None for worker in workers)
+                session_bootstrap._payload = payload
+
+    print(
+        f"time to first greeting audio over {CALLS} calls (fake upstream, "
+        f"{CONNECT_DELAY * 1000:.0f} ms to connect, {GENERATION_DELAY * 1000:.0f} ms to speak)"
+    )
+    print(f"generated   p50 {statistics.median(generated) * 1000:6.1f} ms   max {max(generated) * 1000:6.1f} ms   responses per call {generated_responses:.1f}")
+    print(f"cached      p50 {statistics.median(cached) * 1000:6.1f} ms   max {max(cached) * 1000:6.1f} ms   responses per call {cached_responses:.1f}")
+    print(f"rendering once: {render * 1000:.0f} ms for {greeting.seconds:.1f} s of audio")
+    print(f"restart: loaded from disk {loaded is not None}, renders {renders_on_restart}")
+    print(f"edited prompt: stale greeting used {stale is not None}, re-rendered {rerendered.key}, files {files}")
+    print(f"{WORKERS} workers sharing the directory: renders {worker_renders}, greetings {worker_greetings}")
+
+    assert generated_responses == 1 and cached_responses == 0
+    assert assistant_messages == CALLS
+    assert statistics.median(cached) < statistics.median(generated) / 10
+    # Played while upstream connects, not after
+    assert max(cached) < CONNECT_DELAY / 3
+    assert loaded is not None and loaded.frames == greeting.frames and renders_on_restart == 0
+    assert stale is None and rerendered.key == "edited" and files == ["edited.json", "edited.pcm", "notes.txt", "other.pcm.tmp"]
+    assert worker_renders == 1 and worker_greetings == WORKERS
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
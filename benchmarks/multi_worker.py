@@ -0,0 +1,262 @@
+"""Several workers on one host, with and without ``SHARED_STATE_PATH``.
+
+1. ``WORKERS`` worker processes, each serving the app against one fake
+   cal.com API, try to book the same slot at the same moment and then keep
+   running for ``WINDOW`` seconds with a one-second availability refresh.
+   Counted are the booking requests that reach cal.com, what the callers
+   hear and the availability fetches of the whole host. With shared state
+   exactly one booking request is made, the others are told the slot is taken
+   and offered free ones, and the host fetches about once per refresh
+   interval instead of once per worker.
+2. ``uvicorn --workers N`` with shared state for N in ``SCALING_WORKERS``,
+   with ``CALLS_PER_WORKER`` synthetic calls per worker against the fake
+   Realtime API. The CPU time of every worker is taken from ``GET /workers``,
+   which also shows how the calls are spread. Calls per core that stay flat
+   with N mean calls per host grow with the number of workers, up to the
+   number of cores. Only that many workers can be measured in parallel, on a
+   host with fewer cores the calls per host are projected from calls per core.
+
+Run with ``python -m benchmarks.multi_worker``.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+WORKERS = 4
+WINDOW = 4.0
+SCALING_WORKERS = (1, 2, 4)
+CALLS_PER_WORKER = 6
+CALL_SECONDS = 12.0
+API_KEY = "multi-worker"
+
+
+def next_bookable_slot() -> str:
+    day = date.today() + timedelta(days=1)
+    while day.weekday() > 4:
+        day += timedelta(days=1)
+    return f"{day.isoformat()}T10:00:00Z"
+
+
+def base_env(directory: str, cal_url: str, shared: bool, realtime_url: str = "ws://127.0.0.1:9") -> dict:
+    return dict(
+        os.environ,
+        API_AUTH_KEY=API_KEY,
+        OPENAI_API_KEY="multi-worker",
+        CAL_API_BASE_URL=cal_url,
+        REALTIME_API_URL=realtime_url,
+        CALLBACK_DB_PATH=os.path.join(directory, "callbacks.db"),
+        SHARED_STATE_PATH=os.path.join(directory, "shared.db") if shared else "",
+        GREETING_CACHE="false",
+        STARTUP_WARMUP="lazy",
+    )
+
+
+async def child(directory: str, index: int, slot: str):
+    """One worker: serve the app, book ``slot`` on the go signal, stay up."""
+    import app.main
+    from app.tools.registry import tool_registry
+    from test_client.servers import serve_in_background
+
+    async with serve_in_background(app.main.app):
+        # Let the first heartbeat pick up the snapshot
+        await asyncio.sleep(1.0)
+        open(os.path.join(directory, f"ready.{index}"), "w").close()
+        go = os.path.join(directory, "go")
+        while not os.path.exists(go):
+            await asyncio.sleep(0.005)
+        arguments = json.dumps({"start": slot, "attendee_name": f"Anrufer {index}"})
+        answer = await tool_registry.call("create_booking", arguments, f"call_{index}")
+        path = os.path.join(directory, f"answer.{index}")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(answer.output, file)
+        os.replace(f"{path}.tmp", path)
+        while not os.path.exists(os.path.join(directory, "stop")):
+            await asyncio.sleep(0.05)
+
+
+async def same_slot(shared: bool) -> dict:
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    slot = next_bookable_slot()
+    cal = create_app(delay=0.05)
+    with tempfile.TemporaryDirectory() as directory:
+        async with serve_in_background(cal) as cal_url:
+            env = dict(
+                base_env(directory, cal_url, shared),
+                AVAILABILITY_REFRESH_INTERVAL="1.0",
+                SHARED_STATE_INTERVAL="0.25",
+            )
+            children = [
+                subprocess.Popen(
+                    [sys.executable, "-m", "benchmarks.multi_worker", "--child", directory, str(index), slot],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                )
+                for index in range(WORKERS)
+            ]
+            try:
+                while not all(os.path.exists(os.path.join(directory, f"ready.{index}")) for index in range(WORKERS)):
+                    await asyncio.sleep(0.05)
+                fetches_before = cal.state.requests.get("GET /v2/bookings", 0)
+                open(os.path.join(directory, "go"), "w").close()
+                await asyncio.sleep(WINDOW)
+                fetches = cal.state.requests.get("GET /v2/bookings", 0) - fetches_before
+                while not all(os.path.exists(os.path.join(directory, f"answer.{index}")) for index in range(WORKERS)):
+                    await asyncio.sleep(0.05)
+                answers = []
+                for index in range(WORKERS):
+                    with open(os.path.join(directory, f"answer.{index}")) as file:
+                        answers.append(json.load(file))
+                open(os.path.join(directory, "stop"), "w").close()
+                await asyncio.gather(*(asyncio.to_thread(process.wait, 30) for process in children))
+            finally:
+                for process in children:
+                    if process.poll() is None:
+                        process.kill()
+    return {
+        "booking requests": cal.state.requests.get("POST /v2/bookings", 0),
+        "booked": sum("erfolgreich gebucht" in answer for answer in answers),
+        "offered other slots": sum("Freie Termine" in answer for answer in answers),
+        "fetches per second": fetches / WINDOW,
+    }
+
+
+async def get_workers(client, url: str) -> dict:
+    response = await client.get(f"{url}/workers", headers={"Authorization": f"Bearer {API_KEY}"})
+    response.raise_for_status()
+    return response.json()
+
+
+async def scaling_run(workers: int) -> dict:
+    import httpx
+
+    from test_client.fake_cal_server import create_app
+    from test_client.fake_realtime_server import FakeRealtimeConfig, FakeRealtimeServer
+    from test_client.load_test import load_pcm, percentile, synthetic_caller
+    from test_client.servers import free_port, serve_in_background
+
+    fake_realtime = FakeRealtimeServer(
+        FakeRealtimeConfig(response_delay=0.05, echo_audio=True, stamped_audio=True, function_call_interval=5.0)
+    )
+    port, realtime_port = free_port(), free_port()
+    url = f"http://127.0.0.1:{port}"
+    calls = workers * CALLS_PER_WORKER
+    result = {
+        "frames_sent": 0,
+        "frames_received": 0,
+        "call_seconds": 0.0,
+        "time_to_first_audio": [],
+        "outbound_latencies": [],
+        "errors": [],
+    }
+    pcm = load_pcm()
+    with tempfile.TemporaryDirectory() as directory:
+        async with serve_in_background(create_app(delay=0.05)) as cal_url, fake_realtime.serve(realtime_port):
+            env = base_env(directory, cal_url, True, f"ws://127.0.0.1:{realtime_port}")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+                env=env,
+                stdout=subprocess.DEVNULL,
+            )
+            try:
+                async with httpx.AsyncClient() as client:
+                    deadline = time.monotonic() + 120
+                    while True:
+                        try:
+                            before = await get_workers(client, url)
+                            if len(before["workers"]) == workers:
+                                break
+                        except httpx.HTTPError:
+                            pass
+                        if time.monotonic() > deadline:
+                            raise RuntimeError(f"{workers} workers did not come up")
+                        await asyncio.sleep(0.25)
+                    # Settle after the start, then take the CPU time as of now
+                    await asyncio.sleep(2.0)
+                    before = await get_workers(client, url)
+
+                    callers = []
+                    for index in range(calls):
+                        callers.append(
+                            asyncio.create_task(
+                                synthetic_caller(index, url.replace("http", "ws"), API_KEY, pcm, CALL_SECONDS, result)
+                            )
+                        )
+                        await asyncio.sleep(1.0 / calls)
+                    await asyncio.sleep(CALL_SECONDS / 2)
+                    during = await get_workers(client, url)
+                    await asyncio.gather(*callers)
+                    # One more heartbeat of every worker
+                    await asyncio.sleep(1.5)
+                    after = await get_workers(client, url)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                await asyncio.to_thread(server.wait, 30)
+
+    cpu_before = {worker["worker"]: worker["cpu_seconds"] for worker in before["workers"]}
+    cpu_seconds = sum(worker["cpu_seconds"] - cpu_before.get(worker["worker"], 0.0) for worker in after["workers"])
+    return {
+        "calls": calls,
+        "errors": len(result["errors"]),
+        "calls per worker": sorted((len(worker["calls"]) for worker in during["workers"]), reverse=True),
+        "registered calls": during["calls"],
+        "calls per core": result["call_seconds"] / cpu_seconds if cpu_seconds else float("nan"),
+        "outbound p99 ms": percentile(result["outbound_latencies"], 0.99) * 1000,
+    }
+
+
+async def main():
+    print(f"{WORKERS} workers booking the same slot at once")
+    results = {}
+    for shared in (False, True):
+        results[shared] = await same_slot(shared)
+    print(f"  {'':<22}{'separate':>12}{'shared':>12}")
+    for name in results[True]:
+        print(f"  {name:<22}" + "".join(f"{results[shared][name]:>12.1f}" for shared in (False, True)))
+
+    cores = os.cpu_count() or 1
+    print(f"\nuvicorn --workers N with shared state, {CALLS_PER_WORKER} calls per worker, {cores} cores")
+    scaling = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for workers in SCALING_WORKERS:
+            scaling[workers] = await scaling_run(workers)
+    print(f"  {'workers':<8}{'calls':>6}{'errors':>7}{'registered':>11}{'calls/core':>11}{'calls/host':>11}{'out p99 ms':>11}  calls per worker")
+    for workers, run in scaling.items():
+        per_host = run["calls per core"] * min(workers, cores)
+        print(
+            f"  {workers:<8}{run['calls']:>6}{run['errors']:>7}{run['registered calls']:>11}"
+            f"{run['calls per core']:>11.0f}{per_host:>11.0f}{run['outbound p99 ms']:>11.1f}  {run['calls per worker']}"
+        )
+    if cores < max(SCALING_WORKERS):
+        print(f"  calls/host beyond {cores} cores is calls/core times the cores the host has")
+
+    separate, shared = results[False], results[True]
+    assert shared["booking requests"] == 1 and shared["booked"] == 1
+    assert shared["offered other slots"] == WORKERS - 1
+    assert separate["booking requests"] == WORKERS
+    assert shared["fetches per second"] < separate["fetches per second"] / 2
+    single = scaling[SCALING_WORKERS[0]]["calls per core"]
+    for workers, run in scaling.items():
+        assert run["errors"] == 0
+        assert run["registered calls"] == run["calls"]
+        assert len(run["calls per worker"]) == workers
+        # Shared state must not eat into what one core carries
+        assert run["calls per core"] > 0.75 * single
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        asyncio.run(child(sys.argv[2], int(sys.argv[3]), sys.argv[4]))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,129 @@
+"""Cost of recording calls, on the event loop and in total.
+
+- Per frame on the event loop: what a tap call adds to forwarding a frame.
+- Per call: CPU of the whole process, writer thread included, to record
+  ``CALLS`` calls of ``CALL_SECONDS`` with audio in both directions and a
+  transcript event per second. The WAV and JSONL files are checked.
+- Slow disk: every write of the worker stalls for ``SLOW_WRITE`` seconds
+  while frames arrive at real-time rate. The tap must stay as cheap as
+  before and frames must be dropped and counted instead.
+
+Run with ``python -m benchmarks.recorder``.
+"""
+
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from app.api.media_stream import recorder as recorder_module
+from app.api.media_stream.recorder import CallRecorder
+
+CALLS = 20
+CALL_SECONDS = 60
+FRAMES_PER_SECOND = 50
+SLOW_CALLS = 10
+SLOW_SECONDS = 4
+SLOW_WRITE = 0.2
+
+FRAME = base64.b64encode(
+    (np.sin(np.arange(480) / 5) * 3000).astype("<i2").tobytes()
+).decode("utf-8")
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    pick = lambda share: values[min(len(values) - 1, int(len(values) * share))]
+    return f"p50 {pick(0.5) * 1e6:6.2f} µs  p99 {pick(0.99) * 1e6:6.2f} µs  max {values[-1] * 1e6:8.1f} µs"
+
+
+def record_calls(recorder: CallRecorder, calls: int, seconds: int, paced: bool) -> list[float]:
+    """Feed frames of all calls in lockstep, return the tap durations."""
+    taps = [recorder.open(f"MZ{index:04d}") for index in range(calls)]
+    durations = []
+    started = time.perf_counter()
+    for frame in range(seconds * FRAMES_PER_SECOND):
+        for tap in taps:
+            before = time.perf_counter()
+            tap.inbound(FRAME)
+            tap.outbound(FRAME)
+            if frame % FRAMES_PER_SECOND == 0:
+                tap.event("response.audio_transcript.done", transcript="Guten Tag, wie kann ich helfen?")
+            durations.append(time.perf_counter() - before)
+        if paced:
+            time.sleep(max(0.0, started + (frame + 1) / FRAMES_PER_SECOND - time.perf_counter()))
+    for tap in taps:
+        tap.close()
+    recorder.close(timeout=60)
+    return durations
+
+
+class SlowWavWriter(recorder_module.WavWriter):
+    def flush(self):
+        if self._filled:
+            time.sleep(SLOW_WRITE)
+        super().flush()
+
+
+def check_files(directory: str, calls: int, seconds: int) -> tuple[float, int]:
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".jsonl"))
+    assert len(names) == calls
+    shortest = float("inf")
+    for name in names:
+        base = os.path.join(directory, name[: -len(".jsonl")])
+        for direction in ("inbound", "outbound"):
+            with wave.open(f"{base}.{direction}.wav") as audio:
+                shortest = min(shortest, audio.getnframes() / audio.getframerate())
+        with open(f"{base}.jsonl") as file:
+            records = [json.loads(line) for line in file]
+    return shortest, len(records)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = CallRecorder(directory, queue_size=10**7)
+        recorder.start()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        taps = record_calls(recorder, CALLS, CALL_SECONDS, paced=False)
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+        shortest, records = check_files(directory, CALLS, CALL_SECONDS)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    with tempfile.TemporaryDirectory() as directory:
+        recorder_module.WavWriter = SlowWavWriter
+        slow = CallRecorder(directory, queue_size=1000, buffer_size=64 * 1024)
+        slow.start()
+        slow_taps = record_calls(slow, SLOW_CALLS, SLOW_SECONDS, paced=True)
+        recorder_module.WavWriter = SlowWavWriter.__mro__[1]
+        with open(next(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")
+        )) as file:
+            summary = json.loads(file.readlines()[-1])
+        dropped = recorder_module._dropped_audio.value
+
+    call_minutes = CALLS * CALL_SECONDS / 60
+    print(f"tap per frame (both directions):   {percentiles(taps)}")
+    print(
+        f"recording {CALLS} calls of {CALL_SECONDS} s: {wall:.2f} s wall, {cpu:.2f} s CPU,"
+        f" {cpu / call_minutes * 1000:.1f} ms CPU per call minute, {size / 2**20:.0f} MiB"
+    )
+    print(f"  shortest WAV {shortest:.2f} s, {records} JSONL records per call")
+    print(f"slow disk ({SLOW_WRITE * 1000:.0f} ms per write), {SLOW_CALLS} calls at real time:")
+    print(f"  tap per frame:                   {percentiles(slow_taps)}")
+    print(f"  audio frames dropped:            {dropped}, last call's summary {summary}")
+
+    assert shortest == CALL_SECONDS and records == CALL_SECONDS + 1
+    assert statistics.median(slow_taps) < 4 * statistics.median(taps) + 5e-6
+    assert dropped > 0 and summary["event"] == "recording.closed"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
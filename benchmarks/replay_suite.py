@@ -0,0 +1,225 @@
+"""Replay regression suite: throughput and drift of the media stream pipeline.
+
+Synthetic calls are scripted deterministically: caller audio in pcm16 24 kHz
+and μ-law 8 kHz, greeting and answer audio from upstream, a barge-in, a
+``find_free_slots`` function call, transcripts and rate limits. They are run
+through the session in real time with capture on, which gives captures like
+the ones written in production, including the audio dropped on barge-in.
+
+The captures are then replayed as fast as possible, ``CONCURRENCY`` at once.
+Throughput in events per second is divided by the speed of a fixed
+calibration workload measured in the same process, so that the result
+compares across machines. Captures in ``--captures DIR`` are replayed after
+that, for drift only. The suite fails if
+
+- the normalized throughput falls more than the baseline's tolerance below
+  ``benchmarks/replay_baseline.json``, best of ``RUNS``,
+- any caller frame of a replay differs from its capture.
+
+Run with ``python -m benchmarks.replay_suite``, ``--update-baseline`` to
+accept the current throughput.
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "replay_baseline.json")
+DEFAULT_TOLERANCE = 0.25
+CALLS = 12
+CALL_SECONDS = 8.0
+FRAME_SECONDS = 0.02
+DELTA_SECONDS = 0.05
+CONCURRENCY = 12
+RUNS = 3
+FORMATS = (
+    ("pcm16", 24000, None),
+    ("mulaw", 8000, {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}),
+)
+
+
+def caller_audio(index: int, encoding: str, sample_rate: int) -> list[str]:
+    """Base64 caller frames, a noisy tone with pauses."""
+    from app.api.media_stream.audio_transcoder import g711_encode
+
+    rng = np.random.default_rng(index)
+    t = np.arange(int(CALL_SECONDS * sample_rate)) / sample_rate
+    envelope = np.sin(2 * np.pi * 0.3 * t) > 0
+    signal = envelope * np.sin(2 * np.pi * (150 + 10 * index) * t) * 0.4 + 0.01 * rng.standard_normal(t.size)
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    data = g711_encode(pcm, "mulaw").tobytes() if encoding == "mulaw" else pcm.tobytes()
+    step = len(data) // int(CALL_SECONDS / FRAME_SECONDS)
+    return [base64.b64encode(data[offset : offset + step]).decode("utf-8") for offset in range(0, len(data), step)]
+
+
+def assistant_audio(index: int, seconds: float) -> list[str]:
+    """Base64 pcm16 24 kHz deltas of ``DELTA_SECONDS``."""
+    samples = int(DELTA_SECONDS * 24000)
+    t = np.arange(int(seconds * 24000)) / 24000
+    pcm = (np.sin(2 * np.pi * (220 + 5 * index) * t) * 6000).astype("<i2").tobytes()
+    return [base64.b64encode(pcm[offset : offset + samples * 2]).decode("utf-8") for offset in range(0, len(pcm), samples * 2)]
+
+
+def response_events(at: float, response_id: str, deltas: list[str], transcript: str, output: list = ()) -> list:
+    # The model generates faster than real time, deltas arrive in bursts
+    events = [(at, {"type": "response.created", "response": {"id": response_id}})]
+    for number, delta in enumerate(deltas):
+        events.append((at + 0.1 + number * DELTA_SECONDS / 4, {"type": "response.audio.delta", "response_id": response_id, "delta": delta}))
+    done_at = at + 0.2 + len(deltas) * DELTA_SECONDS / 4
+    events.append((done_at, {"type": "response.audio_transcript.done", "response_id": response_id, "transcript": transcript}))
+    events.append((done_at, {"type": "response.done", "response": {"id": response_id, "status": "completed", "output": list(output)}}))
+    return events
+
+
+def script(index: int) -> tuple[dict, list[tuple[float, str, str]]]:
+    """Start frame and received messages of synthetic call ``index``."""
+    encoding, sample_rate, media_format = FORMATS[index % len(FORMATS)]
+    stream_sid = f"MZsynthetic{index:03d}"
+    start = {"streamSid": stream_sid, "callSid": f"CAsynthetic{index:03d}"}
+    if media_format:
+        start["mediaFormat"] = media_format
+
+    upstream = [(0.0, {"type": "session.updated", "session": {}})]
+    upstream += response_events(0.1, "resp_intro", assistant_audio(index, 3.0), "Praxis Dr. Zahn, guten Tag.")
+    # The caller interrupts the greeting
+    upstream.append((1.2, {"type": "input_audio_buffer.speech_started", "audio_start_ms": 1200}))
+    upstream.append((2.4, {"type": "input_audio_buffer.speech_stopped", "audio_end_ms": 2400}))
+    upstream.append((2.6, {"type": "conversation.item.input_audio_transcription.completed", "item_id": "item_caller", "transcript": "Ich brauche einen Termin."}))
+    function_call = {
+        "id": "item_fc",
+        "type": "function_call",
+        "status": "completed",
+        "name": "find_free_slots",
+        "call_id": f"call_{index}",
+        "arguments": json.dumps({"near": "2030-01-07T10:00:00Z"}),
+    }
+    upstream += response_events(2.7, "resp_tool", [], "", [function_call])
+    upstream += response_events(3.2, "resp_answer", assistant_audio(index, 2.5), "Am Montag um zehn wäre frei.")
+    upstream.append((4.0, {"type": "rate_limits.updated", "rate_limits": [{"name": "tokens", "limit": 40000, "remaining": 39000, "reset_seconds": 1.0}]}))
+
+    client = [
+        (
+            round(number * FRAME_SECONDS, 6),
+            json.dumps({"event": "media", "streamSid": stream_sid, "media": {"payload": payload, "timestamp": int(number * FRAME_SECONDS * 1000)}}),
+        )
+        for number, payload in enumerate(caller_audio(index, encoding, sample_rate))
+    ]
+    messages = [(at, "client_in", message) for at, message in client]
+    messages += [(round(at, 6), "upstream_in", json.dumps(event)) for at, event in upstream]
+    messages.sort(key=lambda item: item[0])
+    return start, messages
+
+
+async def write_synthetic_captures(directory: str) -> list[str]:
+    """Capture all synthetic calls, concurrently and in real time."""
+    from app.api.media_stream.capture import CaptureWriter
+    from test_client.replay import feed
+
+    writer = CaptureWriter(directory)
+
+    async def capture_call(index: int):
+        start, messages = script(index)
+        capture = writer.open(start=start)
+        try:
+            await feed(start, messages, speed=1.0, capture=capture)
+        finally:
+            capture.close()
+
+    await asyncio.gather(*(capture_call(index) for index in range(CALLS)))
+    writer.close()
+    return writer.paths
+
+
+def calibrate(seconds: float = 0.5) -> float:
+    """Iterations per second of a fixed mix of JSON and base64 work."""
+    frame = base64.b64encode(bytes(960)).decode("utf-8")
+    message = json.dumps({"event": "media", "media": {"payload": frame}})
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _ in range(100):
+            base64.b64decode(json.loads(message)["media"]["payload"])
+        count += 100
+    return count / (time.perf_counter() - started)
+
+
+async def run_suite(paths: list[str]) -> tuple[float, dict, list[dict]]:
+    from test_client.replay import replay_all, summarize
+
+    best, best_summary, best_results = 0.0, None, None
+    for _ in range(RUNS):
+        calibration = calibrate()
+        results, wall = await replay_all(paths, concurrency=CONCURRENCY)
+        summary = summarize(results, wall)
+        normalized = summary["events_per_second"] / calibration
+        if normalized > best:
+            best, best_summary, best_results = normalized, summary, results
+    return best, best_summary, best_results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--captures", help="directory with more captures to replay")
+    parser.add_argument("--update-baseline", action="store_true", help="store the measured throughput as baseline")
+    args = parser.parse_args()
+
+    from test_client.replay import local_fakes, print_report, replay_all, summarize
+
+    with tempfile.TemporaryDirectory() as directory:
+        async with local_fakes():
+            with contextlib.redirect_stdout(io.StringIO()):
+                paths = await write_synthetic_captures(directory)
+                normalized, summary, results = await run_suite(paths)
+                if args.captures:
+                    extra = sorted(glob.glob(os.path.join(args.captures, "*.jsonl.gz")))
+                    extra_results, wall = await replay_all(extra, concurrency=CONCURRENCY)
+        print_report(results, summary)
+        if args.captures:
+            extra_summary = summarize(extra_results, wall)
+            print_report(extra_results, extra_summary)
+            summary["drift"] += extra_summary["drift"]
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as file:
+            baseline = json.load(file)
+    tolerance = baseline.get("tolerance", DEFAULT_TOLERANCE)
+    print(f"normalized throughput {normalized:.4f} events per calibration iteration")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as file:
+            json.dump({"normalized_throughput": round(normalized, 4), "tolerance": tolerance}, file, indent=2)
+            file.write("\n")
+        print(f"baseline updated: {BASELINE_PATH}")
+        return 0
+
+    failures = []
+    if summary["drift"]:
+        failures.append(f"{summary['drift']} caller frames differ from the captures")
+    if "normalized_throughput" in baseline:
+        floor = baseline["normalized_throughput"] * (1 - tolerance)
+        print(f"baseline {baseline['normalized_throughput']:.4f}, failing below {floor:.4f}")
+        if normalized < floor:
+            failures.append(f"throughput {normalized:.4f} below {floor:.4f}")
+    else:
+        print("no baseline yet, run with --update-baseline")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
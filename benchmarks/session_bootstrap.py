@@ -0,0 +1,91 @@
+"""Time from websocket accept to an initialized Realtime session.
+
+Compares the previous ``initialize_session``, which read both prompt files,
+rebuilt the ``session.update`` dict and serialized it twice per call, with
+sending the prebuilt payload. The upstream socket is an in-process fake, so
+only the server-side work is measured.
+
+Run with ``python -m benchmarks.session_bootstrap``.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from app.api.media_stream.services import initialize_session
+from app.api.media_stream.session_bootstrap import session_bootstrap
+from app.config import VOICE
+from app.prompts.prompt_file_paths import INTRO_SPEECH, SYSTEM
+from app.tools.cal_tool import CalTool
+from app.tools.notify_staff_tool import NotifyStaffTool
+from test_client.fakes import FakeClientWebSocket, FakeUpstream
+
+SESSIONS = 2000
+
+
+async def legacy_initialize_session(openai_ws):
+    with open(SYSTEM) as file:
+        system_prompt = file.read()
+    with open(INTRO_SPEECH) as file:
+        intro_speech_prompt = file.read()
+
+    session_update = {
+        "type": "session.update",
+        "session": {
+            "turn_detection": {"type": "server_vad"},
+            "input_audio_format": "pcm16",
+            "output_audio_format": "pcm16",
+            "voice": VOICE,
+            "instructions": system_prompt,
+            "modalities": ["text", "audio"],
+            "temperature": 0.8,
+            "tools": [
+                CalTool.get_create_booking_description(),
+                CalTool.get_cancel_booking_description(),
+                NotifyStaffTool.get_create_call_back_description(),
+            ],
+        },
+    }
+    intro_speech = {
+        "type": "response.create",
+        "response": {"instructions": intro_speech_prompt},
+    }
+    print("Sending session update:", json.dumps(session_update))
+    await openai_ws.send(json.dumps(session_update))
+    await openai_ws.send(json.dumps(intro_speech))
+
+
+async def measure(initialize) -> list[float]:
+    durations = []
+    for _ in range(SESSIONS):
+        client, upstream = FakeClientWebSocket(), FakeUpstream()
+        accepted = time.perf_counter()
+        await initialize(upstream)
+        durations.append(time.perf_counter() - accepted)
+        assert len(upstream.sent) == 2 and not client.sent
+    return sorted(durations)
+
+
+def report(name: str, durations: list[float]):
+    p50 = statistics.median(durations) * 1e6
+    p99 = durations[int(len(durations) * 0.99)] * 1e6
+    print(f"{name:<10} p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+
+async def main():
+    session_bootstrap.reload_if_changed()
+    # Both variants print once per call, the output itself is not of interest
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy = await measure(legacy_initialize_session)
+        prebuilt = await measure(initialize_session)
+    print(f"accept -> session initialized over {SESSIONS} sessions")
+    report("legacy", legacy)
+    report("prebuilt", prebuilt)
+    print(f"speedup    {statistics.median(legacy) / statistics.median(prebuilt):.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Soak test: open and abruptly kill thousands of fake calls.
+
+Every call runs a full ``MediaStreamSession`` over in-process fake sockets
+while audio flows in both directions, then dies in one of several ways: the
+caller hangs up, the upstream socket breaks, the upstream closes cleanly or
+the handler task is cancelled (server shutdown). Afterwards live sessions,
+asyncio tasks and traced memory must be back at their baseline and every
+socket must have been closed.
+
+Run with ``python -m benchmarks.session_soak``.
+"""
+
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+
+from app.api.media_stream.session import MediaStreamSession, active_session_count
+from app.event_log import event_log
+from test_client.fakes import (
+    AUDIO_FRAME,
+    FakeClientWebSocket,
+    FakeUpstream,
+    audio_delta_events,
+)
+
+CALLS = 5000
+CONCURRENT = 500
+MAX_MEMORY_GROWTH = 1024 * 1024
+CLIENT_FRAME = json.dumps({"event": "media", "media": {"payload": AUDIO_FRAME, "timestamp": 0}})
+
+
+async def one_call(rng: random.Random, sockets: list):
+    client = FakeClientWebSocket()
+    upstream = FakeUpstream(audio_delta_events(rng.randint(0, 20)), keep_open=True)
+    sockets.append((client, upstream))
+    session = MediaStreamSession(client, upstream)
+    task = asyncio.create_task(session.run())
+
+    for _ in range(rng.randint(0, 10)):
+        client.inbound.put_nowait(CLIENT_FRAME)
+    await asyncio.sleep(rng.random() * 0.05)
+
+    kill = rng.choice(["hangup", "upstream_error", "upstream_close", "cancel"])
+    if kill == "hangup":
+        client.disconnect()
+    elif kill == "upstream_error":
+        upstream.fail(ConnectionResetError("connection reset by peer"))
+    elif kill == "upstream_close":
+        await upstream.close()
+    else:
+        task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+async def run_calls(count: int, rng: random.Random, sockets: list):
+    for start in range(0, count, CONCURRENT):
+        batch = min(CONCURRENT, count - start)
+        await asyncio.gather(*(one_call(rng, sockets) for _ in range(batch)))
+
+
+async def main():
+    rng = random.Random(7)
+    event_log.sink = open(os.devnull, "w")
+    # Warm up imports and caches so they do not count as growth
+    await run_calls(CONCURRENT, rng, [])
+    event_log.close()
+
+    gc.collect()
+    tracemalloc.start()
+    baseline_memory = tracemalloc.get_traced_memory()[0]
+    baseline_tasks = len(asyncio.all_tasks())
+
+    sockets = []
+    started = time.perf_counter()
+    await run_calls(CALLS, rng, sockets)
+    duration = time.perf_counter() - started
+    # Queued log records are not part of the sessions
+    event_log.close()
+
+    unclosed_upstream = sum(not upstream.closed for _, upstream in sockets)
+    open_clients = sum(
+        not client.closed and client.client_state.name == "CONNECTED"
+        for client, _ in sockets
+    )
+    sockets.clear()
+    await asyncio.sleep(0.1)
+    gc.collect()
+    memory_growth = tracemalloc.get_traced_memory()[0] - baseline_memory
+    tasks = len(asyncio.all_tasks())
+    tracemalloc.stop()
+
+    print(f"calls killed:            {CALLS} in {duration:.1f} s ({CONCURRENT} concurrent)")
+    print(f"live sessions after:     {active_session_count()}")
+    print(f"asyncio tasks:           {baseline_tasks} -> {tasks}")
+    print(f"unclosed upstream:       {unclosed_upstream}")
+    print(f"open client sockets:     {open_clients}")
+    print(f"traced memory growth:    {memory_growth / 1024:.1f} KiB")
+
+    assert active_session_count() == 0
+    assert tasks == baseline_tasks
+    assert unclosed_upstream == 0 and open_clients == 0
+    assert memory_growth < MAX_MEMORY_GROWTH
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""Silence suppression on synthetic speech with pauses.
+
+Builds a call of pcm16 24 kHz 20 ms frames: utterances of voiced syllables,
+some starting with a quiet fricative ("s"), separated by pauses of line noise
+between half a second and six seconds. Every frame is labelled, so the
+filter's decisions can be checked:
+
+- no speech frame is held back,
+- audio just before each utterance and the hangover after it are sent,
+- during long pauses a keep-alive goes out at least every keep-alive period,
+- most of the pause audio is suppressed.
+
+It runs once on a quiet line and once on a line with steady hiss that is
+louder than the fixed threshold, where the noise floor has to be learned,
+then on the quiet line again with ``SILENCE_PRE_ROLL_MS=0``.
+
+Run with ``python -m benchmarks.silence_suppression``.
+"""
+
+import base64
+import time
+
+import numpy as np
+
+from app.api.media_stream.silence_filter import SilenceSuppressor
+from app.config import SILENCE_PRE_ROLL_MS
+
+SAMPLE_RATE = 24000
+FRAME = SAMPLE_RATE // 50
+FRAME_SECONDS = FRAME / SAMPLE_RATE
+CALL_SECONDS = 120
+# Audio before each labelled onset that has to reach upstream. Less than the
+# pre-roll, since in hiss a quiet fricative is only detected a few frames late.
+ONSET_LEAD_SECONDS = 0.1
+
+
+def dbfs(level: float) -> float:
+    return 32768 * 10 ** (level / 20)
+
+
+def synthetic_call(noise_dbfs: float, seed: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    """pcm16 samples and a per-frame speech label."""
+    rng = np.random.default_rng(seed)
+    frames = int(CALL_SECONDS / FRAME_SECONDS)
+    signal = rng.standard_normal(frames * FRAME) * dbfs(noise_dbfs)
+    labels = np.zeros(frames, dtype=bool)
+
+    frame = int(rng.uniform(1, 3) / FRAME_SECONDS)
+    while frame < frames - 200:
+        utterance = int(rng.uniform(0.8, 3.0) / FRAME_SECONDS)
+        start = frame * FRAME
+        position = start
+        for syllable in range(utterance * FRAME // 4800):
+            if rng.random() < 0.3:
+                # Quiet fricative below the fixed threshold, high-pitched noise
+                fricative = np.diff(rng.standard_normal(1441)) * dbfs(-57) / np.sqrt(2)
+                signal[position:position + 1440] += fricative
+                position += 1440
+            t = np.arange(3360) / SAMPLE_RATE
+            pitch = rng.uniform(110, 220)
+            voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+            envelope = np.sin(np.pi * np.arange(3360) / 3360) ** 0.5
+            signal[position:position + 3360] += voiced * envelope * dbfs(-20)
+            position += 3360
+        labels[frame:-(-position // FRAME)] = True
+        frame = -(-position // FRAME) + int(rng.uniform(0.5, 6.0) / FRAME_SECONDS)
+
+    pcm = np.clip(signal, -32768, 32767).astype("<i2")
+    return pcm, labels
+
+
+def run(
+    pcm: np.ndarray, labels: np.ndarray, pre_roll_ms: int = SILENCE_PRE_ROLL_MS
+) -> tuple[np.ndarray, np.ndarray, float, SilenceSuppressor]:
+    suppressor = SilenceSuppressor(SAMPLE_RATE, pre_roll_ms=pre_roll_ms)
+    payloads = [
+        base64.b64encode(pcm[i * FRAME:(i + 1) * FRAME]).decode("utf-8")
+        for i in range(len(labels))
+    ]
+    frame_index = {id(payload): index for index, payload in enumerate(payloads)}
+    forwarded = np.zeros(len(labels), dtype=bool)
+    keepalive = np.zeros(len(labels), dtype=bool)
+    started = time.process_time()
+    for index, payload in enumerate(payloads):
+        keepalives_before = suppressor.frames_keepalive
+        result = suppressor.filter(payload)
+        if result is None:
+            continue
+        if suppressor.frames_keepalive > keepalives_before:
+            # A keep-alive is the oldest frame held back, not this one
+            keepalive[frame_index[id(result)]] = True
+        else:
+            # Held frames are sent along with this one, they directly precede it
+            frames_sent = len(base64.b64decode(result)) // (FRAME * 2)
+            forwarded[index - frames_sent + 1:index + 1] = True
+    cpu = (time.process_time() - started) / len(payloads)
+    return forwarded, keepalive, cpu, suppressor
+
+
+def check(name: str, noise_dbfs: float, pre_roll_ms: int = SILENCE_PRE_ROLL_MS):
+    pcm, labels = synthetic_call(noise_dbfs)
+    forwarded, keepalive, cpu, suppressor = run(pcm, labels, pre_roll_ms)
+    silence = ~labels
+
+    onsets = np.flatnonzero(labels[1:] & ~labels[:-1]) + 1
+    ends = np.flatnonzero(labels[:-1] & ~labels[1:]) + 1
+    # Without a pre-roll nothing before an onset is sent along
+    lead = int(ONSET_LEAD_SECONDS / FRAME_SECONDS) if pre_roll_ms else 0
+    hangover = suppressor.hangover // FRAME
+    # The noise floor is still being learned at the start of the hissy call
+    settled = onsets[onsets > 10 / FRAME_SECONDS]
+    sent = forwarded | keepalive
+    clipped_onsets = sum(not sent[max(0, i - lead):i].all() for i in settled)
+    short_hangovers = sum(not forwarded[i:i + hangover].all() for i in ends)
+
+    longest_gap = np.diff(np.flatnonzero(sent)).max() * FRAME_SECONDS
+    suppressed_share = 1 - forwarded[silence].mean() - keepalive[silence].mean()
+
+    print(f"{name}: noise {noise_dbfs:.0f} dBFS, {len(labels)} frames, {labels.mean():.0%} speech")
+    print(
+        f"  forwarded {suppressor.frames_forwarded}, keep-alive {suppressor.frames_keepalive},"
+        f" suppressed {suppressor.frames_suppressed}"
+    )
+    print(f"  pause audio suppressed:   {suppressed_share:.0%}")
+    print(f"  speech frames held back:  {(labels & ~forwarded).sum()}")
+    print(f"  clipped onsets:           {clipped_onsets} of {len(settled)}")
+    print(f"  short hangovers:          {short_hangovers} of {len(ends)}")
+    print(f"  longest gap upstream:     {longest_gap:.2f} s")
+    print(f"  cpu per frame:            {cpu * 1e6:.1f} µs")
+
+    assert not (labels & ~forwarded).any()
+    assert clipped_onsets == 0 and short_hangovers == 0
+    assert longest_gap <= suppressor.keepalive / SAMPLE_RATE + FRAME_SECONDS
+    assert suppressed_share > 0.5
+
+
+def main():
+    check("quiet line", -65)
+    check("hissy line", -45)
+    check("quiet line, no pre-roll", -65, pre_roll_ms=0)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
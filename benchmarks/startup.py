@@ -0,0 +1,134 @@
+"""Cold start of a worker, for each ``STARTUP_WARMUP`` mode.
+
+Every mode runs in a fresh process against a fake cal.com API served by this
+one, and reports
+
+- import: ``import app.main``,
+- listening: process spawn until the server accepts connections,
+- first tool call: a ``create_booking`` right after listening,
+- first OpenAI client: ``load_openai_client()`` right after that, which is
+  what the first cancellation that needs the model waits for,
+- max loop lag: the largest event-loop stall in the first second after
+  listening, which live calls would hear,
+- clients ready: spawn until the warm-up logged that it is done.
+
+Run with ``python -m benchmarks.startup``.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("eager", "background", "lazy")
+RUNS = 3
+PROBE_SECONDS = 1.0
+PROBE_INTERVAL = 0.005
+
+
+async def child(result_path: str):
+    started = time.perf_counter()
+    import app.main
+
+    imported = time.perf_counter()
+
+    from app.tools.clients import load_openai_client
+    from app.tools.registry import tool_registry
+    from test_client.servers import serve_in_background
+
+    lags = []
+
+    async def probe():
+        deadline = time.perf_counter() + PROBE_SECONDS
+        while time.perf_counter() < deadline:
+            before = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(time.perf_counter() - before - PROBE_INTERVAL)
+
+    async with serve_in_background(app.main.app):
+        listening_at = time.time()
+        listening = time.perf_counter()
+        probing = asyncio.create_task(probe())
+        arguments = json.dumps({"start": "2030-01-07T10:00:00Z", "attendee_name": "Peter Müller"})
+        await tool_registry.call("create_booking", arguments, "call_startup")
+        tool = time.perf_counter()
+        await load_openai_client()
+        openai_client = time.perf_counter()
+        await probing
+
+    with open(result_path, "w") as file:
+        json.dump(
+            {
+                "import": imported - started,
+                "listening_at": listening_at,
+                "first tool call": tool - listening,
+                "first OpenAI client": openai_client - tool,
+                "max loop lag": max(lags),
+            },
+            file,
+        )
+
+
+def run_child(mode: str, cal_url: str, directory: str) -> dict:
+    result_path = os.path.join(directory, f"{mode}.json")
+    env = dict(
+        os.environ,
+        STARTUP_WARMUP=mode,
+        OPENAI_API_KEY="startup",
+        CAL_API_BASE_URL=cal_url,
+        CALLBACK_DB_PATH=os.path.join(directory, "callbacks.db"),
+        GREETING_CACHE="false",
+        # Keep the refresh of the availability index out of the way
+        AVAILABILITY_REFRESH_INTERVAL="3600",
+    )
+    spawned_at = time.time()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", result_path],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    with open(result_path) as file:
+        result = json.load(file)
+    result["listening"] = result.pop("listening_at") - spawned_at
+    result["clients ready"] = float("nan")
+    for line in output.splitlines():
+        if '"clients.warmed_up"' in line:
+            result["clients ready"] = json.loads(line)["ts"] - spawned_at
+    return result
+
+
+async def main():
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        async with serve_in_background(create_app()) as cal_url:
+            for mode in MODES:
+                runs = [await asyncio.to_thread(run_child, mode, cal_url, directory) for _ in range(RUNS)]
+                results[mode] = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+    names = ("import", "listening", "first tool call", "first OpenAI client", "max loop lag", "clients ready")
+    print(f"median of {RUNS} cold starts, milliseconds")
+    print(f"  {'':<22}" + "".join(f"{mode:>12}" for mode in MODES))
+    for name in names:
+        print(f"  {name:<22}" + "".join(f"{results[mode][name] * 1000:>12.1f}" for mode in MODES))
+
+    eager, background, lazy = results["eager"], results["background"], results["lazy"]
+    assert background["listening"] < eager["listening"]
+    assert background["first OpenAI client"] < lazy["first OpenAI client"]
+    assert max(mode["max loop lag"] for mode in results.values()) < 0.2
+    print("OK")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        asyncio.run(child(sys.argv[2]))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Check that a slow tool call does not stall audio forwarding of other calls.
+
+Session A runs ``create_booking`` against a local cal.com stub that answers
+after ``STUB_DELAY`` seconds while session B keeps forwarding 20 ms audio
+deltas. With blocking tools the largest gap between two forwarded frames of
+session B equals the stub delay; with the async path it stays at the frame
+interval.
+
+Run with ``python -m benchmarks.tool_call_blocking``.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+STUB_DELAY = 1.5
+FRAME_INTERVAL = 0.02
+MAX_ALLOWED_GAP = 0.1
+
+
+async def main():
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    async with serve_in_background(create_app(delay=STUB_DELAY)) as base_url:
+        os.environ["CAL_API_BASE_URL"] = base_url
+
+        from app.api.media_stream.services import handle_function_calls, send_to_client
+        from app.api.media_stream.session import MediaStreamSession
+        from app.tools.clients import close_clients, get_cal_client
+        from test_client.fakes import FakeClientWebSocket, FakeUpstream, audio_delta_events
+
+        get_cal_client()  # created at startup by the app lifespan
+        frame_count = int(STUB_DELAY * 2 / FRAME_INTERVAL)
+        client_b = FakeClientWebSocket()
+        upstream_b = FakeUpstream(audio_delta_events(frame_count), FRAME_INTERVAL)
+        upstream_a = FakeUpstream()
+        booking_call = {
+            "id": "item_1",
+            "call_id": "call_1",
+            "type": "function_call",
+            "status": "completed",
+            "name": "create_booking",
+            "arguments": json.dumps(
+                {"start": "2024-12-08T10:00:00Z", "attendee_name": "Peter Müller"}
+            ),
+        }
+
+        session_b = MediaStreamSession(client_b, upstream_b)
+        session_b.set_stream_sid("stream_b")
+        pump_b = asyncio.create_task(send_to_client(session_b))
+        await asyncio.sleep(FRAME_INTERVAL * 5)
+        tool_started = time.perf_counter()
+        await handle_function_calls(upstream_a, [booking_call])
+        tool_finished = time.perf_counter()
+        await pump_b
+        await session_b.media_buffer.close()
+        await close_clients()
+
+    during_tool = [t for t in client_b.sent_at if tool_started <= t <= tool_finished]
+    gaps = [b - a for a, b in zip(client_b.sent_at, client_b.sent_at[1:])]
+    max_gap = max(gaps)
+
+    print(f"tool call duration:          {tool_finished - tool_started:.3f} s")
+    print(f"frames forwarded during tool: {len(during_tool)}")
+    print(f"max gap between frames:       {max_gap * 1000:.1f} ms")
+    print(f"tool result sent upstream:    {bool(upstream_a.sent)}")
+
+    assert upstream_a.sent, "tool call produced no function_call_output"
+    assert max_gap < MAX_ALLOWED_GAP, "audio forwarding stalled during tool call"
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
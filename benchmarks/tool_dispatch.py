@@ -0,0 +1,127 @@
+"""Concurrent dispatch of the function calls of one response.
+
+A ``response.done`` with a booking, a cancellation and a call-back request
+is handled against a local cal.com stub that answers after ``STUB_DELAY``
+seconds. Run one after another the calls take the sum of their durations,
+dispatched together as long as the slowest one. The results have to go
+upstream in call order, followed by a single ``response.create``.
+
+Then the booking tool gets a timeout below the stub delay: the call has to
+be answered with the tool's fallback instead of leaving the model waiting.
+
+Run with ``python -m benchmarks.tool_dispatch``.
+"""
+
+import asyncio
+import dataclasses
+import json
+import os
+import time
+
+STUB_DELAY = 0.5
+SHORT_TIMEOUT = 0.1
+
+
+def function_call(index: int, name: str, arguments: dict) -> dict:
+    return {
+        "id": f"item_{index}",
+        "call_id": f"call_{index}",
+        "type": "function_call",
+        "status": "completed",
+        "name": name,
+        "arguments": json.dumps(arguments),
+    }
+
+
+async def main():
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    fake_cal = create_app(delay=STUB_DELAY)
+    async with serve_in_background(fake_cal) as base_url:
+        os.environ["CAL_API_BASE_URL"] = base_url
+
+        from app.api.media_stream.services import handle_function_calls
+        from app.tools.clients import close_clients, get_cal_client
+        from app.tools.registry import tool_registry
+        from test_client.fakes import FakeUpstream
+
+        get_cal_client()  # created at startup by the app lifespan
+        fake_cal.state.bookings["existing"] = {
+            "uid": "existing",
+            "start": "2030-05-06T09:00:00Z",
+            "status": "accepted",
+            "attendees": [{"name": "Erika Muster"}],
+        }
+        calls = [
+            function_call(1, "create_booking", {
+                "start": "2030-05-07T10:00:00Z",
+                "attendee_name": "Peter Müller",
+                "additonal_notes": "Kontrolle",
+            }),
+            function_call(2, "cancel_booking", {
+                "uid": "existing", "start": "2030-05-06", "attendee_name": "Erika Muster",
+            }),
+            function_call(3, "create_call_back", {
+                "description": "Frage zur Rechnung",
+                "name": "Peter Müller",
+                "preferred_contact": "0170 1234567",
+            }),
+        ]
+
+        sequential = FakeUpstream()
+        started = time.perf_counter()
+        for call in calls:
+            await handle_function_calls(sequential, [call])
+        sequential_seconds = time.perf_counter() - started
+
+        # Fresh slot and booking for the concurrent run
+        calls[0] = function_call(1, "create_booking", {
+            "start": "2030-05-07T11:00:00Z", "attendee_name": "Peter Müller",
+        })
+        fake_cal.state.bookings["existing"]["status"] = "accepted"
+        concurrent = FakeUpstream()
+        started = time.perf_counter()
+        await handle_function_calls(concurrent, calls)
+        concurrent_seconds = time.perf_counter() - started
+
+        booking_tool = tool_registry.get("create_booking")
+        tool_registry.register(dataclasses.replace(booking_tool, timeout=SHORT_TIMEOUT))
+        timed_out = FakeUpstream()
+        started = time.perf_counter()
+        await handle_function_calls(timed_out, [
+            function_call(4, "create_booking", {
+                "start": "2030-05-07T12:00:00Z", "attendee_name": "Peter Müller",
+            }),
+            function_call(5, "does_not_exist", {}),
+        ])
+        timeout_seconds = time.perf_counter() - started
+        tool_registry.register(booking_tool)
+        await close_clients()
+
+    frames = [json.loads(frame) for frame in concurrent.sent]
+    outputs = [frame["item"] for frame in frames if frame["type"] == "conversation.item.create"]
+    responses = [frame for frame in frames if frame["type"] == "response.create"]
+    timeout_outputs = [json.loads(frame) for frame in timed_out.sent][:2]
+
+    print(f"sequential:          {sequential_seconds:.2f} s")
+    print(f"concurrent:          {concurrent_seconds:.2f} s (stub delay {STUB_DELAY:.2f} s)")
+    for item in outputs:
+        print(f"  {item['call_id']}: {item['output']}")
+    print(f"  follow-up: {responses[0]['response']['instructions']}")
+    print(f"timed out booking:   {timeout_seconds:.2f} s (timeout {SHORT_TIMEOUT:.2f} s)")
+    for frame in timeout_outputs:
+        print(f"  {frame['item']['call_id']}: {frame['item']['output']}")
+
+    assert [item["call_id"] for item in outputs] == ["call_1", "call_2", "call_3"]
+    assert all("erfolgreich" in item["output"] for item in outputs)
+    assert len(responses) == 1 and frames[-1] is responses[0]
+    assert concurrent_seconds < STUB_DELAY * 1.5 < sequential_seconds
+    assert timeout_seconds < STUB_DELAY
+    assert timeout_outputs[0]["item"]["output"] == booking_tool.fallback
+    assert timeout_outputs[1]["item"]["output"]
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Time to first upstream audio for a new call, with and without warm pool.
+
+Runs against the local fake Realtime API with a simulated handshake and
+session.update latency. For every call the clock starts when the caller's
+websocket would have been accepted and stops at the first
+``response.audio.delta`` of the greeting.
+
+Run with ``python -m benchmarks.upstream_pool``.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import time
+
+from app.api.media_stream.upstream_pool import UpstreamPool
+from test_client.fake_realtime_server import FakeRealtimeConfig, FakeRealtimeServer
+
+CALLS = 20
+POOL_SIZE = 2
+# Pause between calls so the pool can refill in the background
+CALL_INTERVAL = 0.5
+
+
+async def time_to_first_audio(pool: UpstreamPool) -> float:
+    accepted = time.perf_counter()
+    async with pool.session() as openai_ws:
+        async for message in openai_ws:
+            if json.loads(message)["type"] == "response.audio.delta":
+                return time.perf_counter() - accepted
+
+
+async def measure(pool: UpstreamPool) -> list[float]:
+    pool.start()
+    await asyncio.sleep(CALL_INTERVAL)
+    durations = []
+    for _ in range(CALLS):
+        durations.append(await time_to_first_audio(pool))
+        await asyncio.sleep(CALL_INTERVAL)
+    await pool.close()
+    return durations
+
+
+async def main():
+    server = FakeRealtimeServer(
+        FakeRealtimeConfig(
+            handshake_delay=0.15, session_update_delay=0.1, response_delay=0.05
+        )
+    )
+    async with server.serve() as url:
+        with contextlib.redirect_stdout(io.StringIO()):
+            cold = await measure(UpstreamPool(size=0, url=url))
+        warm_pool = UpstreamPool(size=POOL_SIZE, url=url)
+        warm = await measure(warm_pool)
+
+    print(f"time to first audio over {CALLS} calls (fake upstream)")
+    print(f"no pool      p50 {statistics.median(cold) * 1000:6.1f} ms   max {max(cold) * 1000:6.1f} ms")
+    print(f"warm pool    p50 {statistics.median(warm) * 1000:6.1f} ms   max {max(warm) * 1000:6.1f} ms")
+    print(f"pool hits    {warm_pool.hits}/{CALLS}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+"""Local stand-in for the cal.com v2 bookings API.
+
+Keeps bookings in memory and can add an artificial delay to every response,
+which is enough to exercise the calendar tools without a cal.com account.
+``app.state.requests`` counts the requests served, per method and path.
+
+Faults can be injected per request with the probabilities in
+``app.state.faults``: ``unavailable`` answers 503 without doing anything,
+``lost_response`` does the work but answers 502, as if the response got
+lost on the way, and ``slow`` adds ``app.state.slow_delay`` seconds. Writes
+with an ``Idempotency-Key`` header are applied once, repeats get the first
+answer.
+
+Run standalone with ``python -m test_client.fake_cal_server`` and point the
+app at it with ``CAL_API_BASE_URL=http://127.0.0.1:8001``.
+"""
+
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(delay: float = 0.0, faults: dict = None, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.delay = delay
+    app.state.bookings = {}
+    app.state.requests = {}
+    app.state.faults = {
+        "unavailable": 0.0,
+        "lost_response": 0.0,
+        "slow": 0.0,
+        **(faults or {}),
+    }
+    app.state.slow_delay = 2.0
+    app.state.random = random.Random(seed)
+    # Idempotency key to the first answer of a write
+    app.state.idempotent = {}
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        faults = app.state.faults
+        if app.state.random.random() < faults["slow"]:
+            await asyncio.sleep(app.state.slow_delay)
+        if app.state.random.random() < faults["unavailable"]:
+            return JSONResponse({"status": "error"}, status_code=503)
+        response = await call_next(request)
+        if app.state.random.random() < faults["lost_response"]:
+            return JSONResponse({"status": "error"}, status_code=502)
+        return response
+
+    @app.middleware("http")
+    async def count_requests(request: Request, call_next):
+        route = f"{request.method} {request.url.path}"
+        app.state.requests[route] = app.state.requests.get(route, 0) + 1
+        return await call_next(request)
+
+    def replay(request: Request) -> JSONResponse | None:
+        first = app.state.idempotent.get(request.headers.get("idempotency-key"))
+        if first is None:
+            return None
+        return JSONResponse(first[0], status_code=first[1])
+
+    def respond(request: Request, content: dict, status_code: int = 200) -> JSONResponse:
+        key = request.headers.get("idempotency-key")
+        if key:
+            app.state.idempotent[key] = (content, status_code)
+        return JSONResponse(content, status_code=status_code)
+
+    async def simulate_latency():
+        if app.state.delay:
+            await asyncio.sleep(app.state.delay)
+
+    @app.post("/v2/bookings")
+    async def create_booking(request: Request):
+        # Read first: like cal.com, a booking goes through even if the
+        # client gives up while waiting for the response
+        payload = await request.json()
+        await simulate_latency()
+        replayed = replay(request)
+        if replayed is not None:
+            return replayed
+        taken = any(
+            booking["start"] == payload["start"] and booking["status"] == "accepted"
+            for booking in app.state.bookings.values()
+        )
+        if taken:
+            return respond(
+                request,
+                {"status": "error", "error": {"message": "slot not available"}},
+                400,
+            )
+
+        booking_uid = uuid.uuid4().hex
+        start = datetime.fromisoformat(payload["start"])
+        end = start + timedelta(minutes=payload.get("lengthInMinutes", 30))
+        booking = {
+            "uid": booking_uid,
+            "start": payload["start"],
+            "end": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "eventTypeId": payload.get("eventTypeId"),
+            "status": "accepted",
+            "attendees": [payload["attendee"]],
+            "metadata": payload.get("metadata", {}),
+        }
+        app.state.bookings[booking_uid] = booking
+        return respond(request, {"status": "success", "data": dict(booking)})
+
+    @app.get("/v2/bookings")
+    async def list_bookings(
+        afterStart: str = None,
+        beforeEnd: str = None,
+        eventTypeId: int = None,
+        take: int = 100,
+        skip: int = 0,
+    ):
+        await simulate_latency()
+        bookings = [
+            booking
+            for booking in app.state.bookings.values()
+            if booking["status"] == "accepted"
+            and (eventTypeId is None or booking["eventTypeId"] == eventTypeId)
+            and (afterStart is None or booking["start"] >= afterStart[:19])
+            and (beforeEnd is None or booking["start"] <= beforeEnd[:19])
+        ]
+        page = bookings[skip : skip + take]
+        return {
+            "status": "success",
+            "data": page,
+            "pagination": {
+                "totalItems": len(bookings),
+                "returnedItems": len(page),
+                "itemsPerPage": take,
+                "hasNextPage": skip + take < len(bookings),
+            },
+        }
+
+    @app.post("/v2/bookings/{uid}/cancel")
+    async def cancel_booking(uid: str, request: Request):
+        await simulate_latency()
+        replayed = replay(request)
+        if replayed is not None:
+            return replayed
+        booking = app.state.bookings.get(uid)
+        if booking is None or booking["status"] != "accepted":
+            return respond(
+                request,
+                {"status": "error", "error": {"message": "booking not found"}},
+                404,
+            )
+        booking["status"] = "cancelled"
+        return respond(request, {"status": "success", "data": dict(booking)})
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_app(), host="127.0.0.1", port=8001)
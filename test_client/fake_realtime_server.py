@@ -0,0 +1,211 @@
+"""Local stand-in for the OpenAI Realtime API websocket.
+
+Answers ``session.update`` with ``session.updated`` and every
+``response.create`` with a few audio deltas and their transcript followed by
+``response.done``.
+Handshake and response latency can be simulated to mimic the real API. For
+load tests it can also echo caller audio back as audio deltas and
+periodically ask for a ``create_booking`` function call.
+
+Audio that carries a timestamp (see ``stamp_audio``) lets both sides measure
+how long a frame took through the app: the server records the inbound delay
+of every ``input_audio_buffer.append`` and restamps echoed audio on send.
+
+Run standalone with ``python -m test_client.fake_realtime_server`` and point
+the app at it with ``REALTIME_API_URL=ws://127.0.0.1:8002``.
+"""
+
+import asyncio
+import base64
+import json
+import random
+import struct
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from test_client.servers import free_port
+
+# Timestamps are time.monotonic(), which is system wide on Linux and macOS,
+# so sender and receiver may live in different processes
+STAMP = struct.Struct("<d")
+
+
+def stamp_audio(pcm: bytes) -> bytes:
+    """Overwrite the first bytes of an audio frame with the current time."""
+    return STAMP.pack(time.monotonic()) + pcm[STAMP.size:]
+
+
+def audio_stamp_age(pcm: bytes) -> float:
+    """Seconds since ``stamp_audio`` was applied to this frame."""
+    return time.monotonic() - STAMP.unpack_from(pcm)[0]
+
+
+@dataclass
+class FakeRealtimeConfig:
+    handshake_delay: float = 0.0
+    session_update_delay: float = 0.0
+    response_delay: float = 0.0
+    audio_deltas_per_response: int = 10
+    # 20 ms of pcm16 at 24 kHz per audio delta
+    audio_delta_bytes: int = 960
+    # Send caller audio straight back as response.audio.delta
+    echo_audio: bool = False
+    # Audio frames carry a timestamp in their first bytes
+    stamped_audio: bool = False
+    # Seconds between create_booking function calls per connection, 0 for none
+    function_call_interval: float = 0.0
+    # Spoken text reported for every response
+    transcript: str = "Guten Tag, hier ist die Zahnarztpraxis."
+
+
+class FakeRealtimeServer:
+    def __init__(self, config: FakeRealtimeConfig = None):
+        self.config = config or FakeRealtimeConfig()
+        self.connections = 0
+        self.active = 0
+        self.events_received = 0
+        self.function_calls = 0
+        self.function_call_outputs = 0
+        self.responses = 0
+        self.assistant_messages = 0
+        self.inbound_latencies: list[float] = []
+
+    async def process_request(self, connection, request):
+        if self.config.handshake_delay:
+            await asyncio.sleep(self.config.handshake_delay)
+
+    async def send_event(self, websocket, event: dict):
+        event.setdefault("event_id", f"event_{uuid.uuid4().hex[:12]}")
+        await websocket.send(json.dumps(event))
+
+    async def send_audio(self, websocket, response_id: str, pcm: bytes):
+        if self.config.stamped_audio:
+            pcm = stamp_audio(pcm)
+        await websocket.send(
+            '{"type":"response.audio.delta","response_id":"%s","delta":"%s"}'
+            % (response_id, base64.b64encode(pcm).decode("utf-8"))
+        )
+
+    async def respond(self, websocket):
+        if self.config.response_delay:
+            await asyncio.sleep(self.config.response_delay)
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        pcm = bytes(self.config.audio_delta_bytes)
+        for _ in range(self.config.audio_deltas_per_response):
+            await self.send_audio(websocket, response_id, pcm)
+        await self.send_event(
+            websocket,
+            {
+                "type": "response.audio_transcript.done",
+                "response_id": response_id,
+                "transcript": self.config.transcript,
+            },
+        )
+        await self.send_event(
+            websocket,
+            {
+                "type": "response.done",
+                "response": {"id": response_id, "status": "completed", "output": []},
+            },
+        )
+
+    async def request_function_calls(self, websocket):
+        rng = random.Random()
+        while True:
+            await asyncio.sleep(self.config.function_call_interval)
+            self.function_calls += 1
+            call_id = uuid.uuid4().hex[:12]
+            arguments = {
+                "start": f"2024-12-{rng.randint(1, 28):02d}T{rng.randint(7, 18):02d}:00:00Z",
+                "attendee_name": "Peter Müller",
+            }
+            await self.send_event(
+                websocket,
+                {
+                    "type": "response.done",
+                    "response": {
+                        "id": f"resp_{call_id}",
+                        "status": "completed",
+                        "output": [
+                            {
+                                "id": f"item_{call_id}",
+                                "call_id": f"call_{call_id}",
+                                "type": "function_call",
+                                "status": "completed",
+                                "name": "create_booking",
+                                "arguments": json.dumps(arguments),
+                            }
+                        ],
+                    },
+                },
+            )
+
+    async def handle_event(self, websocket, event: dict, tasks: set):
+        if event["type"] == "input_audio_buffer.append":
+            if self.config.stamped_audio or self.config.echo_audio:
+                pcm = base64.b64decode(event["audio"])
+                if self.config.stamped_audio:
+                    self.inbound_latencies.append(audio_stamp_age(pcm))
+                if self.config.echo_audio:
+                    await self.send_audio(websocket, "resp_echo", pcm)
+        elif event["type"] == "session.update":
+            if self.config.session_update_delay:
+                await asyncio.sleep(self.config.session_update_delay)
+            await self.send_event(
+                websocket, {"type": "session.updated", "session": event["session"]}
+            )
+        elif event["type"] == "response.create":
+            self.responses += 1
+            task = asyncio.create_task(self.respond(websocket))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        elif event["type"] == "conversation.item.create":
+            if event["item"]["type"] == "function_call_output":
+                self.function_call_outputs += 1
+            elif event["item"].get("role") == "assistant":
+                self.assistant_messages += 1
+
+    async def handler(self, websocket):
+        self.connections += 1
+        self.active += 1
+        tasks = set()
+        if self.config.function_call_interval:
+            tasks.add(asyncio.create_task(self.request_function_calls(websocket)))
+        try:
+            await self.send_event(websocket, {"type": "session.created", "session": {}})
+            async for message in websocket:
+                self.events_received += 1
+                await self.handle_event(websocket, json.loads(message), tasks)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.active -= 1
+            for task in tasks:
+                task.cancel()
+
+    @asynccontextmanager
+    async def serve(self, port: int = None):
+        """Serve on localhost and yield the websocket URL."""
+        port = port or free_port()
+        async with serve(
+            self.handler, "127.0.0.1", port, process_request=self.process_request
+        ):
+            yield f"ws://127.0.0.1:{port}"
+
+
+async def main():
+    server = FakeRealtimeServer(
+        FakeRealtimeConfig(handshake_delay=0.15, session_update_delay=0.1)
+    )
+    async with server.serve(8002) as url:
+        print(f"Fake Realtime API listening on {url}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
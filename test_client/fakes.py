@@ -0,0 +1,107 @@
+"""In-process stand-ins for the two websockets of a media-stream session.
+"""
+
+import asyncio
+import base64
+import json
+import time
+
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+
+AUDIO_FRAME = base64.b64encode(bytes(960)).decode("utf-8")  # 20 ms pcm16 @ 24 kHz
+
+_DISCONNECT = object()
+
+
+class FakeClientWebSocket:
+    """Caller side: yields queued text frames and records what is sent back."""
+
+    def __init__(self):
+        self.inbound = asyncio.Queue()
+        self.sent = []
+        self.sent_at = []
+        self.closed = False
+        self.close_code = None
+        self.application_state = WebSocketState.CONNECTED
+        self.client_state = WebSocketState.CONNECTED
+
+    def disconnect(self):
+        """Simulate the caller hanging up without a closing handshake."""
+        self.inbound.put_nowait(_DISCONNECT)
+
+    async def iter_text(self):
+        while True:
+            message = await self.inbound.get()
+            if message is None:
+                return
+            if message is _DISCONNECT:
+                self.client_state = WebSocketState.DISCONNECTED
+                raise WebSocketDisconnect(code=1006)
+            yield message
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data))
+
+    async def send_text(self, data):
+        if self.client_state != WebSocketState.CONNECTED:
+            raise WebSocketDisconnect(code=1006)
+        self.sent.append(data)
+        self.sent_at.append(time.perf_counter())
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = True
+        self.close_code = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+class FakeUpstream:
+    """Realtime API side: replays scripted events and records sent frames.
+
+    With ``keep_open`` the connection stays open after the script until it is
+    closed or failed, like a real socket waiting for the next event.
+    """
+
+    def __init__(self, events=None, interval: float = 0.0, keep_open: bool = False):
+        self.events = events or []
+        self.interval = interval
+        self.keep_open = keep_open
+        self.sent = []
+        self.closed = False
+        self._done = asyncio.Event()
+        self._error = None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            if self._done.is_set():
+                break
+            if self.interval:
+                await asyncio.sleep(self.interval)
+            yield event if isinstance(event, str) else json.dumps(event)
+        if self.keep_open:
+            await self._done.wait()
+        if self._error is not None:
+            raise self._error
+
+    def fail(self, error: Exception):
+        """Simulate the upstream connection breaking."""
+        self._error = error
+        self._done.set()
+
+    async def send(self, message, text: bool = None):
+        if self._done.is_set():
+            raise ConnectionError("upstream closed")
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+        self._done.set()
+
+
+def audio_delta_events(count: int) -> list:
+    return [
+        {"type": "response.audio.delta", "response_id": "resp_1", "delta": AUDIO_FRAME}
+        for _ in range(count)
+    ]
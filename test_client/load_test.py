@@ -0,0 +1,235 @@
+"""Headless load test: many synthetic callers against one app worker.
+
+The app runs in this process on its own event loop, so its CPU time and
+event-loop lag can be measured directly. A child process runs everything
+else: the fake Realtime API (echoing caller audio, asking for function
+calls, simulating latency), the fake cal.com API and N synthetic callers
+that stream generated or recorded pcm16 at real-time rate.
+
+Reported are calls per core, inbound and outbound frame forwarding latency,
+time to first audio and event-loop lag.
+
+Run with ``python -m test_client.load_test --calls 50 --duration 30``.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import time
+import wave
+
+import numpy as np
+
+from test_client.servers import free_port
+
+SAMPLE_RATE = 24000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * 2 * FRAME_MS // 1000
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def load_pcm(path: str = None, seconds: float = 10.0) -> bytes:
+    """Read pcm16 mono 24 kHz from a WAV file, or generate speech-like audio."""
+    if path:
+        with wave.open(path, "rb") as wav:
+            if (wav.getframerate(), wav.getsampwidth(), wav.getnchannels()) != (SAMPLE_RATE, 2, 1):
+                raise ValueError("WAV file must be pcm16 mono 24 kHz")
+            return wav.readframes(wav.getnframes())
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    # A modulated tone with bursts and pauses, roughly like speech
+    envelope = (np.sin(2 * np.pi * 0.4 * t) > -0.2) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    signal = envelope * np.sin(2 * np.pi * 180 * t) + 0.02 * rng.standard_normal(t.size)
+    return (np.clip(signal, -1, 1) * 12000).astype("<i2").tobytes()
+
+
+async def synthetic_caller(index: int, app_url: str, api_key: str, pcm: bytes, duration: float, result: dict):
+    import websockets
+
+    from test_client.fake_realtime_server import audio_stamp_age, stamp_audio
+
+    frames = [pcm[i:i + FRAME_BYTES] for i in range(0, len(pcm) - FRAME_BYTES + 1, FRAME_BYTES)]
+    started = time.monotonic()
+    try:
+        async with websockets.connect(
+            f"{app_url}/media-stream",
+            additional_headers={"Authorization": f"Bearer {api_key}"},
+        ) as websocket:
+            await websocket.send(json.dumps({"event": "start", "start": {"streamSid": f"load_{index}"}}))
+
+            async def send_audio():
+                next_frame_at = time.monotonic()
+                position = 0
+                while time.monotonic() - started < duration:
+                    payload = base64.b64encode(stamp_audio(frames[position % len(frames)])).decode("utf-8")
+                    await websocket.send(
+                        '{"event":"media","media":{"payload":"%s","timestamp":%d}}'
+                        % (payload, int(time.time() * 1000))
+                    )
+                    result["frames_sent"] += 1
+                    position += 1
+                    next_frame_at += FRAME_MS / 1000
+                    await asyncio.sleep(max(0.0, next_frame_at - time.monotonic()))
+
+            async def receive_audio():
+                first_audio = True
+                async for message in websocket:
+                    data = json.loads(message)
+                    if data.get("event") != "media":
+                        continue
+                    pcm_frame = base64.b64decode(data["media"]["payload"])
+                    if first_audio:
+                        result["time_to_first_audio"].append(time.monotonic() - started)
+                        first_audio = False
+                    result["frames_received"] += 1
+                    result["outbound_latencies"].append(audio_stamp_age(pcm_frame))
+
+            receiver = asyncio.create_task(receive_audio())
+            await send_audio()
+            receiver.cancel()
+    except Exception as e:
+        result["errors"].append(repr(e))
+    result["call_seconds"] += time.monotonic() - started
+
+
+async def run_callers(options: dict) -> dict:
+    from test_client.fake_cal_server import create_app
+    from test_client.fake_realtime_server import FakeRealtimeConfig, FakeRealtimeServer
+    from test_client.servers import serve_in_background
+
+    fake_realtime = FakeRealtimeServer(
+        FakeRealtimeConfig(
+            response_delay=options["upstream_latency"],
+            echo_audio=True,
+            stamped_audio=True,
+            function_call_interval=options["function_call_interval"],
+        )
+    )
+    result = {
+        "frames_sent": 0,
+        "frames_received": 0,
+        "call_seconds": 0.0,
+        "time_to_first_audio": [],
+        "outbound_latencies": [],
+        "errors": [],
+    }
+    pcm = load_pcm(options["wav"])
+    async with serve_in_background(create_app(delay=options["upstream_latency"]), options["cal_port"]):
+        async with fake_realtime.serve(options["realtime_port"]):
+            callers = []
+            for index in range(options["calls"]):
+                callers.append(
+                    asyncio.create_task(
+                        synthetic_caller(index, options["app_url"], options["api_key"], pcm, options["duration"], result)
+                    )
+                )
+                await asyncio.sleep(options["ramp"] / options["calls"])
+            await asyncio.gather(*callers)
+
+    result["inbound_latencies"] = fake_realtime.inbound_latencies
+    result["function_calls"] = fake_realtime.function_calls
+    result["function_call_outputs"] = fake_realtime.function_call_outputs
+    return result
+
+
+def run_callers_process(options: dict, results: multiprocessing.Queue):
+    results.put(asyncio.run(run_callers(options)))
+
+
+async def sample_loop_lag(samples: list, interval: float = 0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def main(args):
+    app_port, realtime_port, cal_port = free_port(), free_port(), free_port()
+    api_key = "load-test"
+
+    # The app reads its configuration on import
+    os.environ["API_AUTH_KEY"] = api_key
+    os.environ.setdefault("OPENAI_API_KEY", "load-test")
+    os.environ["REALTIME_API_URL"] = f"ws://127.0.0.1:{realtime_port}"
+    os.environ["CAL_API_BASE_URL"] = f"http://127.0.0.1:{cal_port}"
+    if args.inbound_window_ms is not None:
+        os.environ["INBOUND_AUDIO_WINDOW_MS"] = str(args.inbound_window_ms)
+    if args.outbound_lead_ms is not None:
+        os.environ["OUTBOUND_AUDIO_LEAD_MS"] = str(args.outbound_lead_ms)
+
+    from app.main import app
+    from test_client.servers import serve_in_background
+
+    options = {
+        "app_url": f"ws://127.0.0.1:{app_port}",
+        "api_key": api_key,
+        "realtime_port": realtime_port,
+        "cal_port": cal_port,
+        "calls": args.calls,
+        "duration": args.duration,
+        "ramp": args.ramp,
+        "wav": args.wav,
+        "upstream_latency": args.upstream_latency,
+        "function_call_interval": args.function_call_interval,
+    }
+
+    loop_lag = []
+    async with serve_in_background(app, app_port):
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        callers = context.Process(target=run_callers_process, args=(options, results))
+        lag_sampler = asyncio.create_task(sample_loop_lag(loop_lag))
+        cpu_started, wall_started = time.process_time(), time.monotonic()
+        callers.start()
+        result = await asyncio.to_thread(results.get)
+        cpu_seconds = time.process_time() - cpu_started
+        wall_seconds = time.monotonic() - wall_started
+        lag_sampler.cancel()
+        callers.join()
+
+    core_share_per_call = cpu_seconds / result["call_seconds"] if result["call_seconds"] else float("nan")
+    ms = 1000
+    print(f"calls:                 {args.calls} for {args.duration:.0f} s ({len(result['errors'])} errors)")
+    print(f"app cpu:               {cpu_seconds:.1f} s over {wall_seconds:.1f} s wall")
+    print(f"calls per core:        {1 / core_share_per_call:.0f}")
+    print(f"frames sent/received:  {result['frames_sent']} / {result['frames_received']}")
+    print(f"function calls:        {result['function_call_outputs']} answered of {result['function_calls']}")
+    for name, values in (
+        ("inbound forwarding", result["inbound_latencies"]),
+        ("outbound forwarding", result["outbound_latencies"]),
+        ("time to first audio", result["time_to_first_audio"]),
+        ("event-loop lag", loop_lag),
+    ):
+        print(
+            f"{name + ':':<22} p50 {percentile(values, 0.5) * ms:7.2f} ms   "
+            f"p99 {percentile(values, 0.99) * ms:7.2f} ms   max {max(values, default=float('nan')) * ms:7.2f} ms"
+        )
+    for error in result["errors"][:5]:
+        print(f"error: {error}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20, help="number of concurrent callers")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds each caller streams")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which callers connect")
+    parser.add_argument("--wav", help="pcm16 mono 24 kHz WAV to stream instead of generated audio")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="simulated fake API latency")
+    parser.add_argument("--function-call-interval", type=float, default=10.0, help="seconds between booking calls per caller, 0 for none")
+    parser.add_argument("--inbound-window-ms", type=int, help="override INBOUND_AUDIO_WINDOW_MS")
+    parser.add_argument("--outbound-lead-ms", type=int, help="override OUTBOUND_AUDIO_LEAD_MS")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
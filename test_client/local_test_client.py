@@ -1,13 +1,17 @@
 """Test client to interact with voice assistant from local environment.
+
+Run from the repository root with ``python -m test_client.local_test_client``.
 """
 import asyncio
 import websockets
 import json
+import numpy as np
 import pyaudio
-import audioop
 import base64
 import time
 
+from app.api.media_stream.audio_transcoder import PolyphaseResampler
+
 # Replace with your WebSocket endpoint
 WEBSOCKET_ENDPOINT = "ws://localhost:8000/media-stream"
 
@@ -20,10 +24,14 @@ CHANNELS = 1  # Mono audio
 API_KEY = ""
 
 
+mic_resampler = PolyphaseResampler(MIC_RATE, TARGET_RATE)
+
+
 # Function to resample audio
-def resample_audio(data, from_rate, to_rate):
-    """Resample audio from one rate to another."""
-    return audioop.ratecv(data, 2, CHANNELS, from_rate, to_rate, None)[0]
+def resample_audio(data):
+    """Resample microphone audio to the target rate, keeping filter state."""
+    samples = np.frombuffer(data, dtype="<i2")
+    return mic_resampler.process(samples).astype("<i2", copy=False).tobytes()
 
 
 async def send_audio_to_websocket(websocket, stream):
@@ -35,8 +43,7 @@ async def send_audio_to_websocket(websocket, stream):
 
             # Resample to the target rate if necessary
             if MIC_RATE != TARGET_RATE:
-                audio_chunk = resample_audio(
-                    audio_chunk, MIC_RATE, TARGET_RATE)
+                audio_chunk = resample_audio(audio_chunk)
 
             # Encode the audio chunk as Base64
             audio_payload = base64.b64encode(audio_chunk).decode("utf-8")
@@ -66,6 +73,10 @@ async def receive_and_play_audio(websocket, playback_stream):
             message = await websocket.recv()
             response = json.loads(message)
 
+            # The caller interrupted, nothing buffered is left to discard here
+            if response.get("event") == "clear":
+                continue
+
             # Handle audio responses
             try:
                 # Decode the Base64-encoded audio
@@ -0,0 +1,372 @@
+"""Replay captured calls through the media stream pipeline.
+
+Every capture written with ``CAPTURE=true`` is fed back through a real
+``MediaStreamSession``, against in-process stand-ins for the two websockets
+and the local fake cal.com API. What the caller and the Realtime API sent is
+delivered again, what the session sends is recorded and compared with the
+capture.
+
+- ``--speed 1`` delivers messages at their captured times, ``--speed 0`` as
+  fast as possible. Fast replay waits until each message is processed before
+  delivering the next one, and sends audio without real-time pacing, so it is
+  deterministic.
+- Processing time per event type is the time from handing a message to the
+  session until it asks for the next one.
+- ``--allocations`` replays every capture once more on its own under
+  ``tracemalloc`` and reports peak and retained memory.
+- Drift is any difference in the caller's frames between two ``clear`` frames,
+  and at ``--speed 1`` also how much later or earlier they were sent. Frames
+  the replay sends beyond the captured ones were still buffered when the
+  caller barged in or hung up, they count as dropped live.
+
+Run with ``python -m test_client.replay captures/*.jsonl.gz --speed 0 --concurrency 20``.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from starlette.websockets import WebSocketState
+
+from test_client.load_test import percentile
+
+_END = None
+
+
+class ReplayClient:
+    """Caller side, delivering captured frames and recording what is sent.
+
+    ``processed`` is set whenever the session asks for the next frame.
+    """
+
+    def __init__(self, timings: dict[str, list[float]], processed: asyncio.Event):
+        self.inbound = asyncio.Queue()
+        self.timings = timings
+        self.processed = processed
+        self.sent: list[tuple[float, str]] = []
+        self.application_state = WebSocketState.CONNECTED
+        self.client_state = WebSocketState.CONNECTED
+
+    async def iter_text(self):
+        while True:
+            item = await self.inbound.get()
+            if item is _END:
+                return
+            event, message = item
+            started = time.perf_counter()
+            try:
+                yield message
+            finally:
+                self.timings[f"client {event}"].append(time.perf_counter() - started)
+                self.processed.set()
+
+    async def send_text(self, data: str):
+        self.sent.append((time.monotonic(), data))
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+class ReplayUpstream:
+    """Realtime API side, delivering captured events and recording what is sent."""
+
+    def __init__(self, timings: dict[str, list[float]], processed: asyncio.Event):
+        self.inbound = asyncio.Queue()
+        self.timings = timings
+        self.processed = processed
+        self.sent: list[tuple[float, str]] = []
+
+    async def __aiter__(self):
+        while True:
+            item = await self.inbound.get()
+            if item is _END:
+                return
+            event, message = item
+            started = time.perf_counter()
+            try:
+                yield message
+            finally:
+                self.timings[f"upstream {event}"].append(time.perf_counter() - started)
+                self.processed.set()
+
+    async def send(self, message, text: bool = None):
+        self.sent.append((time.monotonic(), message))
+
+    async def close(self):
+        self.inbound.put_nowait(_END)
+
+
+def client_event(message: str) -> str:
+    from app.api.media_stream.frame_codec import decode_client_frame
+
+    return decode_client_frame(message)[0]
+
+
+def upstream_event(message: str) -> str:
+    from app.api.media_stream.frame_codec import decode_upstream_event
+
+    return decode_upstream_event(message)[0]
+
+
+def segments(messages: list[tuple[float, str]]) -> list[list[tuple[float, str]]]:
+    """Caller frames split after every ``clear``."""
+    result = [[]]
+    for item in messages:
+        result[-1].append(item)
+        if client_event(item[1]) == "clear":
+            result.append([])
+    return result
+
+
+def compare(expected: list[tuple[float, str]], actual: list[tuple[float, str]]) -> dict:
+    """Drift of the replayed caller frames against the captured ones.
+
+    Between two ``clear`` frames the captured frames have to be the start of
+    the replayed ones, anything more was dropped live.
+    """
+    expected_segments, actual_segments = segments(expected), segments(actual)
+    drift, dropped_live, offsets = 0, 0, []
+    for index in range(max(len(expected_segments), len(actual_segments))):
+        want = expected_segments[index] if index < len(expected_segments) else []
+        got = actual_segments[index] if index < len(actual_segments) else []
+        want_clear = bool(want) and client_event(want[-1][1]) == "clear"
+        got_clear = bool(got) and client_event(got[-1][1]) == "clear"
+        if want_clear != got_clear:
+            drift += 1
+        else:
+            offsets.extend(got[-1][0] - want[-1][0] for _ in range(want_clear))
+        want, got = want[: len(want) - want_clear], got[: len(got) - got_clear]
+        for (want_at, want_frame), (got_at, got_frame) in zip(want, got):
+            if want_frame == got_frame:
+                offsets.append(got_at - want_at)
+            else:
+                drift += 1
+        if len(got) < len(want):
+            drift += len(want) - len(got)
+        else:
+            dropped_live += len(got) - len(want)
+    result = {"frames": len(expected), "replayed": len(actual), "drift": drift, "dropped_live": dropped_live}
+    if offsets:
+        median = statistics.median(offsets)
+        result["timing_drift"] = [abs(offset - median) for offset in offsets]
+    return result
+
+
+async def feed(
+    start: dict | None,
+    messages: list[tuple[float, str, str]],
+    speed: float = 0.0,
+    capture=None,
+) -> dict:
+    """Run a session on the received messages, returns what it did.
+
+    With a ``capture`` the session's websockets are captured.
+    """
+    from app.api.media_stream.capture import CLIENT_IN, UPSTREAM_IN
+    from app.api.media_stream.session import MediaStreamSession
+
+    timings = defaultdict(list)
+    processed = asyncio.Event()
+    client, upstream = ReplayClient(timings, processed), ReplayUpstream(timings, processed)
+    if capture is not None:
+        session = MediaStreamSession(capture.client(client), capture.upstream(upstream), start=start)
+    else:
+        session = MediaStreamSession(client, upstream, start=start)
+    if not speed:
+        session.media_buffer.outbound.lead = 0
+    task = asyncio.create_task(session.run())
+    # Nothing is processed any more once the session is over
+    task.add_done_callback(lambda _: processed.set())
+
+    started = time.monotonic()
+    delivered = 0
+    for seconds, direction, message in messages:
+        if direction == CLIENT_IN:
+            queue, event = client.inbound, client_event(message)
+        elif direction == UPSTREAM_IN:
+            queue, event = upstream.inbound, upstream_event(message)
+        else:
+            continue
+        if task.done():
+            break
+        if speed:
+            await asyncio.sleep(max(0.0, started + seconds / speed - time.monotonic()))
+        processed.clear()
+        queue.put_nowait((event, message))
+        delivered += 1
+        if not speed:
+            await processed.wait()
+    if speed and messages:
+        # Let the session send what it still paces out
+        await asyncio.sleep(max(0.0, started + messages[-1][0] / speed - time.monotonic()) + 0.2)
+    wall = time.monotonic() - started
+    client.inbound.put_nowait(_END)
+    await task
+    return {
+        "events": delivered,
+        "wall": wall,
+        "timings": timings,
+        "sent": [(at - started, message) for at, message in client.sent],
+    }
+
+
+async def replay(path: str, speed: float = 0.0) -> dict:
+    """Replay one capture, returns timings, drift and throughput."""
+    from app.api.media_stream.capture import CLIENT_OUT, load_capture
+
+    header, messages, trailer = load_capture(path)
+    result = await feed(header["start"], messages, speed)
+
+    # The greeting came from the cache, the replay plays none
+    greeting_frames = header.get("greeting_frames", 0)
+    expected = []
+    for seconds, direction, message in messages:
+        if direction != CLIENT_OUT:
+            continue
+        if greeting_frames and client_event(message) == "media":
+            greeting_frames -= 1
+            continue
+        expected.append((seconds / (speed or 1), message))
+    drift = compare(expected, result["sent"])
+    if not speed:
+        # Fast replay has no timing to compare
+        drift.pop("timing_drift", None)
+    return {
+        "path": path,
+        "events": result["events"],
+        "wall": result["wall"],
+        "timings": result["timings"],
+        "dropped_in_capture": trailer.get("dropped", 0),
+        **drift,
+    }
+
+
+async def measure_allocations(path: str) -> tuple[int, int]:
+    """Peak and retained bytes allocated while replaying one capture fast."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        await replay(path)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, current - before
+
+
+async def replay_all(paths: list[str], speed: float = 0.0, concurrency: int = 1, repeat: int = 1) -> tuple[list[dict], float]:
+    """Replay every capture ``repeat`` times, at most ``concurrency`` at once."""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(path: str) -> dict:
+        async with limit:
+            return await replay(path, speed)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(path) for path in paths * repeat))
+    return results, time.perf_counter() - started
+
+
+def summarize(results: list[dict], wall: float) -> dict:
+    timings = defaultdict(list)
+    for result in results:
+        for event, durations in result["timings"].items():
+            timings[event].extend(durations)
+    timing_drift = [offset for result in results for offset in result.get("timing_drift", [])]
+    return {
+        "captures": len(results),
+        "events": sum(result["events"] for result in results),
+        "events_per_second": sum(result["events"] for result in results) / wall,
+        "drift": sum(result["drift"] for result in results),
+        "dropped_live": sum(result["dropped_live"] for result in results),
+        "timings": timings,
+        "timing_drift": timing_drift,
+    }
+
+
+def print_report(results: list[dict], summary: dict, allocations: dict = None):
+    print(f"{'event':<58}{'count':>8}{'p50 µs':>10}{'p99 µs':>10}{'max µs':>10}")
+    for event, durations in sorted(summary["timings"].items()):
+        print(
+            f"{event:<58}{len(durations):>8}{percentile(durations, 0.5) * 1e6:>10.1f}"
+            f"{percentile(durations, 0.99) * 1e6:>10.1f}{max(durations) * 1e6:>10.1f}"
+        )
+    print()
+    for result in results:
+        line = (
+            f"{os.path.basename(result['path'])}: {result['events']} events, caller frames "
+            f"{result['frames']} captured / {result['replayed']} replayed, drift {result['drift']}, "
+            f"dropped live {result['dropped_live']}"
+        )
+        if result["dropped_in_capture"]:
+            line += f", capture incomplete ({result['dropped_in_capture']} dropped)"
+        if allocations and result["path"] in allocations:
+            peak, retained = allocations[result["path"]]
+            line += f", peak {peak / 1024:.0f} KiB, retained {retained / 1024:.0f} KiB"
+        print(line)
+    print()
+    print(
+        f"{summary['captures']} replays, {summary['events']} events, "
+        f"{summary['events_per_second']:.0f} events/s, drift {summary['drift']} frames"
+    )
+    if summary["timing_drift"]:
+        drift = summary["timing_drift"]
+        print(f"timing drift p50 {percentile(drift, 0.5) * 1000:.1f} ms, p99 {percentile(drift, 0.99) * 1000:.1f} ms")
+
+
+@contextlib.asynccontextmanager
+async def local_fakes():
+    """Point the app at temporary local stand-ins, before it is imported."""
+    from test_client.fake_cal_server import create_app
+    from test_client.servers import serve_in_background
+
+    with tempfile.TemporaryDirectory() as directory:
+        async with serve_in_background(create_app()) as cal_url:
+            os.environ.update(
+                OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "replay"),
+                CAL_API_BASE_URL=cal_url,
+                CALLBACK_DB_PATH=os.path.join(directory, "callbacks.db"),
+                GREETING_CACHE="false",
+                RECORDING="false",
+                CAPTURE="false",
+            )
+            from app.tools.clients import close_clients, get_cal_client
+
+            get_cal_client()  # created at startup by the app lifespan
+            try:
+                yield
+            finally:
+                await close_clients()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("captures", nargs="+", help="capture files (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 for captured timing, 0 for as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=1, help="captures replayed at once")
+    parser.add_argument("--repeat", type=int, default=1, help="replays per capture")
+    parser.add_argument("--allocations", action="store_true", help="also measure allocations per capture")
+    args = parser.parse_args()
+
+    async with local_fakes():
+        with contextlib.redirect_stdout(io.StringIO()):
+            results, wall = await replay_all(args.captures, args.speed, args.concurrency, args.repeat)
+            allocations = (
+                {path: await measure_allocations(path) for path in args.captures}
+                if args.allocations
+                else None
+            )
+    print_report(results, summarize(results, wall), allocations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
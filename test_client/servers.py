@@ -0,0 +1,36 @@
+"""Helpers to run local stand-in servers inside a test or benchmark process.
+"""
+
+import asyncio
+import socket
+from contextlib import asynccontextmanager
+
+import uvicorn
+
+
+def free_port() -> int:
+    """Return a currently unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def serve_in_background(app, port: int = None):
+    """Serve an ASGI app on localhost for the duration of the context.
+
+    Yields the base URL (``http://127.0.0.1:<port>``).
+    """
+    port = port or free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
@@ -0,0 +1,18 @@
+"""Settings of the test run, applied before the app is imported."""
+
+import os
+
+import pytest
+
+from test_client.servers import free_port
+
+# Tools call a local cal.com stub, started by the tests that need it
+CAL_STUB_PORT = free_port()
+os.environ["CAL_API_BASE_URL"] = f"http://127.0.0.1:{CAL_STUB_PORT}"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["PRACTICE_TZ"] = "Europe/Berlin"
+
+
+@pytest.fixture
+def cal_stub_port() -> int:
+    return CAL_STUB_PORT
@@ -0,0 +1,54 @@
+from app.tools.attendee_matcher import koelner_phonetik, match_attendee, name_similarity
+
+
+def booking(uid: str, name: str) -> dict:
+    return {"uid": uid, "start": "2024-08-13T09:00:00Z", "attendees": [{"name": name}]}
+
+
+DAY = [
+    booking("uid-1", "Peter Müller"),
+    booking("uid-2", "Anna Schmidt"),
+    booking("uid-3", "Thomas Fischer"),
+]
+
+
+def test_koelner_phonetik():
+    assert koelner_phonetik("Müller") == koelner_phonetik("Mueller") == "657"
+    assert koelner_phonetik("Meyer") == koelner_phonetik("Maier")
+
+
+def test_misspelled_name_matches_confidently():
+    match = match_attendee(DAY, "Peter Muuhler")
+    assert match.booking is not None
+    assert match.booking.uid == "uid-1"
+    assert match.booking.attendee_name == "Peter Müller"
+    assert not match.is_ambiguous
+
+
+def test_unknown_name_has_no_match():
+    match = match_attendee(DAY, "Wolfgang Zimmermann")
+    assert match.booking is None
+    assert not match.is_ambiguous
+    assert match.confidence == 0.0
+
+
+def test_similar_names_are_ambiguous():
+    day = DAY + [booking("uid-4", "Peter Müller")]
+    match = match_attendee(day, "Peter Müller")
+    assert match.booking is None
+    assert match.is_ambiguous
+    assert {candidate["uid"] for candidate in match.candidates} == {"uid-1", "uid-4"}
+
+
+def test_name_order_and_title_fallback():
+    assert name_similarity("Müller Peter", "Peter Müller") > 0.9
+    match = match_attendee([{"uid": "uid-5", "start": "x", "title": "Anna Schmidt"}], "Anna Schmidt")
+    assert match.booking.uid == "uid-5"
+
+
+def test_cancelled_booking_of_the_same_name_is_skipped():
+    cancelled = {**booking("uid-6", "Peter Müller"), "status": "cancelled"}
+    accepted = {**booking("uid-7", "Peter Müller"), "status": "accepted"}
+    match = match_attendee([cancelled, accepted], "Peter Müller")
+    assert match.booking is not None
+    assert match.booking.uid == "uid-7"
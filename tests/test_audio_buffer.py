@@ -0,0 +1,100 @@
+import asyncio
+import base64
+import time
+
+from app.api.media_stream.audio_buffer import (
+    InboundAudioCoalescer,
+    OutboundAudioPacer,
+    base64_audio_seconds,
+    join_base64_audio,
+)
+
+FRAME = base64.b64encode(bytes(960)).decode("utf-8")  # 20 ms pcm16 @ 24 kHz
+
+
+def test_base64_helpers():
+    assert base64_audio_seconds(FRAME, 48000) == 0.02
+    padded = base64.b64encode(b"\x01").decode("utf-8")
+    joined = join_base64_audio([padded, FRAME])
+    assert base64.b64decode(joined) == b"\x01" + bytes(960)
+    assert join_base64_audio([FRAME, FRAME]) == FRAME + FRAME
+
+
+def test_frames_are_coalesced_into_one_window():
+    sent = []
+
+    async def send(payload: str):
+        sent.append(payload)
+
+    async def run():
+        coalescer = InboundAudioCoalescer(send, window_ms=100, bytes_per_second=48000)
+        for _ in range(5):
+            await coalescer.add(FRAME, time.monotonic())
+        await coalescer.add(FRAME, time.monotonic())
+        await asyncio.sleep(0.15)
+        await coalescer.close()
+        return coalescer
+
+    coalescer = asyncio.run(run())
+    assert [base64_audio_seconds(payload, 48000) for payload in sent] == [0.1, 0.02]
+    assert (coalescer.frames_in, coalescer.frames_out) == (6, 2)
+
+
+def test_close_cancels_a_pending_flush():
+    sent = []
+
+    async def send(payload: str):
+        await asyncio.sleep(1)
+        sent.append(payload)
+
+    async def run():
+        coalescer = InboundAudioCoalescer(send, window_ms=20, bytes_per_second=48000)
+        await coalescer.add(FRAME[:100], time.monotonic())
+        await asyncio.sleep(0.05)
+        flush = coalescer._flush_task
+        await coalescer.close()
+        return flush
+
+    flush = asyncio.run(run())
+    assert flush is not None and flush.cancelled()
+    assert not sent
+
+
+def test_pacer_starts_again_after_a_send_error():
+    sent = []
+
+    async def send(frame: str):
+        if frame == "broken":
+            raise ConnectionError("client went away")
+        sent.append(frame)
+
+    async def run():
+        pacer = OutboundAudioPacer(send, lead_ms=100)
+        await pacer.push("broken", 0.02, time.monotonic())
+        await asyncio.sleep(0.01)
+        await pacer.push("after", 0.02, time.monotonic())
+        await asyncio.sleep(0.01)
+        await pacer.close()
+
+    asyncio.run(run())
+    assert sent == ["after"]
+
+
+def test_pacer_is_stopped_when_close_returns():
+    sent = []
+
+    async def send(frame: str):
+        await asyncio.sleep(0.05)
+        sent.append(frame)
+
+    async def run():
+        pacer = OutboundAudioPacer(send, lead_ms=100)
+        await pacer.push("frame", 0.02, time.monotonic())
+        await asyncio.sleep(0.01)
+        task = pacer._task
+        await pacer.close()
+        return task
+
+    task = asyncio.run(run())
+    assert task.done()
+    assert not sent
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from app.tools.availability import (
+    BUSY,
+    CLOSED,
+    PAST,
+    AvailabilityIndex,
+    fetch_range,
+    format_time,
+    parse_time,
+    practice_day,
+    practice_now,
+    utc_time,
+)
+
+# Tuesday, 2024-08-13, summer time in Europe/Berlin
+NOW = datetime(2024, 8, 13, 7, 0)
+FIRST_DAY = date(2024, 8, 13)
+LAST_DAY = date(2024, 8, 19)
+
+
+def loaded_index(bookings: list[dict]) -> AvailabilityIndex:
+    index = AvailabilityIndex(days=7, slot_minutes=30, open_hour=8, close_hour=18)
+    index.load(bookings, FIRST_DAY, LAST_DAY)
+    return index
+
+
+def test_times_are_converted_to_practice_time():
+    assert parse_time("2024-08-13T07:00:00Z") == datetime(2024, 8, 13, 9, 0)
+    assert parse_time("2024-12-09T07:00:00Z") == datetime(2024, 12, 9, 8, 0)
+    assert parse_time("2024-08-13T09:00:00+02:00") == datetime(2024, 8, 13, 9, 0)
+    assert parse_time("2024-08-13T09:00:00") == datetime(2024, 8, 13, 9, 0)
+
+
+def test_practice_times_are_formatted_with_offset_and_in_utc():
+    slot = datetime(2024, 8, 13, 9, 0)
+    assert format_time(slot) == "2024-08-13T09:00:00+02:00"
+    assert parse_time(format_time(slot)) == slot
+    assert utc_time(slot) == "2024-08-13T07:00:00Z"
+    assert utc_time(datetime(2024, 12, 9, 9, 0)) == "2024-12-09T08:00:00Z"
+
+
+def test_practice_day_of_a_late_utc_time():
+    assert practice_day("2024-08-13T22:30:00Z") == "2024-08-14"
+    assert practice_day("2024-08-13") == "2024-08-13"
+    assert practice_day("not a time") == "not a time"[:10]
+
+
+def test_fetch_range_covers_whole_practice_days():
+    assert fetch_range(FIRST_DAY, LAST_DAY) == ("2024-08-12T22:00:00Z", "2024-08-19T21:59:59Z")
+
+
+def test_check_slot():
+    index = loaded_index([{"uid": "b1", "start": "2024-08-13T08:00:00Z", "status": "accepted"}])
+    assert index.check_slot(datetime(2024, 8, 13, 10, 0), now=NOW) == BUSY
+    assert index.check_slot(datetime(2024, 8, 13, 10, 30), now=NOW) is None
+    assert index.check_slot(datetime(2024, 8, 13, 6, 0), now=NOW) == PAST
+    assert index.check_slot(datetime(2024, 8, 13, 7, 30), now=NOW) == CLOSED
+    assert index.check_slot(datetime(2024, 8, 13, 17, 45), now=NOW) == CLOSED
+    assert index.check_slot(datetime(2024, 8, 17, 10, 0), now=NOW) == CLOSED
+    # Outside of the loaded range nothing is known
+    assert index.check_slot(datetime(2024, 8, 30, 10, 0), now=NOW) is None
+
+
+def test_cancelled_bookings_are_free():
+    index = loaded_index([{"uid": "b1", "start": "2024-08-13T08:00:00Z", "status": "cancelled"}])
+    assert index.check_slot(datetime(2024, 8, 13, 10, 0), now=NOW) is None
+
+
+def test_find_free_slots_closest_to_the_wish():
+    index = loaded_index(
+        [
+            {"uid": "b1", "start": "2024-08-13T08:00:00Z"},
+            {"uid": "b2", "start": "2024-08-13T08:30:00Z"},
+        ]
+    )
+    slots = index.find_free_slots(datetime(2024, 8, 13, 10, 0), count=3, now=NOW)
+    assert slots == [
+        datetime(2024, 8, 13, 9, 0),
+        datetime(2024, 8, 13, 9, 30),
+        datetime(2024, 8, 13, 11, 0),
+    ]
+
+
+def test_find_free_slots_skips_the_weekend():
+    index = loaded_index([])
+    slots = index.find_free_slots(datetime(2024, 8, 17, 12, 0), count=2, now=NOW)
+    assert slots == [datetime(2024, 8, 16, 17, 0), datetime(2024, 8, 16, 17, 30)]
+
+
+def test_writes_apply_right_away_and_to_a_refresh_in_flight():
+    index = loaded_index([])
+    slot = datetime(2024, 8, 13, 9, 0)
+    index.add_booking({"uid": "b1", "start": utc_time(slot)})
+    assert index.check_slot(slot, now=NOW) == BUSY
+    index.remove_booking("b1")
+    assert index.check_slot(slot, now=NOW) is None
+
+    # The next working day, the refresh covers the days from today on
+    day = practice_now().date() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    slot = datetime(day.year, day.month, day.day, 10, 0)
+    booking = {"uid": "b2", "start": utc_time(slot)}
+
+    async def fetch(after_start: str, before_end: str) -> list[dict]:
+        # Booked while the refresh waits for cal.com
+        index.add_booking(booking)
+        return []
+
+    asyncio.run(index.refresh(fetch))
+    assert index.covers(day)
+    assert index.check_slot(slot) == BUSY
@@ -0,0 +1,52 @@
+import threading
+
+from app.background_writer import BackgroundWriter
+
+
+class ListWriter(BackgroundWriter):
+    def __init__(self, queue_size: int):
+        super().__init__(queue_size)
+        self.handled = []
+        self.finished = False
+
+    def _handle(self, item):
+        if item == "broken":
+            raise ValueError(item)
+        self.handled.append(item)
+
+    def _finish(self):
+        self.finished = True
+
+
+def test_data_items_are_refused_once_the_queue_is_full():
+    writer = ListWriter(queue_size=2)
+    assert writer.put("a") and writer.put("b")
+    assert not writer.put("c")
+    assert writer.put("d", control=True)
+    assert writer.pending() == 3
+
+
+def test_errors_are_counted_and_handling_goes_on():
+    writer = ListWriter(queue_size=10)
+    writer.start()
+    for item in ("a", "broken", "b"):
+        writer.put(item)
+    assert writer.close()
+    assert writer.handled == ["a", "b"]
+    assert writer.write_errors == 1
+    assert writer.finished
+
+
+def test_close_reports_a_thread_that_is_still_busy():
+    release = threading.Event()
+
+    class SlowWriter(ListWriter):
+        def _handle(self, item):
+            release.wait()
+            super()._handle(item)
+
+    writer = SlowWriter(queue_size=10)
+    writer.start()
+    writer.put("a")
+    assert not writer.close(timeout=0.05)
+    release.set()
@@ -0,0 +1,64 @@
+import asyncio
+
+from app.tools.bookings_cache import BookingsCache
+
+DAY = "2024-08-13"
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = BookingsCache(ttl=60.0, max_days=4)
+    fetches = []
+
+    async def fetch(day: str) -> list[dict]:
+        fetches.append(day)
+        await asyncio.sleep(0.01)
+        return [{"uid": "b1"}]
+
+    async def run():
+        results = await asyncio.gather(*(cache.get(DAY, fetch) for _ in range(3)))
+        return results, await cache.get(DAY, fetch)
+
+    results, cached = asyncio.run(run())
+    assert fetches == [DAY]
+    assert results == [[{"uid": "b1"}]] * 3
+    assert cached == [{"uid": "b1"}]
+    assert cache.hits == 1
+
+
+def test_fetch_overtaken_by_a_write_is_not_stored():
+    cache = BookingsCache(ttl=60.0, max_days=4)
+
+    async def fetch(day: str) -> list[dict]:
+        # Booked through the tool while the listing is on its way
+        cache.add_booking(day, {"uid": "b2"})
+        return [{"uid": "b1"}]
+
+    async def run():
+        await cache.get(DAY, fetch)
+        return await cache.get(DAY, lambda day: asyncio.sleep(0, [{"uid": "b1"}, {"uid": "b2"}]))
+
+    assert asyncio.run(run()) == [{"uid": "b1"}, {"uid": "b2"}]
+    assert cache.misses == 2
+
+
+def test_writes_to_days_not_being_fetched_leave_no_state():
+    cache = BookingsCache(ttl=60.0, max_days=4)
+    for index in range(100):
+        cache.add_booking(f"2024-08-{index % 28 + 1:02d}", {"uid": f"b{index}"})
+        cache.remove_booking(f"b{index}")
+        cache.invalidate(f"2024-09-{index % 28 + 1:02d}")
+    assert not cache._writes_during_fetch
+
+
+def test_least_recently_used_day_is_evicted():
+    cache = BookingsCache(ttl=60.0, max_days=2)
+
+    async def fetch(day: str) -> list[dict]:
+        return [{"uid": day}]
+
+    async def run():
+        for day in ("2024-08-13", "2024-08-14", "2024-08-13", "2024-08-15"):
+            await cache.get(day, fetch)
+
+    asyncio.run(run())
+    assert list(cache._days) == ["2024-08-13", "2024-08-15"]
@@ -0,0 +1,31 @@
+import asyncio
+
+from app.config import CAL_BOOKINGS_PAGE_SIZE, CAL_EVENT_TYPE_ID
+from app.tools.cal_tool import CalTool
+from app.tools.clients import close_clients
+from test_client.fake_cal_server import create_app
+from test_client.servers import serve_in_background
+
+
+def test_fetch_bookings_follows_pagination(cal_stub_port):
+    stub = create_app()
+    count = CAL_BOOKINGS_PAGE_SIZE * 2 + 1
+    for index in range(count):
+        stub.state.bookings[f"uid-{index}"] = {
+            "uid": f"uid-{index}",
+            "start": f"2024-12-09T{8 + index % 9:02d}:{index % 60:02d}:00Z",
+            "eventTypeId": CAL_EVENT_TYPE_ID,
+            "status": "accepted",
+            "attendees": [{"name": f"Patient {index}"}],
+        }
+
+    async def run():
+        async with serve_in_background(stub, cal_stub_port):
+            bookings = await CalTool().fetch_bookings(
+                "2024-12-09T00:00:00Z", "2024-12-09T23:59:59Z"
+            )
+            await close_clients()
+        return bookings
+
+    bookings = asyncio.run(run())
+    assert sorted(booking["uid"] for booking in bookings) == sorted(stub.state.bookings)
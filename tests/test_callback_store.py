@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from app.tools.callback_store import CallbackStore
+
+
+def record(call_id: str) -> dict:
+    return {
+        "name": "Peter Müller",
+        "preferred_contact": "0170 1234567",
+        "description": "Frage zur Rechnung",
+        "call_id": call_id,
+    }
+
+
+def test_repeated_call_id_is_skipped_without_the_rest_of_its_batch(tmp_path):
+    store = CallbackStore(str(tmp_path / "callbacks.db"))
+    store.enqueue(**record("call_1"))
+    store.close()
+
+    store = CallbackStore(str(tmp_path / "callbacks.db"))
+    for call_id in ("call_2", "call_1", "call_3"):
+        store.enqueue(**record(call_id))
+    store.close()
+
+    assert (store.written, store.skipped, store.failed) == (2, 1, 0)
+    rows = store.query()
+    assert sorted(row["call_id"] for row in rows) == ["call_1", "call_2", "call_3"]
+
+
+@pytest.mark.parametrize("field", ["name", "preferred_contact", "description"])
+def test_empty_fields_are_refused_before_queueing(tmp_path, field):
+    store = CallbackStore(str(tmp_path / "callbacks.db"))
+    with pytest.raises(ValueError):
+        store.enqueue(**{**record("call_1"), field: " "})
+    assert store.pending() == 0
+
+
+def test_close_writes_what_a_stuck_writer_did_not_reach(tmp_path):
+    release = threading.Event()
+
+    class StuckStore(CallbackStore):
+        def _handle_batch(self, batch: list):
+            release.wait()
+            super()._handle_batch(batch)
+
+    store = StuckStore(str(tmp_path / "callbacks.db"))
+    store.enqueue(**record("call_1"))
+    time.sleep(0.05)
+    store.enqueue(**record("call_2"))
+    store.enqueue(**record("call_3"))
+
+    assert not store.close(timeout=0.05)
+    assert store.written == 2
+    release.set()
+    deadline = time.monotonic() + 5
+    while store.written < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(row["call_id"] for row in store.query()) == ["call_1", "call_2", "call_3"]
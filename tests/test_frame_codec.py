@@ -0,0 +1,73 @@
+import json
+
+from app.api.media_stream.frame_codec import (
+    ClientMediaEncoder,
+    decode_client_frame,
+    decode_upstream_event,
+    encode_audio_append,
+)
+
+
+def test_media_frame_is_decoded_without_parsing():
+    message = json.dumps(
+        {"event": "media", "streamSid": "MZ1", "media": {"timestamp": 5, "payload": "AAAA"}},
+        separators=(",", ":"),
+    )
+    assert decode_client_frame(message) == ("media", "AAAA", 5, None)
+
+
+def test_twilio_media_frame_with_string_timestamp():
+    # Twilio sends the timestamp as a string, with spaces after the colons
+    message = json.dumps(
+        {
+            "event": "media",
+            "sequenceNumber": "4",
+            "media": {"track": "inbound", "chunk": "2", "timestamp": "5", "payload": "AAAA"},
+            "streamSid": "MZ1",
+        }
+    )
+    assert decode_client_frame(message) == ("media", "AAAA", 5, None)
+
+
+def test_other_events_are_parsed():
+    message = json.dumps({"event": "start", "start": {"streamSid": "MZ1"}})
+    event, payload, timestamp, data = decode_client_frame(message)
+    assert (event, payload, timestamp) == ("start", None, None)
+    assert data["start"]["streamSid"] == "MZ1"
+
+
+def test_payload_key_outside_a_media_event_is_parsed():
+    message = json.dumps({"event": "mark", "mark": {"name": "x"}, "payload": "AAAA"})
+    event, payload, _, data = decode_client_frame(message)
+    assert (event, payload) == ("mark", None)
+    assert data["payload"] == "AAAA"
+
+
+def test_audio_delta_in_both_spacings():
+    for separators in ((",", ":"), (", ", ": ")):
+        message = json.dumps(
+            {"type": "response.audio.delta", "response_id": "r", "delta": "AAAA"},
+            separators=separators,
+        )
+        assert decode_upstream_event(message) == ("response.audio.delta", "AAAA", None)
+
+
+def test_other_upstream_events_are_parsed():
+    message = json.dumps({"type": "response.done", "response": {"id": "r"}})
+    event_type, delta, event = decode_upstream_event(message)
+    assert (event_type, delta) == ("response.done", None)
+    assert event["response"]["id"] == "r"
+
+
+def test_encoders_build_valid_json():
+    assert json.loads(encode_audio_append("AAAA")) == {
+        "type": "input_audio_buffer.append",
+        "audio": "AAAA",
+    }
+    encoder = ClientMediaEncoder('MZ"1')
+    assert json.loads(encoder.encode("AAAA")) == {
+        "event": "media",
+        "streamSid": 'MZ"1',
+        "media": {"payload": "AAAA"},
+    }
+    assert json.loads(encoder.encode_clear()) == {"event": "clear", "streamSid": 'MZ"1'}
@@ -0,0 +1,62 @@
+import os
+import time
+
+from app.api.media_stream.greeting_cache import LEASE_SECONDS, GreetingCache
+
+
+def age(path: str, seconds: float):
+    os.utime(path, (time.time() - seconds,) * 2)
+
+
+def test_one_worker_holds_the_lease(tmp_path):
+    first, second = GreetingCache(str(tmp_path)), GreetingCache(str(tmp_path))
+    assert first._claim("key")
+    assert not second._claim("key")
+    second._release("key")
+    assert os.path.exists(tmp_path / "key.lock")
+    first._release("key")
+    assert second._claim("key")
+
+
+def test_a_stale_lease_is_taken_over_once(tmp_path):
+    dead, first, second = (GreetingCache(str(tmp_path)) for _ in range(3))
+    assert dead._claim("key")
+    age(tmp_path / "key.lock", LEASE_SECONDS + 1)
+    assert first._claim("key")
+    assert not second._claim("key")
+    # The dead worker's release does not end the new lease
+    dead._release("key")
+    assert (tmp_path / "key.lock").read_text() == first.owner
+    assert sorted(os.listdir(tmp_path)) == ["key.lock"]
+
+
+def test_a_live_lease_renamed_in_a_race_is_put_back(tmp_path, monkeypatch):
+    owner, late = GreetingCache(str(tmp_path)), GreetingCache(str(tmp_path))
+    assert owner._claim("key")
+    path = str(tmp_path / "key.lock")
+    # The late worker saw the stale lease before the owner took it over
+    getmtime = os.path.getmtime
+    monkeypatch.setattr(os.path, "getmtime", lambda p: 0.0 if p == path else getmtime(p))
+    assert not late._remove_stale(path)
+    monkeypatch.undo()
+    assert (tmp_path / "key.lock").read_text() == owner.owner
+    assert sorted(os.listdir(tmp_path)) == ["key.lock"]
+
+
+def test_store_removes_only_old_entries_of_other_keys(tmp_path):
+    cache = GreetingCache(str(tmp_path))
+    for name in ("old.pcm", "old.json", "old.lock", "notes.txt", "old.pcm.tmp"):
+        (tmp_path / name).write_bytes(b"")
+        age(tmp_path / name, LEASE_SECONDS + 1)
+    for name in ("recent.pcm", "recent.json", "recent.lock"):
+        (tmp_path / name).write_bytes(b"")
+    cache._store("key", "Hallo", b"\x00\x00")
+    assert sorted(os.listdir(tmp_path)) == [
+        "key.json",
+        "key.pcm",
+        "notes.txt",
+        "old.pcm.tmp",
+        "recent.json",
+        "recent.lock",
+        "recent.pcm",
+    ]
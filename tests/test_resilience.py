@@ -0,0 +1,183 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.tools.resilience import (
+    IDEMPOTENCY_HEADER,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientRequests,
+    idempotency_key,
+)
+
+
+class Upstream:
+    """Answers from a list of status codes, the last one repeats."""
+
+    def __init__(self, statuses: list[int], delay: float = 0.0):
+        self.statuses = statuses
+        self.delay = delay
+        self.requests: list[httpx.Request] = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        await asyncio.sleep(self.delay)
+        status = self.statuses[min(len(self.requests), len(self.statuses)) - 1]
+        if status == 0:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(status, json={"attempt": len(self.requests)})
+
+
+async def send(upstream: Upstream, calls, breaker: CircuitBreaker = None, budget: float = 1.0):
+    async with httpx.AsyncClient(
+        transport=httpx.MockTransport(upstream), base_url="http://cal.test"
+    ) as client:
+        requests = ResilientRequests(
+            "test",
+            lambda: client,
+            breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30.0),
+            budget=budget,
+            base_delay=0.001,
+            max_delay=0.01,
+        )
+        return await calls(requests)
+
+
+def test_idempotency_key_is_stable():
+    key = idempotency_key("create_booking", "call_1", {"a": 1, "b": 2})
+    assert key == idempotency_key("create_booking", "call_1", {"b": 2, "a": 1})
+    assert key != idempotency_key("create_booking", "call_2", {"a": 1, "b": 2})
+    assert key != idempotency_key("cancel_booking", "call_1", {"a": 1, "b": 2})
+
+
+def test_transient_errors_are_retried():
+    upstream = Upstream([0, 503, 429, 200])
+    response = asyncio.run(send(upstream, lambda requests: requests.request("GET", "/v2/bookings")))
+    assert response.status_code == 200
+    assert len(upstream.requests) == 4
+
+
+def test_client_errors_are_returned_without_retry():
+    upstream = Upstream([404])
+    response = asyncio.run(send(upstream, lambda requests: requests.request("GET", "/v2/bookings")))
+    assert response.status_code == 404
+    assert len(upstream.requests) == 1
+
+
+def test_last_error_is_raised_once_the_budget_is_spent():
+    upstream = Upstream([503])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(
+            send(
+                upstream,
+                lambda requests: requests.request("GET", "/v2/bookings"),
+                CircuitBreaker(failure_threshold=1000, reset_timeout=30.0),
+                budget=0.05,
+            )
+        )
+    assert len(upstream.requests) > 1
+
+
+def test_identical_requests_in_flight_share_one():
+    upstream = Upstream([200], delay=0.05)
+
+    async def calls(requests):
+        return await asyncio.gather(
+            *(requests.request("GET", "/v2/bookings", params={"take": 100}) for _ in range(3))
+        )
+
+    responses = asyncio.run(send(upstream, calls))
+    assert len(upstream.requests) == 1
+    assert all(response is responses[0] for response in responses)
+
+
+def test_completed_write_is_answered_from_memory():
+    upstream = Upstream([201])
+    key = idempotency_key("create_booking", "call_1", {"start": "2024-08-13T09:00:00Z"})
+
+    async def calls(requests):
+        first = await requests.request("POST", "/v2/bookings", json={}, idempotency_key=key)
+        again = await requests.request("POST", "/v2/bookings", json={}, idempotency_key=key)
+        return first, again
+
+    first, again = asyncio.run(send(upstream, calls))
+    assert again is first
+    assert len(upstream.requests) == 1
+    assert upstream.requests[0].headers[IDEMPOTENCY_HEADER] == key
+
+
+def test_breaker_opens_and_rejects_right_away():
+    upstream = Upstream([503])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0)
+
+    async def calls(requests):
+        with pytest.raises(CircuitOpenError):
+            await requests.request("GET", "/v2/bookings")
+        sent = len(upstream.requests)
+        with pytest.raises(CircuitOpenError):
+            await requests.request("GET", "/v2/bookings", params={"take": 1})
+        return sent
+
+    sent = asyncio.run(send(upstream, calls, breaker))
+    assert sent == 2
+    assert len(upstream.requests) == 2
+    assert breaker.state == "open"
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_error_without_outcome_during_the_probe_frees_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+
+    upstream = Upstream([200])
+
+    async def broken_then_ok(request: httpx.Request) -> httpx.Response:
+        if not upstream.requests:
+            upstream.requests.append(request)
+            raise httpx.DecodingError("broken body", request=request)
+        return await upstream(request)
+
+    async def calls(requests):
+        with pytest.raises(httpx.DecodingError):
+            await requests.request("GET", "/v2/bookings")
+        return await requests.request("GET", "/v2/bookings", params={"take": 1})
+
+    response = asyncio.run(send(broken_then_ok, calls, breaker))
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+
+
+def test_write_that_may_have_been_applied_is_not_sent_again():
+    for status in (0, 503):
+        upstream = Upstream([status, 201])
+        response = asyncio.run(
+            send(
+                upstream,
+                lambda requests: requests.request("POST", "/v2/bookings", json={}, repeatable=False),
+            )
+        )
+        assert response.status_code == 201
+        assert len(upstream.requests) == 2
+
+    upstream = Upstream([502, 201])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(
+            send(
+                upstream,
+                lambda requests: requests.request("POST", "/v2/bookings", json={}, repeatable=False),
+            )
+        )
+    assert len(upstream.requests) == 1
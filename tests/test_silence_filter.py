@@ -0,0 +1,60 @@
+import base64
+
+import numpy as np
+
+from app.api.media_stream.silence_filter import SilenceSuppressor
+
+SAMPLE_RATE = 24000
+FRAME_SAMPLES = 480  # 20 ms
+
+
+def frame(amplitude: float) -> str:
+    t = np.arange(FRAME_SAMPLES) / SAMPLE_RATE
+    samples = (amplitude * np.sin(2 * np.pi * 200 * t)).astype("<i2")
+    return base64.b64encode(samples.tobytes()).decode("utf-8")
+
+
+SPEECH = frame(8000)
+SILENCE = frame(0)
+
+
+def samples_in(payload: str) -> int:
+    return len(base64.b64decode(payload)) // 2
+
+
+def suppressor(**kwargs) -> SilenceSuppressor:
+    settings = dict(hangover_ms=100, pre_roll_ms=60, keepalive_ms=60_000)
+    return SilenceSuppressor(sample_rate=SAMPLE_RATE, **{**settings, **kwargs})
+
+
+def test_speech_and_hangover_are_forwarded_then_silence_is_held():
+    filter = suppressor()
+    assert filter.filter(SPEECH) == SPEECH
+    hangover = [filter.filter(SILENCE) for _ in range(5)]
+    assert hangover == [SILENCE] * 5
+    assert all(filter.filter(SILENCE) is None for _ in range(20))
+    assert filter.frames_suppressed == 20 - 3
+
+
+def test_pre_roll_is_sent_with_the_onset():
+    filter = suppressor()
+    for _ in range(30):
+        filter.filter(SILENCE)
+    onset = filter.filter(SPEECH)
+    assert samples_in(onset) == 4 * FRAME_SAMPLES
+
+
+def test_without_pre_roll_silence_is_suppressed_right_away():
+    filter = suppressor(pre_roll_ms=0)
+    for _ in range(30):
+        assert filter.filter(SILENCE) is None
+    assert filter.frames_suppressed == 30
+    assert filter.filter(SPEECH) == SPEECH
+
+
+def test_keepalive_sends_held_audio_in_order():
+    filter = suppressor(keepalive_ms=100)
+    sent = [filter.filter(SILENCE) for _ in range(50)]
+    assert filter.frames_keepalive == 50 // 5
+    assert all(payload == SILENCE for payload in sent if payload is not None)
+    assert sum(payload is not None for payload in sent) == filter.frames_keepalive
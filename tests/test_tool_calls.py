@@ -0,0 +1,53 @@
+import asyncio
+import json
+import time
+
+from app.api.media_stream.services import handle_function_calls, send_to_client
+from app.api.media_stream.session import MediaStreamSession
+from app.tools.clients import close_clients, get_cal_client
+from test_client.fake_cal_server import create_app
+from test_client.fakes import FakeClientWebSocket, FakeUpstream, audio_delta_events
+from test_client.servers import serve_in_background
+
+STUB_DELAY = 0.5
+FRAME_INTERVAL = 0.02
+MAX_ALLOWED_GAP = 0.1
+
+
+def test_tool_call_does_not_block_other_sessions(cal_stub_port):
+    async def run():
+        async with serve_in_background(create_app(delay=STUB_DELAY), cal_stub_port):
+            get_cal_client()
+            client_b = FakeClientWebSocket()
+            upstream_b = FakeUpstream(
+                audio_delta_events(int(STUB_DELAY * 2 / FRAME_INTERVAL)), FRAME_INTERVAL
+            )
+            upstream_a = FakeUpstream()
+            booking_call = {
+                "id": "item_1",
+                "call_id": "call_1",
+                "type": "function_call",
+                "status": "completed",
+                "name": "create_booking",
+                "arguments": json.dumps(
+                    {"start": "2024-12-09T10:00:00Z", "attendee_name": "Peter Müller"}
+                ),
+            }
+            session_b = MediaStreamSession(client_b, upstream_b)
+            session_b.set_stream_sid("stream_b")
+            pump_b = asyncio.create_task(send_to_client(session_b))
+            await asyncio.sleep(FRAME_INTERVAL * 5)
+            started = time.perf_counter()
+            await handle_function_calls(upstream_a, [booking_call])
+            finished = time.perf_counter()
+            await pump_b
+            await session_b.media_buffer.close()
+            await close_clients()
+        return client_b.sent_at, upstream_a.sent, finished - started
+
+    sent_at, tool_output, duration = asyncio.run(run())
+    gaps = [b - a for a, b in zip(sent_at, sent_at[1:])]
+    assert duration >= STUB_DELAY
+    assert tool_output, "tool call produced no function_call_output"
+    assert max(gaps) < MAX_ALLOWED_GAP, "audio forwarding stalled during tool call"
+